@@ -0,0 +1,142 @@
+"""Vectorized reporting over the columnar snapshots written by snapshot.py.
+
+Nothing here touches Mongo: partitions are selected by their ``date=``
+directory name, Arrow IPC files are memory-mapped, and every aggregate is a
+pandas/numpy operation over whole columns.
+"""
+from datetime import date
+from pathlib import Path
+from typing import List, Optional
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from snapshot import FORMATS, RATING_SCHEMA, RIDE_SCHEMA, conform, read_table
+
+RATING_VALUES = np.arange(1, 6)
+
+
+def partition_paths(root, dataset: str, start: Optional[date] = None, end: Optional[date] = None) -> List[Path]:
+    """Partition files of dataset with start <= date <= end, in date order"""
+    paths = []
+    for directory in sorted((Path(root) / dataset).glob("date=*")):
+        partition_date = date.fromisoformat(directory.name[len("date="):])
+        if (start and partition_date < start) or (end and partition_date > end):
+            continue
+        # A snapshot root holds a single format, the first file present wins
+        path = next((directory / name for name in FORMATS.values() if (directory / name).exists()), None)
+        if path is not None:
+            paths.append(path)
+    return paths
+
+
+def load(root, dataset: str, schema: pa.Schema, start: Optional[date] = None, end: Optional[date] = None,
+         columns: Optional[List[str]] = None) -> pd.DataFrame:
+    tables = [conform(read_table(path), schema) for path in partition_paths(root, dataset, start, end)]
+    table = pa.concat_tables(tables) if tables else schema.empty_table()
+    if columns:
+        table = table.select(columns)
+    return table.to_pandas()
+
+
+def load_rides(root, start: Optional[date] = None, end: Optional[date] = None, columns=None) -> pd.DataFrame:
+    return load(root, "rides", RIDE_SCHEMA, start, end, columns)
+
+
+def load_ratings(root, start: Optional[date] = None, end: Optional[date] = None, columns=None) -> pd.DataFrame:
+    return load(root, "ratings", RATING_SCHEMA, start, end, columns)
+
+
+def _summary(values: np.ndarray) -> dict:
+    if not len(values):
+        return {"count": 0, "total": 0.0, "mean": 0.0, "p50": 0.0, "p90": 0.0, "max": 0.0}
+    p50, p90 = np.percentile(values, [50, 90])
+    return {
+        "count": int(len(values)),
+        "total": round(float(values.sum()), 2),
+        "mean": round(float(values.mean()), 2),
+        "p50": round(float(p50), 2),
+        "p90": round(float(p90), 2),
+        "max": round(float(values.max()), 2),
+    }
+
+
+def fare_summary(rides: pd.DataFrame) -> dict:
+    """Fares of completed rides, with the share charged at a surge multiplier"""
+    completed = rides[rides["status"] == "completed"]
+    summary = _summary(completed["fare"].to_numpy(dtype=float))
+    surged = completed["surgeMultiplier"].fillna(1.0).to_numpy() > 1.0
+    summary["surgedShare"] = round(float(surged.mean()), 3) if len(surged) else 0.0
+    return summary
+
+
+def distance_summary(rides: pd.DataFrame) -> dict:
+    """Trip distances in km of completed rides"""
+    completed = rides[rides["status"] == "completed"]
+    return _summary(completed["distance"].to_numpy(dtype=float))
+
+
+def completion_rates(rides: pd.DataFrame) -> List[dict]:
+    """Per createdAt day: requested, completed and cancelled counts and the completion rate"""
+    if rides.empty:
+        return []
+    frame = pd.DataFrame({
+        "date": rides["createdAt"].dt.strftime("%Y-%m-%d"),
+        "completed": rides["status"] == "completed",
+        "cancelled": rides["status"] == "cancelled",
+    })
+    daily = frame.groupby("date").agg(
+        requested=("completed", "size"),
+        completed=("completed", "sum"),
+        cancelled=("cancelled", "sum"),
+    )
+    daily["completionRate"] = (daily["completed"] / daily["requested"]).round(3)
+    return [
+        {
+            "date": day,
+            "requested": int(row.requested),
+            "completed": int(row.completed),
+            "cancelled": int(row.cancelled),
+            "completionRate": float(row.completionRate),
+        }
+        for day, row in daily.iterrows()
+    ]
+
+
+def driver_rating_distribution(ratings: pd.DataFrame, min_ratings: int = 1) -> dict:
+    """Histogram of ratings drivers received and of per-driver averages, plus the lowest rated drivers"""
+    # Riders are rated too, keep only ratings whose rated party drove the ride
+    ratings = ratings[ratings["ratedId"] == ratings["driverId"]]
+    values = ratings["rating"].to_numpy(dtype=np.int64)
+    counts = np.bincount(values, minlength=6)[1:6] if len(values) else np.zeros(5, dtype=np.int64)
+
+    per_driver = ratings.groupby("ratedId")["rating"].agg(["mean", "count"])
+    per_driver = per_driver[per_driver["count"] >= min_ratings]
+    # Averages bucketed to the star they round down to, 5.0 lands in the last bucket
+    buckets = np.clip(np.floor(per_driver["mean"].to_numpy()), 1, 5).astype(np.int64)
+    driver_counts = np.bincount(buckets, minlength=6)[1:6]
+    lowest = per_driver.sort_values(["mean", "count"], ascending=[True, False]).head(10)
+
+    return {
+        "ratings": int(len(values)),
+        "mean": round(float(values.mean()), 2) if len(values) else 0.0,
+        "histogram": {str(star): int(count) for star, count in zip(RATING_VALUES, counts)},
+        "drivers": int(len(per_driver)),
+        "driverAverageHistogram": {str(star): int(count) for star, count in zip(RATING_VALUES, driver_counts)},
+        "lowestRated": [
+            {"driverId": driver_id, "rating": round(float(row["mean"]), 2), "ratingCount": int(row["count"])}
+            for driver_id, row in lowest.iterrows()
+        ],
+    }
+
+
+def report(root, start: Optional[date] = None, end: Optional[date] = None, min_ratings: int = 1) -> dict:
+    rides = load_rides(root, start, end, ["status", "fare", "surgeMultiplier", "distance", "createdAt"])
+    ratings = load_ratings(root, start, end, ["ratedId", "driverId", "rating"])
+    return {
+        "fares": fare_summary(rides),
+        "distances": distance_summary(rides),
+        "completion": completion_rates(rides),
+        "driverRatings": driver_rating_distribution(ratings, min_ratings),
+    }
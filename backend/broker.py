@@ -0,0 +1,218 @@
+"""Cross-worker fan-out for the state each worker keeps in memory."""
+import asyncio
+import logging
+import uuid
+from abc import ABC, abstractmethod
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+from pymongo import CursorType
+from pymongo.errors import CollectionInvalid
+
+logger = logging.getLogger(__name__)
+
+
+class Broker(ABC):
+    """Delivers messages published by one worker to every other worker.
+
+    ``publish`` only appends to an outbox. A background task flushes it every
+    ``flush_interval_ms`` as a single batch, so chatty producers such as
+    driver location updates cost one backend write per interval. Handlers
+    only see messages from other workers, the publishing worker has already
+    applied its own change.
+    """
+
+    name = "base"
+
+    def __init__(self, flush_interval_ms: int = 50, max_outbox: int = 100000):
+        self.worker_id = uuid.uuid4().hex
+        self.flush_interval = flush_interval_ms / 1000
+        self.max_outbox = max_outbox
+        self._handlers: Dict[str, Callable[[object], None]] = {}
+        self._outbox: List[dict] = []
+        self._tasks: List[asyncio.Task] = []
+        self.stats = {"published": 0, "dropped": 0, "batchesSent": 0, "received": 0, "errors": 0}
+
+    def on(self, kind: str, handler: Callable[[object], None]) -> None:
+        self._handlers[kind] = handler
+
+    def publish(self, kind: str, payload) -> None:
+        if len(self._outbox) >= self.max_outbox:
+            # The backend is not keeping up, other workers resync from Mongo on restart
+            self.stats["dropped"] += 1
+            return
+        self._outbox.append({"kind": kind, "payload": payload})
+        self.stats["published"] += 1
+
+    def dispatch(self, batch: dict) -> None:
+        """Run the handlers for a batch received from the backend"""
+        if batch.get("origin") == self.worker_id:
+            return
+        for message in batch.get("messages", ()):
+            handler = self._handlers.get(message["kind"])
+            if handler is None:
+                continue
+            self.stats["received"] += 1
+            try:
+                handler(message["payload"])
+            except Exception:
+                self.stats["errors"] += 1
+                logger.exception("Broker handler for %s failed", message["kind"])
+
+    async def flush(self) -> int:
+        if not self._outbox:
+            return 0
+        messages, self._outbox = self._outbox, []
+        try:
+            await self.send({"origin": self.worker_id, "messages": messages, "createdAt": datetime.utcnow()})
+        except Exception:
+            self.stats["errors"] += 1
+            logger.exception("Failed to send %d broker messages", len(messages))
+            return 0
+        self.stats["batchesSent"] += 1
+        return len(messages)
+
+    @abstractmethod
+    async def send(self, batch: dict) -> None:
+        """Write one batch to the backend"""
+
+    @abstractmethod
+    async def receive(self) -> None:
+        """Feed every batch from the backend to ``dispatch`` until cancelled"""
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    async def _receive_loop(self):
+        while True:
+            try:
+                await self.receive()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                self.stats["errors"] += 1
+                logger.exception("Broker subscription failed, reconnecting")
+                await asyncio.sleep(1)
+
+    async def start(self) -> None:
+        if not self._tasks:
+            self._tasks = [
+                asyncio.create_task(self._receive_loop()),
+                asyncio.create_task(self._flush_loop()),
+            ]
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self._tasks = []
+        await self.flush()
+
+
+class LocalBroker(Broker):
+    """Single worker: there is nobody to tell"""
+
+    name = "local"
+
+    def publish(self, kind: str, payload) -> None:
+        pass
+
+    async def send(self, batch: dict) -> None:
+        pass
+
+    async def receive(self) -> None:
+        pass
+
+    async def start(self) -> None:
+        pass
+
+    async def stop(self) -> None:
+        pass
+
+
+class MongoBroker(Broker):
+    """Batches go through a capped collection tailed by every worker.
+
+    Tailable cursors work on a standalone mongod, no replica set needed.
+    Old batches age out once the collection reaches ``size_bytes``.
+    """
+
+    name = "mongo"
+
+    def __init__(self, db, collection_name: str = "broker_messages", size_bytes: int = 64 * 1024 * 1024, **kwargs):
+        super().__init__(**kwargs)
+        self.db = db
+        self.collection_name = collection_name
+        self.size_bytes = size_bytes
+
+    async def start(self) -> None:
+        try:
+            await self.db.create_collection(self.collection_name, capped=True, size=self.size_bytes)
+        except CollectionInvalid:
+            pass
+        await super().start()
+
+    async def send(self, batch: dict) -> None:
+        await self.db[self.collection_name].insert_one(batch)
+
+    async def receive(self) -> None:
+        collection = self.db[self.collection_name]
+        # Only batches written after we started, earlier state came from Mongo itself
+        last = await collection.find_one({}, {"_id": True}, sort=[("$natural", -1)])
+        query = {"_id": {"$gt": last["_id"]}} if last else {}
+        while True:
+            cursor = collection.find(query, cursor_type=CursorType.TAILABLE_AWAIT)
+            while cursor.alive:
+                async for batch in cursor:
+                    query = {"_id": {"$gt": batch["_id"]}}
+                    self.dispatch(batch)
+            # A tailable cursor on an empty collection dies immediately
+            await asyncio.sleep(self.flush_interval)
+
+
+class RedisBroker(Broker):
+    """Batches go through a Redis (or Redis-compatible) pub/sub channel"""
+
+    name = "redis"
+
+    def __init__(self, url: str, channel: str = "airide:broker", **kwargs):
+        super().__init__(**kwargs)
+        try:
+            import redis.asyncio as redis
+        except ImportError as e:
+            raise RuntimeError("STATE_BACKEND=redis needs the redis package") from e
+        from bson import json_util
+
+        self._json = json_util
+        self._redis = redis.from_url(url)
+        self.channel = channel
+
+    async def send(self, batch: dict) -> None:
+        await self._redis.publish(self.channel, self._json.dumps(batch))
+
+    async def receive(self) -> None:
+        pubsub = self._redis.pubsub()
+        await pubsub.subscribe(self.channel)
+        try:
+            async for message in pubsub.listen():
+                if message["type"] == "message":
+                    self.dispatch(self._json.loads(message["data"]))
+        finally:
+            await pubsub.close()
+
+    async def stop(self) -> None:
+        await super().stop()
+        await self._redis.close()
+
+
+def build_broker(backend: str, db=None, redis_url: Optional[str] = None, **kwargs) -> Broker:
+    if backend == "mongo":
+        return MongoBroker(db, **kwargs)
+    if backend == "redis":
+        return RedisBroker(redis_url or "redis://localhost:6379/0", **kwargs)
+    return LocalBroker(**kwargs)
@@ -0,0 +1,110 @@
+"""Async read-through cache with LRU eviction, TTL and single-flight loads."""
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+
+class AsyncTTLCache:
+    """Caches loader results for ``ttl_seconds``, keeping at most ``maxsize`` entries.
+
+    Concurrent misses for the same key share one loader call, which keeps
+    running if the caller that started it is cancelled. ``None`` results
+    are cached too, so lookups for unknown phones do not hit the database on
+    every request; writers must call ``invalidate`` for every key they change.
+    """
+
+    def __init__(self, maxsize: int = 10000, ttl_seconds: float = 30.0, clock: Callable[[], float] = time.monotonic):
+        self.maxsize = maxsize
+        self.ttl_seconds = ttl_seconds
+        self.clock = clock
+        self._entries: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+        # Called with invalidated keys so other workers can drop their copies
+        self.forward: Optional[Callable[[Tuple[Hashable, ...]], None]] = None
+        self.stats = {
+            "hits": 0,
+            "misses": 0,
+            "coalesced": 0,
+            "evictions": 0,
+            "expirations": 0,
+            "invalidations": 0,
+        }
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _lookup(self, key: Hashable):
+        entry = self._entries.get(key)
+        if entry is None:
+            return False, None
+        expires_at, value = entry
+        if expires_at <= self.clock():
+            del self._entries[key]
+            self.stats["expirations"] += 1
+            return False, None
+        self._entries.move_to_end(key)
+        return True, value
+
+    def peek(self, key: Hashable) -> Tuple[bool, Any]:
+        """Return ``(found, value)`` without loading, counted as a hit or miss"""
+        found, value = self._lookup(key)
+        self.stats["hits" if found else "misses"] += 1
+        return found, value
+
+    def set(self, key: Hashable, value: Any) -> None:
+        self._entries[key] = (self.clock() + self.ttl_seconds, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+            self.stats["evictions"] += 1
+
+    def invalidate(self, *keys: Hashable) -> None:
+        if self.forward is not None:
+            self.forward(keys)
+        self.discard(*keys)
+
+    def discard(self, *keys: Hashable) -> None:
+        """Invalidate on this worker only"""
+        for key in keys:
+            self._entries.pop(key, None)
+            # A load that started before the write must not store its stale result
+            self._inflight.pop(key, None)
+            self.stats["invalidations"] += 1
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._inflight.clear()
+
+    async def _load(self, key: Hashable, loader: Callable[[], Awaitable[Any]]) -> Any:
+        task = asyncio.current_task()
+        try:
+            value = await loader()
+        except BaseException:
+            if self._inflight.get(key) is task:
+                del self._inflight[key]
+            raise
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+            self.set(key, value)
+        return value
+
+    async def get_or_load(self, key: Hashable, loader: Callable[[], Awaitable[Any]]) -> Any:
+        found, value = self._lookup(key)
+        if found:
+            self.stats["hits"] += 1
+            return value
+
+        pending = self._inflight.get(key)
+        if pending is not None:
+            self.stats["coalesced"] += 1
+            return await asyncio.shield(pending)
+
+        self.stats["misses"] += 1
+        # The load runs as its own task, so cancelling the caller that started it
+        # leaves it running for everyone else waiting on the key
+        task = asyncio.ensure_future(self._load(key, loader))
+        # Nobody may be left waiting, don't let the loop warn about a failure
+        task.add_done_callback(lambda done: done.cancelled() or done.exception())
+        self._inflight[key] = task
+        return await asyncio.shield(task)
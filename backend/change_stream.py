@@ -0,0 +1,225 @@
+"""Resumable change-stream consumer for rides, drivers and ratings."""
+import asyncio
+import inspect
+import logging
+import time
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Type
+
+from pymongo.errors import OperationFailure, PyMongoError
+
+logger = logging.getLogger(__name__)
+
+# Resume token no longer in the oplog
+CHANGE_STREAM_HISTORY_LOST = 286
+
+
+class ChangeEvent:
+    __slots__ = ("operation", "document_id", "document_key", "document", "updated_fields")
+
+    collection = ""
+
+    def __init__(self, operation: str, document_id, document: Optional[dict], updated_fields: dict, document_key=None):
+        self.operation = operation
+        self.document_id = document_id
+        self.document = document
+        self.updated_fields = updated_fields
+        # Mongo's _id, the only thing a delete carries when there is no pre-image
+        self.document_key = document_key
+
+
+class RideChange(ChangeEvent):
+    __slots__ = ()
+    collection = "rides"
+
+
+class DriverChange(ChangeEvent):
+    __slots__ = ()
+    collection = "drivers"
+
+
+class RatingChange(ChangeEvent):
+    __slots__ = ()
+    collection = "ratings"
+
+
+EVENT_TYPES: Dict[str, Type[ChangeEvent]] = {
+    event_type.collection: event_type for event_type in (RideChange, DriverChange, RatingChange)
+}
+
+
+def to_event(change: dict) -> Optional[ChangeEvent]:
+    event_type = EVENT_TYPES.get(change.get("ns", {}).get("coll"))
+    if event_type is None:
+        return None
+    document = change.get("fullDocument")
+    if document is None and change["operationType"] == "delete":
+        # Only there when the collection records pre-images (MongoDB 6.0+)
+        document = change.get("fullDocumentBeforeChange")
+    if document is not None:
+        document.pop("_id", None)
+    updated_fields = change.get("updateDescription", {}).get("updatedFields", {})
+    document_id = document.get("id") if document else None
+    document_key = change.get("documentKey", {}).get("_id")
+    return event_type(change["operationType"], document_id, document, updated_fields, document_key)
+
+
+class ChangeStreamConsumer:
+    """Watches the database and hands typed events to in-process handlers.
+
+    The resume token is saved to ``token_collection`` every
+    ``checkpoint_every`` events or ``checkpoint_interval_s`` seconds, so a
+    restarted worker continues where it stopped instead of missing writes.
+    Change streams need a replica set; a single-node one is enough. Deletes
+    carry the deleted document when ``full_document_before_change`` is set and
+    the collection has ``changeStreamPreAndPostImages`` enabled, otherwise only
+    ``document_key``. Handlers may be coroutines.
+
+    Delivery is at-least-once: an event is retried on the handlers that
+    raised, ``handler_attempts`` times with backoff, before it is logged,
+    counted as ``skipped`` and the token moves past it. Handlers should be
+    idempotent. When the stream ends or fails it is reopened with
+    exponential backoff; after an invalidate (the database was dropped) it
+    starts after the invalidate event, since it cannot be resumed.
+    """
+
+    def __init__(
+        self,
+        db,
+        name: str = "api",
+        token_collection: str = "change_stream_tokens",
+        checkpoint_every: int = 100,
+        checkpoint_interval_s: float = 1.0,
+        full_document_before_change: Optional[str] = None,
+        handler_attempts: int = 3,
+        retry_delay_s: float = 0.5,
+        restart_delay_s: float = 1.0,
+        max_restart_delay_s: float = 30.0,
+    ):
+        self.db = db
+        self.name = name
+        self.full_document_before_change = full_document_before_change
+        self.tokens = db[token_collection]
+        self.checkpoint_every = checkpoint_every
+        self.checkpoint_interval = checkpoint_interval_s
+        self.handler_attempts = handler_attempts
+        self.retry_delay = retry_delay_s
+        self.restart_delay = restart_delay_s
+        self.max_restart_delay = max_restart_delay_s
+        self._handlers: Dict[Type[ChangeEvent], List[Callable]] = {}
+        self._token = None
+        # Set when _token is an invalidate event, which can only be started after
+        self._start_after = False
+        self._unsaved = 0
+        self._saved_at = time.monotonic()
+        self._task: Optional[asyncio.Task] = None
+        self.stats = {"received": 0, "dispatched": 0, "handlerErrors": 0, "skipped": 0, "checkpoints": 0, "restarts": 0}
+
+    def on(self, event_type: Type[ChangeEvent], handler: Callable) -> None:
+        self._handlers.setdefault(event_type, []).append(handler)
+
+    async def dispatch(self, event: ChangeEvent) -> bool:
+        """Run the handlers for event, retrying the ones that raise; False if any never succeeded"""
+        pending = self._handlers.get(type(event), [])
+        for attempt in range(self.handler_attempts):
+            if attempt:
+                await asyncio.sleep(self.retry_delay * 2 ** (attempt - 1))
+            failed = []
+            for handler in pending:
+                self.stats["dispatched"] += 1
+                try:
+                    result = handler(event)
+                    if inspect.isawaitable(result):
+                        await result
+                except Exception:
+                    self.stats["handlerErrors"] += 1
+                    logger.exception("Change handler for %s failed", event.collection)
+                    failed.append(handler)
+            if not failed:
+                return True
+            pending = failed
+        self.stats["skipped"] += 1
+        logger.error(
+            "Skipping %s %s of %s after %d attempts",
+            event.collection, event.operation, event.document_id or event.document_key, self.handler_attempts,
+        )
+        return False
+
+    async def load_token(self) -> None:
+        saved = await self.tokens.find_one({"_id": self.name})
+        self._token = saved["token"] if saved else None
+        self._start_after = bool(saved and saved.get("startAfter"))
+
+    async def save_token(self) -> None:
+        if self._token is None or not self._unsaved:
+            return
+        # savedAt lets the TTL index remove tokens of workers that are gone
+        await self.tokens.update_one(
+            {"_id": self.name},
+            {"$set": {"token": self._token, "startAfter": self._start_after, "savedAt": datetime.utcnow()}},
+            upsert=True,
+        )
+        self._unsaved = 0
+        self._saved_at = time.monotonic()
+        self.stats["checkpoints"] += 1
+
+    async def _watch(self):
+        # Invalidate has no ns.coll, it must pass the filter to be seen at all
+        pipeline = [{"$match": {"$or": [{"ns.coll": {"$in": list(EVENT_TYPES)}}, {"operationType": "invalidate"}]}}]
+        options = {"full_document": "updateLookup"}
+        options["start_after" if self._start_after else "resume_after"] = self._token
+        if self.full_document_before_change:
+            options["full_document_before_change"] = self.full_document_before_change
+        async with self.db.watch(pipeline, **options) as stream:
+            async for change in stream:
+                self.stats["received"] += 1
+                if change["operationType"] == "invalidate":
+                    logger.warning("Change stream %s invalidated, starting after it", self.name)
+                    self._token, self._start_after = change["_id"], True
+                    self._unsaved += 1
+                    await self.save_token()
+                    return
+                event = to_event(change)
+                if event is not None:
+                    await self.dispatch(event)
+                self._token, self._start_after = stream.resume_token, False
+                self._unsaved += 1
+                if self._unsaved >= self.checkpoint_every or time.monotonic() - self._saved_at >= self.checkpoint_interval:
+                    await self.save_token()
+
+    async def _run(self):
+        await self.load_token()
+        delay = self.restart_delay
+        while True:
+            opened = time.monotonic()
+            try:
+                await self._watch()
+                logger.warning("Change stream %s closed, reopening", self.name)
+            except asyncio.CancelledError:
+                raise
+            except PyMongoError as e:
+                if isinstance(e, OperationFailure) and e.code == CHANGE_STREAM_HISTORY_LOST:
+                    logger.warning("Resume token for %s fell off the oplog, watching from now", self.name)
+                    self._token, self._start_after = None, False
+                else:
+                    logger.exception("Change stream %s interrupted, resuming", self.name)
+            self.stats["restarts"] += 1
+            # A stream that stayed up for a while starts the backoff over
+            if time.monotonic() - opened >= self.max_restart_delay:
+                delay = self.restart_delay
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, self.max_restart_delay)
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.save_token()
@@ -0,0 +1,229 @@
+"""Batched driver-ride matching and offer scheduling."""
+import asyncio
+import logging
+import time
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+from geo_index import GeoGridIndex
+
+logger = logging.getLogger(__name__)
+
+
+class PendingRide:
+    __slots__ = ("ride_id", "latitude", "longitude", "submitted_at", "declined")
+
+    def __init__(self, ride_id: str, latitude: float, longitude: float, submitted_at: float):
+        self.ride_id = ride_id
+        self.latitude = latitude
+        self.longitude = longitude
+        self.submitted_at = submitted_at
+        self.declined: Set[str] = set()
+
+
+class Offer:
+    __slots__ = ("ride", "driver_id", "distance", "expires_at")
+
+    def __init__(self, ride: PendingRide, driver_id: str, distance: float, expires_at: float):
+        self.ride = ride
+        self.driver_id = driver_id
+        self.distance = distance
+        self.expires_at = expires_at
+
+
+class Dispatcher:
+    """Offers requested rides to nearby online drivers.
+
+    Every ``batch_interval_ms`` the rides without an outstanding offer are
+    matched in one pass: candidate (ride, driver) pairs within the search
+    radius are taken in order of pickup distance and a pair is kept when
+    neither side is already used. This greedy assignment keeps the total
+    pickup distance low without letting one ride grab the driver another
+    ride needs more. An offer that is declined or not answered within
+    ``offer_timeout_s`` sends the ride back to the pool without that driver.
+    """
+
+    def __init__(
+        self,
+        driver_index: GeoGridIndex,
+        send_offer: Callable[[str, str, float], None],
+        batch_interval_ms: int = 300,
+        offer_timeout_s: float = 15.0,
+        search_radius_km: float = 5.0,
+        candidates_per_ride: int = 8,
+        initial_radius_km: float = 0.5,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.driver_index = driver_index
+        self.send_offer = send_offer
+        self.batch_interval = batch_interval_ms / 1000
+        self.offer_timeout = offer_timeout_s
+        self.search_radius_km = search_radius_km
+        self.candidates_per_ride = candidates_per_ride
+        self.initial_radius_km = initial_radius_km
+        self.clock = clock
+        self._waiting: Dict[str, PendingRide] = {}
+        self._offers: Dict[str, Offer] = {}
+        self._offered_drivers: Dict[str, str] = {}
+        self._busy_drivers: Set[str] = set()
+        self._task: Optional[asyncio.Task] = None
+        # With several workers only the lease holder sends offers, the others just track rides
+        self.active = True
+        self.stats = {
+            "submitted": 0,
+            "offersSent": 0,
+            "offersDeclined": 0,
+            "offersExpired": 0,
+            "accepted": 0,
+            "pickupDistanceTotal": 0.0,
+            "matchLatencyTotal": 0.0,
+        }
+
+    @property
+    def waiting(self) -> int:
+        return len(self._waiting)
+
+    @property
+    def outstanding(self) -> int:
+        return len(self._offers)
+
+    def submit(self, ride_id: str, latitude: float, longitude: float) -> None:
+        if ride_id in self._waiting or ride_id in self._offers:
+            return
+        self._waiting[ride_id] = PendingRide(ride_id, latitude, longitude, self.clock())
+        self.stats["submitted"] += 1
+
+    def offer_for(self, ride_id: str) -> Optional[Offer]:
+        return self._offers.get(ride_id)
+
+    def _withdraw(self, ride_id: str) -> Optional[Offer]:
+        offer = self._offers.pop(ride_id, None)
+        if offer is not None:
+            self._offered_drivers.pop(offer.driver_id, None)
+        return offer
+
+    def resolve(self, ride_id: str, driver_id: Optional[str] = None) -> None:
+        """Forget a ride that has been accepted or cancelled"""
+        waiting = self._waiting.pop(ride_id, None)
+        offer = self._withdraw(ride_id)
+        if driver_id is None:
+            return
+        self._busy_drivers.add(driver_id)
+        if waiting is None and offer is None:
+            # Already resolved, e.g. the same change seen again from another source
+            return
+        self.stats["accepted"] += 1
+        # The accepting driver may not be the one we offered the ride to
+        self._offered_drivers.pop(driver_id, None)
+        if offer is not None and offer.driver_id == driver_id:
+            self.stats["pickupDistanceTotal"] += offer.distance
+            self.stats["matchLatencyTotal"] += self.clock() - offer.ride.submitted_at
+
+    def mark_busy(self, driver_id: str) -> None:
+        self._busy_drivers.add(driver_id)
+
+    def release(self, driver_id: str) -> None:
+        """Make a driver eligible for offers again once their ride is over"""
+        self._busy_drivers.discard(driver_id)
+
+    def decline(self, ride_id: str, driver_id: str) -> bool:
+        offer = self._offers.get(ride_id)
+        if offer is None or offer.driver_id != driver_id:
+            return False
+        self._withdraw(ride_id)
+        self.stats["offersDeclined"] += 1
+        offer.ride.declined.add(driver_id)
+        self._waiting[ride_id] = offer.ride
+        return True
+
+    def _expire_offers(self, now: float) -> None:
+        for ride_id, offer in list(self._offers.items()):
+            if offer.expires_at <= now:
+                self._withdraw(ride_id)
+                self.stats["offersExpired"] += 1
+                offer.ride.declined.add(offer.driver_id)
+                self._waiting[ride_id] = offer.ride
+
+    def _eligible(self, ride: PendingRide, driver_id: str) -> bool:
+        return (
+            driver_id not in ride.declined
+            and driver_id not in self._offered_drivers
+            and driver_id not in self._busy_drivers
+        )
+
+    def candidates(self, ride: PendingRide) -> List[Tuple[float, str]]:
+        """Nearest eligible drivers for a ride.
+
+        The search starts with a small ring and doubles it until enough
+        drivers are found, so dense areas never scan the whole radius.
+        """
+        radius = min(self.initial_radius_km, self.search_radius_km)
+        while True:
+            hits = [
+                (distance, driver_id)
+                for distance, driver_id in self.driver_index.nearby(ride.latitude, ride.longitude, radius)
+                if self._eligible(ride, driver_id)
+            ]
+            if len(hits) >= self.candidates_per_ride or radius >= self.search_radius_km:
+                return hits[:self.candidates_per_ride]
+            radius = min(radius * 2, self.search_radius_km)
+
+    def match(self) -> List[Tuple[PendingRide, str, float]]:
+        """Greedy minimum-distance assignment of waiting rides to free drivers"""
+        pairs = []
+        for ride in self._waiting.values():
+            for distance, driver_id in self.candidates(ride):
+                pairs.append((distance, ride.submitted_at, ride, driver_id))
+
+        pairs.sort(key=lambda pair: (pair[0], pair[1]))
+        assigned_rides: Set[str] = set()
+        assigned_drivers: Set[str] = set()
+        matches = []
+        for distance, _, ride, driver_id in pairs:
+            if ride.ride_id in assigned_rides or driver_id in assigned_drivers:
+                continue
+            assigned_rides.add(ride.ride_id)
+            assigned_drivers.add(driver_id)
+            matches.append((ride, driver_id, distance))
+        return matches
+
+    def tick(self) -> int:
+        """Run one dispatch round, returns the number of offers sent"""
+        now = self.clock()
+        self._expire_offers(now)
+        if not self._waiting:
+            return 0
+
+        matches = self.match()
+        for ride, driver_id, distance in matches:
+            del self._waiting[ride.ride_id]
+            self._offers[ride.ride_id] = Offer(ride, driver_id, distance, now + self.offer_timeout)
+            self._offered_drivers[driver_id] = ride.ride_id
+            self.stats["offersSent"] += 1
+            try:
+                self.send_offer(driver_id, ride.ride_id, distance)
+            except Exception:
+                logger.exception("Failed to send offer for ride %s", ride.ride_id)
+        return len(matches)
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.batch_interval)
+            if not self.active:
+                continue
+            try:
+                self.tick()
+            except Exception:
+                logger.exception("Dispatch round failed")
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
@@ -0,0 +1,293 @@
+"""In-memory owner of drivers' live position and online status."""
+import asyncio
+import logging
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+from pymongo import UpdateOne
+
+from geo_index import GeoGridIndex
+
+logger = logging.getLogger(__name__)
+
+# Outcomes of DriverStateStore.update_location
+APPLIED = "applied"
+SUPERSEDED = "superseded"  # older than the report already applied
+SHED = "shed"  # too many drivers waiting for a checkpoint
+UNKNOWN = "unknown"
+
+
+def as_naive_utc(value: datetime) -> datetime:
+    """Naive UTC, the form utcnow() and pymongo use, so client timestamps compare"""
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def _millis(value: datetime) -> datetime:
+    # Mongo keeps milliseconds, state compared against stored values must too
+    return value.replace(microsecond=value.microsecond // 1000 * 1000)
+
+
+def _newer(current: Optional[datetime], incoming: Optional[datetime]) -> bool:
+    # An unversioned change was written outside the API and always wins
+    return incoming is None or current is None or current <= incoming
+
+
+class DriverState:
+    __slots__ = ("driver_id", "latitude", "longitude", "is_online", "reported_at", "status_at")
+
+    def __init__(self, driver_id: str, latitude=None, longitude=None, is_online: bool = False, reported_at=None, status_at=None):
+        self.driver_id = driver_id
+        self.latitude = latitude
+        self.longitude = longitude
+        self.is_online = is_online
+        self.reported_at = reported_at
+        self.status_at = status_at
+
+    @property
+    def has_location(self) -> bool:
+        return self.latitude is not None
+
+    def location(self) -> Optional[dict]:
+        if not self.has_location:
+            return None
+        return {"latitude": self.latitude, "longitude": self.longitude, "address": None}
+
+
+class DriverStateStore:
+    """Live driver state, written to Mongo in the background.
+
+    Location and status updates only touch memory and mark the changed field
+    dirty. Every ``checkpoint_interval_ms`` all dirty drivers are written with
+    one unordered ``bulk_write``, so a driver reporting several times between
+    checkpoints costs a single database write. Each field is written with the
+    time it changed (``reportedAt``, ``statusAt``) and only over an older
+    value, so a worker holding a stale copy never overwrites a newer change.
+    Online drivers with a position are kept in a GeoGridIndex for proximity
+    queries.
+    """
+
+    def __init__(self, checkpoint_interval_ms: int = 1000, max_dirty: int = 100000):
+        self.checkpoint_interval = checkpoint_interval_ms / 1000
+        self.max_dirty = max_dirty
+        self.index = GeoGridIndex()
+        self._states: Dict[str, DriverState] = {}
+        # Driver id to the fields changed since the last checkpoint: "location", "status"
+        self._dirty: Dict[str, Set[str]] = {}
+        self._collection = None
+        self._task: Optional[asyncio.Task] = None
+        # Called with the apply_remote arguments of every change so other workers can mirror it
+        self.forward: Optional[Callable[[list], None]] = None
+        self.stats = {
+            "received": 0,
+            # Reports skipped for being older than the one applied
+            "superseded": 0,
+            # Changes folded into a driver already waiting for the checkpoint
+            "coalesced": 0,
+            "dropped": 0,
+            "written": 0,
+            "checkpoints": 0,
+            "checkpointErrors": 0,
+        }
+
+    def __len__(self) -> int:
+        return len(self._states)
+
+    def __contains__(self, driver_id: str) -> bool:
+        return driver_id in self._states
+
+    @property
+    def dirty(self) -> int:
+        return len(self._dirty)
+
+    def get(self, driver_id: str) -> Optional[DriverState]:
+        return self._states.get(driver_id)
+
+    def clear(self) -> None:
+        self._states.clear()
+        self._dirty.clear()
+        self.index.clear()
+
+    def ids(self) -> List[str]:
+        return list(self._states)
+
+    def remove(self, driver_id: str) -> None:
+        """Forget a driver deleted from the database"""
+        self._states.pop(driver_id, None)
+        self._dirty.pop(driver_id, None)
+        self.index.remove(driver_id)
+
+    def _reindex(self, state: DriverState) -> None:
+        if state.is_online and state.has_location:
+            self.index.upsert(state.driver_id, state.latitude, state.longitude)
+        else:
+            self.index.remove(state.driver_id)
+
+    def load(self, driver: dict) -> DriverState:
+        """Adopt the persisted state of a driver document, it is not marked dirty"""
+        location = driver.get("location") or {}
+        state = DriverState(
+            driver["id"],
+            location.get("latitude"),
+            location.get("longitude"),
+            bool(driver.get("isOnline")),
+            driver.get("reportedAt"),
+            driver.get("statusAt"),
+        )
+        self._states[state.driver_id] = state
+        self._reindex(state)
+        return state
+
+    def _mark_dirty(self, driver_id: str, field: str) -> bool:
+        fields = self._dirty.get(driver_id)
+        if fields is not None:
+            self.stats["coalesced"] += 1
+            fields.add(field)
+            return True
+        if len(self._dirty) >= self.max_dirty:
+            # Checkpoints are falling behind, shed load rather than grow without bound
+            self.stats["dropped"] += 1
+            return False
+        self._dirty[driver_id] = {field}
+        return True
+
+    def update_location(self, driver_id: str, latitude: float, longitude: float, reported_at: Optional[datetime] = None) -> str:
+        """Record a position report, returns APPLIED, SUPERSEDED, SHED or UNKNOWN"""
+        self.stats["received"] += 1
+        now = datetime.utcnow()
+        # A report dated in the future would pin the driver until that time
+        reported_at = _millis(min(as_naive_utc(reported_at), now) if reported_at else now)
+        state = self._states.get(driver_id)
+        if state is None:
+            self.stats["dropped"] += 1
+            return UNKNOWN
+        if state.reported_at is not None and state.reported_at > reported_at:
+            # An out-of-order report loses against the newer one already applied
+            self.stats["superseded"] += 1
+            return SUPERSEDED
+        if not self._mark_dirty(driver_id, "location"):
+            return SHED
+        state.latitude = latitude
+        state.longitude = longitude
+        state.reported_at = reported_at
+        self._reindex(state)
+        if self.forward is not None:
+            self.forward([driver_id, latitude, longitude, None, reported_at, None])
+        return APPLIED
+
+    def set_online(self, driver_id: str, is_online: bool) -> Optional[DriverState]:
+        state = self._states.get(driver_id)
+        if state is None:
+            return None
+        # Status changes are never shed, they are rare and matter more than positions
+        self._dirty.setdefault(driver_id, set()).add("status")
+        state.is_online = is_online
+        state.status_at = _millis(datetime.utcnow())
+        self._reindex(state)
+        if self.forward is not None:
+            self.forward([driver_id, None, None, is_online, None, state.status_at])
+        return state
+
+    def apply_remote(
+        self,
+        driver_id: str,
+        latitude: Optional[float] = None,
+        longitude: Optional[float] = None,
+        is_online: Optional[bool] = None,
+        reported_at: Optional[datetime] = None,
+        status_at: Optional[datetime] = None,
+    ) -> None:
+        """Mirror a change made elsewhere, whoever made it also owns its checkpoint.
+
+        Only the fields passed are applied, and only when they are not older
+        than what this worker holds. Drivers that are not loaded are ignored:
+        a made-up state could bring a deleted driver back or put one online,
+        and ``load`` reads them from Mongo when they are needed.
+        """
+        state = self._states.get(driver_id)
+        if state is None:
+            return
+        if latitude is not None:
+            reported_at = as_naive_utc(reported_at) if reported_at else None
+            if _newer(state.reported_at, reported_at):
+                state.latitude = latitude
+                state.longitude = longitude
+                state.reported_at = reported_at or state.reported_at
+        if is_online is not None:
+            status_at = as_naive_utc(status_at) if status_at else None
+            if _newer(state.status_at, status_at):
+                state.is_online = is_online
+                state.status_at = status_at or state.status_at
+        self._reindex(state)
+
+    def nearby(self, latitude: float, longitude: float, radius_km: float, limit: Optional[int] = None) -> List[Tuple[float, DriverState]]:
+        return [
+            (distance, self._states[driver_id])
+            for distance, driver_id in self.index.nearby(latitude, longitude, radius_km, limit=limit)
+        ]
+
+    async def checkpoint(self) -> int:
+        """Write every dirty driver to Mongo, returns how many were written"""
+        if not self._dirty or self._collection is None:
+            return 0
+        batch, self._dirty = self._dirty, {}
+        operations = []
+        for driver_id, fields in batch.items():
+            state = self._states.get(driver_id)
+            if state is None:
+                continue
+            if "location" in fields and state.has_location:
+                operations.append(UpdateOne(
+                    {"id": driver_id, "reportedAt": {"$not": {"$gt": state.reported_at}}},
+                    {"$set": {
+                        "location": state.location(),
+                        "locationPoint": {"type": "Point", "coordinates": [state.longitude, state.latitude]},
+                        "reportedAt": state.reported_at,
+                    }},
+                ))
+            if "status" in fields:
+                operations.append(UpdateOne(
+                    {"id": driver_id, "statusAt": {"$not": {"$gt": state.status_at}}},
+                    {"$set": {"isOnline": state.is_online, "statusAt": state.status_at}},
+                ))
+        if not operations:
+            return 0
+
+        try:
+            await self._collection.bulk_write(operations, ordered=False)
+        except BaseException as e:
+            # Still dirty, retried with the next checkpoint. That includes a write
+            # cancelled by stop(), whose final checkpoint then picks them up; the
+            # guarded updates are harmless if the cancelled write went through.
+            for driver_id, fields in batch.items():
+                self._dirty.setdefault(driver_id, set()).update(fields)
+            if not isinstance(e, Exception):
+                raise
+            self.stats["checkpointErrors"] += 1
+            logger.exception("Failed to checkpoint %d drivers", len(batch))
+            return 0
+
+        self.stats["checkpoints"] += 1
+        self.stats["written"] += len(operations)
+        return len(operations)
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.checkpoint_interval)
+            await self.checkpoint()
+
+    def start(self, collection) -> None:
+        self._collection = collection
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.checkpoint()
@@ -0,0 +1,82 @@
+"""Streaming encoders for bulk exports.
+
+Every encoder consumes an async iterator of documents and yields encoded
+chunks of roughly ``batch_size`` documents, so memory stays constant no
+matter how many rows the cursor produces.
+"""
+import csv
+import io
+import json
+import zlib
+from datetime import datetime
+from typing import AsyncIterator, List, Sequence
+
+RIDE_CSV_COLUMNS = (
+    "id", "riderId", "driverId", "status",
+    "pickupLatitude", "pickupLongitude", "pickupAddress",
+    "destinationLatitude", "destinationLongitude", "destinationAddress",
+    "fare", "surgeMultiplier", "distance", "duration", "createdAt", "completedAt",
+)
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+
+def ride_csv_row(ride: dict) -> List:
+    pickup = ride.get("pickup") or {}
+    destination = ride.get("destination") or {}
+    return [
+        ride.get("id"), ride.get("riderId"), ride.get("driverId"), ride.get("status"),
+        pickup.get("latitude"), pickup.get("longitude"), pickup.get("address"),
+        destination.get("latitude"), destination.get("longitude"), destination.get("address"),
+        ride.get("fare"), ride.get("surgeMultiplier", 1.0), ride.get("distance"), ride.get("duration"),
+        ride.get("createdAt").isoformat() if ride.get("createdAt") else None,
+        ride.get("completedAt").isoformat() if ride.get("completedAt") else None,
+    ]
+
+
+async def _batches(docs: AsyncIterator[dict], batch_size: int) -> AsyncIterator[List[dict]]:
+    batch = []
+    async for doc in docs:
+        batch.append(doc)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+async def encode_ndjson(docs: AsyncIterator[dict], batch_size: int = 1000) -> AsyncIterator[bytes]:
+    async for batch in _batches(docs, batch_size):
+        yield "".join(json.dumps(doc, default=_json_default) + "\n" for doc in batch).encode()
+
+
+async def encode_csv(
+    docs: AsyncIterator[dict],
+    columns: Sequence[str] = RIDE_CSV_COLUMNS,
+    to_row=ride_csv_row,
+    batch_size: int = 1000,
+) -> AsyncIterator[bytes]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    async for batch in _batches(docs, batch_size):
+        writer.writerows(to_row(doc) for doc in batch)
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        # Header only, the cursor was empty
+        yield buffer.getvalue().encode()
+
+
+async def gzip_chunks(chunks: AsyncIterator[bytes], level: int = 6) -> AsyncIterator[bytes]:
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)  # wbits=31 writes a gzip header
+    async for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
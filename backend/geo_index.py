@@ -0,0 +1,134 @@
+"""Process-local spatial index over a uniform lat/lon grid."""
+import heapq
+import math
+from typing import Dict, Hashable, List, Optional, Set, Tuple
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = 111.32
+
+
+def haversine_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """Great-circle distance in kilometres"""
+    phi1 = math.radians(lat1)
+    phi2 = math.radians(lat2)
+    dphi = phi2 - phi1
+    dlambda = math.radians(lon2 - lon1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+class GeoGridIndex:
+    """Buckets points into fixed-size lat/lon cells.
+
+    Nearby queries only visit the cells overlapping the search radius, so the
+    cost depends on local density rather than on the total number of points.
+    """
+
+    def __init__(self, cell_size_deg: float = 0.01):
+        self.cell_size_deg = cell_size_deg
+        self._cells: Dict[Tuple[int, int], Set[Hashable]] = {}
+        self._points: Dict[Hashable, Tuple[float, float, Tuple[int, int]]] = {}
+
+    def __len__(self) -> int:
+        return len(self._points)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._points
+
+    def cell_of(self, latitude: float, longitude: float) -> Tuple[int, int]:
+        return (
+            math.floor(latitude / self.cell_size_deg),
+            math.floor(longitude / self.cell_size_deg),
+        )
+
+    def cell_count(self, cell: Tuple[int, int]) -> int:
+        members = self._cells.get(cell)
+        return len(members) if members else 0
+
+    def occupied_cells(self) -> List[Tuple[int, int]]:
+        return list(self._cells)
+
+    def get(self, key: Hashable) -> Optional[Tuple[float, float]]:
+        point = self._points.get(key)
+        if point is None:
+            return None
+        return point[0], point[1]
+
+    def upsert(self, key: Hashable, latitude: float, longitude: float) -> None:
+        cell = self.cell_of(latitude, longitude)
+        previous = self._points.get(key)
+        if previous is not None and previous[2] != cell:
+            self._discard_from_cell(key, previous[2])
+        self._points[key] = (latitude, longitude, cell)
+        self._cells.setdefault(cell, set()).add(key)
+
+    def remove(self, key: Hashable) -> bool:
+        previous = self._points.pop(key, None)
+        if previous is None:
+            return False
+        self._discard_from_cell(key, previous[2])
+        return True
+
+    def clear(self) -> None:
+        self._cells.clear()
+        self._points.clear()
+
+    def _discard_from_cell(self, key: Hashable, cell: Tuple[int, int]) -> None:
+        members = self._cells.get(cell)
+        if members is None:
+            return
+        members.discard(key)
+        if not members:
+            del self._cells[cell]
+
+    def _cell_bounds(self, latitude: float, longitude: float, radius_km: float):
+        center_row, center_col = self.cell_of(latitude, longitude)
+        cell_km = self.cell_size_deg * KM_PER_DEGREE
+        row_span = math.ceil(radius_km / cell_km)
+        # Meridians converge towards the poles, so a cell is narrower in km there
+        cos_lat = max(math.cos(math.radians(min(abs(latitude) + radius_km / KM_PER_DEGREE, 89.9))), 1e-6)
+        col_span = math.ceil(radius_km / (cell_km * cos_lat))
+        return (
+            center_row - row_span,
+            center_row + row_span,
+            center_col - col_span,
+            center_col + col_span,
+        )
+
+    def cells_within(self, latitude: float, longitude: float, radius_km: float) -> List[Tuple[int, int]]:
+        """Occupied cells whose area may contain points within ``radius_km``"""
+        min_row, max_row, min_col, max_col = self._cell_bounds(latitude, longitude, radius_km)
+        span = (max_row - min_row + 1) * (max_col - min_col + 1)
+        if span > len(self._cells):
+            # Sparse index or huge radius: walking occupied cells is cheaper
+            return [
+                cell for cell in self._cells
+                if min_row <= cell[0] <= max_row and min_col <= cell[1] <= max_col
+            ]
+        return [
+            (row, col)
+            for row in range(min_row, max_row + 1)
+            for col in range(min_col, max_col + 1)
+            if (row, col) in self._cells
+        ]
+
+    def nearby(
+        self,
+        latitude: float,
+        longitude: float,
+        radius_km: float,
+        limit: Optional[int] = None,
+    ) -> List[Tuple[float, Hashable]]:
+        """Return ``(distance_km, key)`` pairs within the radius, nearest first"""
+        candidates = []
+        for cell in self.cells_within(latitude, longitude, radius_km):
+            for key in self._cells[cell]:
+                point_lat, point_lon, _ = self._points[key]
+                distance = haversine_km(latitude, longitude, point_lat, point_lon)
+                if distance <= radius_km:
+                    candidates.append((distance, key))
+
+        if limit is not None and limit < len(candidates):
+            return heapq.nsmallest(limit, candidates, key=lambda item: item[0])
+        candidates.sort(key=lambda item: item[0])
+        return candidates
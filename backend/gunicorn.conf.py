@@ -0,0 +1,22 @@
+"""Multi-worker entry point.
+
+    cd backend && gunicorn server:app -c gunicorn.conf.py
+
+Each worker is a separate process with its own in-memory driver state, open
+ride feed and caches; they stay in sync through STATE_BACKEND (mongo or
+redis), which is set to mongo here unless configured otherwise. Verification
+codes must be shared too, so VERIFICATION_STORE defaults to mongo as well.
+"""
+import multiprocessing
+import os
+
+os.environ.setdefault("STATE_BACKEND", "mongo")
+os.environ.setdefault("VERIFICATION_STORE", "mongo")
+
+bind = os.environ.get("BIND", "0.0.0.0:8001")
+workers = int(os.environ.get("WEB_CONCURRENCY", multiprocessing.cpu_count()))
+worker_class = "uvicorn.workers.UvicornWorker"
+# Workers hold state loaded at startup, preloading would share one Motor client across forks
+preload_app = False
+graceful_timeout = 30
+keepalive = 5
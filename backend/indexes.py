@@ -0,0 +1,144 @@
+"""Declarative index registry for the collections used by server.py."""
+import logging
+from typing import Dict, List, Tuple
+
+from pymongo import ASCENDING, DESCENDING, GEOSPHERE, IndexModel
+from pymongo.errors import OperationFailure
+
+logger = logging.getLogger(__name__)
+
+# Indexes that existed before the registry keep the name Mongo generated for
+# them (e.g. riderId_1_createdAt_-1_id_-1), so deployments don't see a conflict
+INDEXES: Dict[str, List[IndexModel]] = {
+    "users": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        IndexModel([("phone", ASCENDING)], name="phone_unique", unique=True),
+    ],
+    "drivers": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        IndexModel([("phone", ASCENDING)], name="phone_unique", unique=True),
+        IndexModel([("isOnline", ASCENDING)], name="isOnline"),
+        IndexModel([("locationPoint", GEOSPHERE)], name="locationPoint_2dsphere"),
+    ],
+    "rides": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        IndexModel([("status", ASCENDING), ("createdAt", ASCENDING)], name="status_createdAt"),
+        IndexModel([("riderId", ASCENDING), ("createdAt", DESCENDING), ("id", DESCENDING)]),
+        IndexModel([("driverId", ASCENDING), ("createdAt", DESCENDING), ("id", DESCENDING)]),
+        IndexModel([("pickupPoint", GEOSPHERE)], name="pickupPoint_2dsphere"),
+        # Date-range exports stream in index order
+        IndexModel([("createdAt", ASCENDING), ("id", ASCENDING)], name="createdAt_id"),
+    ],
+    "ratings": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        IndexModel([("ratedId", ASCENDING), ("createdAt", DESCENDING), ("id", DESCENDING)]),
+    ],
+    # Each status is reached once per ride, so a retried transition is a duplicate
+    # and record_transition only re-projects it if no attempt finished projecting
+    "ride_events": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        IndexModel([("rideId", ASCENDING), ("status", ASCENDING)], name="rideId_status_unique", unique=True),
+        IndexModel([("createdAt", ASCENDING), ("id", ASCENDING)], name="createdAt_id"),
+    ],
+    "driver_earnings": [
+        IndexModel(
+            [("driverId", ASCENDING), ("period", ASCENDING), ("bucket", ASCENDING)],
+            name="driverId_period_bucket_unique",
+            unique=True,
+        ),
+    ],
+    "ride_stats_daily": [
+        IndexModel([("date", ASCENDING)], name="date_unique", unique=True),
+    ],
+    # Used by MongoVerificationStore, documents go away once expiresAt passes
+    "verification_codes": [
+        IndexModel([("expiresAt", ASCENDING)], name="expiresAt_ttl", expireAfterSeconds=0),
+    ],
+    "verification_sends": [
+        IndexModel([("expiresAt", ASCENDING)], name="expiresAt_ttl", expireAfterSeconds=0),
+    ],
+    # Resume tokens of change-stream consumers, a worker that is gone stops saving its own
+    "change_stream_tokens": [
+        IndexModel([("savedAt", ASCENDING)], name="savedAt_ttl", expireAfterSeconds=7 * 24 * 3600),
+    ],
+}
+
+
+# Options that make two indexes on the same keys different indexes
+INDEX_OPTIONS = ("unique", "expireAfterSeconds")
+
+
+def key_pattern(key) -> Tuple[Tuple[str, object], ...]:
+    """Hashable form of an index key, as declared or as listed by index_information"""
+    items = key.items() if hasattr(key, "items") else key
+    # Older servers list directions as floats, 1.0 == 1 keeps them comparable
+    return tuple((field, direction) for field, direction in items)
+
+
+async def existing_indexes(collection) -> Dict[Tuple, dict]:
+    """Live indexes by key pattern, each with its name"""
+    information = await collection.index_information()
+    return {
+        key_pattern(info["key"]): {"name": name, **info}
+        for name, info in information.items()
+        if name != "_id_"
+    }
+
+
+async def apply_indexes(db, registry: Dict[str, List[IndexModel]] = INDEXES) -> List[str]:
+    """Create every registered index that is missing, returns the names that failed.
+
+    Indexes whose keys and options already exist, under any name, are
+    left alone, so this is safe to run on every startup. A conflicting
+    definition or duplicate data for a unique index is logged and skipped
+    rather than preventing the app from starting.
+    """
+    failed = []
+    for collection_name, models in registry.items():
+        collection = db[collection_name]
+        existing = await existing_indexes(collection)
+        for model in models:
+            current = existing.get(key_pattern(model.document["key"]))
+            if current is not None and all(current.get(option) == model.document.get(option) for option in INDEX_OPTIONS):
+                if current["name"] != model.document["name"]:
+                    # Creating it again under the registry name would be an IndexOptionsConflict
+                    logger.info(
+                        "Index %s.%s already exists as %s", collection_name, model.document["name"], current["name"],
+                    )
+                continue
+            try:
+                await collection.create_indexes([model])
+            except OperationFailure as e:
+                name = f"{collection_name}.{model.document['name']}"
+                logger.error("Could not create index %s: %s", name, e)
+                failed.append(name)
+    return failed
+
+
+async def index_report(db, registry: Dict[str, List[IndexModel]] = INDEXES) -> Dict[str, dict]:
+    """Compare the registry with the live indexes and their $indexStats usage.
+
+    Indexes are matched by key pattern, so one registered under a different
+    name than it was created with is neither missing nor unregistered.
+    """
+    report = {}
+    for collection_name, models in registry.items():
+        collection = db[collection_name]
+        live = await existing_indexes(collection)
+        expected = {key_pattern(model.document["key"]): model.document["name"] for model in models}
+        existing = {index["name"] for index in live.values()}
+
+        usage = {}
+        try:
+            async for stats in collection.aggregate([{"$indexStats": {}}]):
+                usage[stats["name"]] = stats["accesses"]["ops"]
+        except OperationFailure as e:
+            logger.warning("$indexStats unavailable for %s: %s", collection_name, e)
+
+        report[collection_name] = {
+            "missing": sorted(name for key, name in expected.items() if key not in live),
+            "unregistered": sorted(index["name"] for key, index in live.items() if key not in expected),
+            "unused": sorted(name for name in existing if usage.get(name) == 0),
+            "ops": {name: usage[name] for name in sorted(usage) if name != "_id_"},
+        }
+    return report
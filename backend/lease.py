@@ -0,0 +1,76 @@
+"""Leader election between workers through a Mongo lease document."""
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from typing import Callable, Optional
+
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+logger = logging.getLogger(__name__)
+
+
+class MongoLease:
+    """Time-limited ownership of a named role, held by at most one worker.
+
+    The holder renews the lease every ``ttl_s / 3``; if it dies, another
+    worker takes over once ``ttl_s`` has passed. ``on_change`` is called with
+    the new state whenever this worker gains or loses the lease.
+    """
+
+    def __init__(self, collection, name: str, owner: str, ttl_s: float = 10.0, on_change: Optional[Callable[[bool], None]] = None):
+        self.collection = collection
+        self.name = name
+        self.owner = owner
+        self.ttl = timedelta(seconds=ttl_s)
+        self.on_change = on_change
+        self.held = False
+        self._task: Optional[asyncio.Task] = None
+
+    def _set_held(self, held: bool) -> None:
+        if held != self.held:
+            logger.info("%s lease %s by %s", self.name, "acquired" if held else "lost", self.owner)
+            self.held = held
+            if self.on_change is not None:
+                self.on_change(held)
+
+    async def try_acquire(self) -> bool:
+        now = datetime.utcnow()
+        try:
+            lease = await self.collection.find_one_and_update(
+                {"_id": self.name, "$or": [{"owner": self.owner}, {"expiresAt": {"$lte": now}}]},
+                {"$set": {"owner": self.owner, "expiresAt": now + self.ttl}},
+                upsert=True,
+                return_document=ReturnDocument.AFTER,
+            )
+        except DuplicateKeyError:
+            # Held by someone else and not expired, our upsert collided with it
+            lease = None
+        self._set_held(lease is not None)
+        return self.held
+
+    async def _run(self):
+        interval = self.ttl.total_seconds() / 3
+        while True:
+            try:
+                await self.try_acquire()
+            except Exception:
+                logger.exception("Could not renew %s lease", self.name)
+                self._set_held(False)
+            await asyncio.sleep(interval)
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self.held:
+            await self.collection.delete_one({"_id": self.name, "owner": self.owner})
+            self._set_held(False)
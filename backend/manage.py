@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""Operational commands for the RideApp backend.
+
+    python manage.py --help
+"""
+import asyncio
+import json
+from datetime import datetime
+from typing import Optional
+
+import typer
+from pymongo import UpdateOne
+
+import analytics
+from indexes import apply_indexes, index_report
+from ride_events import rebuild_projections
+from server import client, db
+from snapshot import FORMATS, SnapshotWriter
+
+cli = typer.Typer(help="RideApp backend maintenance commands")
+
+
+@cli.callback()
+def main():
+    """RideApp backend maintenance commands"""
+
+
+def run(coro):
+    try:
+        return asyncio.run(coro)
+    finally:
+        client.close()
+
+
+async def _backfill_ratings(batch_size: int) -> int:
+    pipeline = [
+        {"$group": {
+            "_id": "$ratedId",
+            "ratingSum": {"$sum": "$rating"},
+            "ratingCount": {"$sum": 1},
+        }},
+        # Riders are rated too, only totals of drivers are kept
+        {"$lookup": {"from": "drivers", "localField": "_id", "foreignField": "id", "as": "driver"}},
+        {"$match": {"driver": {"$ne": []}}},
+        {"$project": {"driver": False}},
+    ]
+
+    updated = 0
+    seen_ids = []
+    operations = []
+    async for totals in db.ratings.aggregate(pipeline, allowDiskUse=True):
+        seen_ids.append(totals["_id"])
+        operations.append(UpdateOne(
+            {"id": totals["_id"]},
+            {"$set": {
+                "ratingSum": totals["ratingSum"],
+                "ratingCount": totals["ratingCount"],
+                "rating": round(totals["ratingSum"] / totals["ratingCount"], 1),
+            }},
+        ))
+        if len(operations) >= batch_size:
+            result = await db.drivers.bulk_write(operations, ordered=False)
+            updated += result.matched_count
+            operations = []
+    if operations:
+        result = await db.drivers.bulk_write(operations, ordered=False)
+        updated += result.matched_count
+
+    # Reset last, so rated drivers never read as unrated while the backfill runs
+    await db.drivers.update_many(
+        {"id": {"$nin": seen_ids}},
+        {"$set": {"ratingSum": 0, "ratingCount": 0, "rating": 5.0}},
+    )
+    return updated
+
+
+@cli.command("backfill-ratings")
+def backfill_ratings(batch_size: int = typer.Option(1000, help="Driver updates per bulk write")):
+    """Rebuild drivers' ratingSum/ratingCount from db.ratings"""
+    updated = run(_backfill_ratings(batch_size))
+    typer.echo(f"Rebuilt rating counters for {updated} drivers")
+
+
+@cli.command("rebuild-projections")
+def rebuild_ride_projections(batch_size: int = typer.Option(1000, help="Events fetched per cursor batch")):
+    """Recompute driver earnings/totalRides and daily ride stats from db.ride_events"""
+    replayed = run(rebuild_projections(db, batch_size))
+    typer.echo(f"Replayed {replayed} ride events")
+
+
+@cli.command("ensure-indexes")
+def ensure_indexes():
+    """Create every index declared in indexes.INDEXES"""
+    failed = run(apply_indexes(db))
+    if failed:
+        typer.echo(f"Failed to create: {', '.join(failed)}", err=True)
+        raise typer.Exit(code=1)
+    typer.echo("All registered indexes are present")
+
+
+@cli.command("index-report")
+def report_indexes():
+    """Report missing, unregistered and unused indexes using $indexStats"""
+    report = run(index_report(db))
+    typer.echo(json.dumps(report, indent=2))
+    if any(entry["missing"] for entry in report.values()):
+        raise typer.Exit(code=1)
+
+
+@cli.command("export-snapshot")
+def export_snapshot(
+    out: str = typer.Option("snapshots", help="Snapshot root directory"),
+    file_format: str = typer.Option("arrow", "--format", help=f"One of: {', '.join(FORMATS)}"),
+    batch_size: int = typer.Option(5000, help="Documents fetched per cursor batch"),
+    rebuild: bool = typer.Option(False, help="Re-export everything, filling columns older partitions lack"),
+):
+    """Export new and changed rides and ratings into date-partitioned columnar files"""
+    if file_format not in FORMATS:
+        raise typer.BadParameter(f"format must be one of: {', '.join(FORMATS)}")
+    written = run(SnapshotWriter(out, file_format).export(db, batch_size, rebuild))
+    typer.echo(f"Exported {written['rides']} rides and {written['ratings']} ratings to {out}")
+
+
+@cli.command("analytics-report")
+def analytics_report(
+    snapshot: str = typer.Option("snapshots", help="Snapshot root directory"),
+    start: Optional[datetime] = typer.Option(None, formats=["%Y-%m-%d"], help="First createdAt date"),
+    end: Optional[datetime] = typer.Option(None, formats=["%Y-%m-%d"], help="Last createdAt date"),
+    min_ratings: int = typer.Option(1, help="Ratings a driver needs to be included in the distribution"),
+):
+    """Fare, distance, completion and driver rating report computed from a snapshot, without Mongo"""
+    result = analytics.report(snapshot, start and start.date(), end and end.date(), min_ratings)
+    typer.echo(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    cli()
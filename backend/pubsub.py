@@ -0,0 +1,72 @@
+"""In-process topic fan-out for push channels."""
+import asyncio
+import json
+from typing import Callable, Dict, Optional, Set
+
+
+class Subscriber:
+    """Outbound queue for one connection.
+
+    Messages are serialized once per publish and shared by every subscriber,
+    and a slow consumer loses its oldest messages instead of growing without
+    bound, so idle connections cost little more than their queue.
+    """
+
+    __slots__ = ("queue", "topics", "dropped")
+
+    def __init__(self, max_queue: int = 100):
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue)
+        self.topics: Set[str] = set()
+        self.dropped = 0
+
+    def push(self, payload: str) -> None:
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+        self.queue.put_nowait(payload)
+
+
+class PubSub:
+    def __init__(self):
+        self._topics: Dict[str, Set[Subscriber]] = {}
+        # Called for every publish so other workers can deliver to their own subscribers
+        self.forward: Optional[Callable[[str, dict], None]] = None
+        self.stats = {"published": 0, "delivered": 0, "connections": 0}
+
+    def subscriber_count(self, topic: str) -> int:
+        return len(self._topics.get(topic, ()))
+
+    def subscribe(self, subscriber: Subscriber, topic: str) -> None:
+        self._topics.setdefault(topic, set()).add(subscriber)
+        subscriber.topics.add(topic)
+
+    def unsubscribe(self, subscriber: Subscriber, topic: str) -> None:
+        subscriber.topics.discard(topic)
+        members = self._topics.get(topic)
+        if members is None:
+            return
+        members.discard(subscriber)
+        if not members:
+            del self._topics[topic]
+
+    def remove(self, subscriber: Subscriber) -> None:
+        for topic in list(subscriber.topics):
+            self.unsubscribe(subscriber, topic)
+
+    def publish(self, topic: str, message: dict) -> int:
+        """Deliver a message to the subscribers of a topic on every worker"""
+        if self.forward is not None:
+            self.forward(topic, message)
+        return self.deliver(topic, message)
+
+    def deliver(self, topic: str, message: dict) -> int:
+        """Deliver a message to this worker's subscribers of a topic"""
+        members = self._topics.get(topic)
+        self.stats["published"] += 1
+        if not members:
+            return 0
+        payload = json.dumps({"topic": topic, **message}, default=str)
+        for subscriber in members:
+            subscriber.push(payload)
+        self.stats["delivered"] += len(members)
+        return len(members)
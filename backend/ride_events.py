@@ -0,0 +1,171 @@
+"""Append-only ride lifecycle log and the read models projected from it."""
+import logging
+import uuid
+from datetime import datetime, timedelta
+from typing import Dict, FrozenSet, Optional
+
+from pymongo import UpdateOne
+from pymongo.errors import DuplicateKeyError
+
+logger = logging.getLogger(__name__)
+
+RIDE_TRANSITIONS: Dict[str, FrozenSet[str]] = {
+    "requested": frozenset({"accepted", "cancelled"}),
+    "accepted": frozenset({"driverArriving", "cancelled"}),
+    "driverArriving": frozenset({"inProgress", "cancelled"}),
+    "inProgress": frozenset({"completed", "cancelled"}),
+    "completed": frozenset(),
+    "cancelled": frozenset(),
+}
+
+
+# How long an attempt may take to project an event before a retry takes over
+PROJECTION_LEASE = timedelta(seconds=30)
+
+
+class InvalidTransition(ValueError):
+    def __init__(self, from_status: Optional[str], to_status: str):
+        if to_status not in RIDE_TRANSITIONS:
+            message = f"Unknown ride status {to_status}"
+        else:
+            message = f"Cannot change ride from {from_status or 'nothing'} to {to_status}"
+        super().__init__(message)
+        self.from_status = from_status
+        self.to_status = to_status
+
+
+def previous_statuses(to_status: str) -> list:
+    """Statuses a ride may be in for a move to ``to_status``"""
+    if to_status not in RIDE_TRANSITIONS:
+        raise InvalidTransition(None, to_status)
+    return [status for status, targets in RIDE_TRANSITIONS.items() if to_status in targets]
+
+
+def check_transition(from_status: Optional[str], to_status: str) -> None:
+    if from_status is None:
+        if to_status != "requested":
+            raise InvalidTransition(None, to_status)
+    elif to_status not in RIDE_TRANSITIONS.get(from_status, ()):
+        raise InvalidTransition(from_status, to_status)
+
+
+def day_key(at: datetime) -> str:
+    return at.strftime("%Y-%m-%d")
+
+
+def week_key(at: datetime) -> str:
+    year, week, _ = at.isocalendar()
+    return f"{year}-W{week:02d}"
+
+
+EARNINGS_PERIODS = {
+    "day": day_key,
+    "week": week_key,
+    "all": lambda at: "all",
+}
+
+
+def earnings_bucket(period: str, at: datetime) -> str:
+    return EARNINGS_PERIODS[period](at)
+
+
+async def record_transition(db, ride: dict, from_status: Optional[str], to_status: str, at: Optional[datetime] = None) -> Optional[dict]:
+    """Append a transition for ``ride`` and project it, returns the event.
+
+    Every status is reached at most once per ride, so the unique
+    (rideId, status) index turns a retried write into a duplicate, reported
+    as ``None``. Events are inserted with ``projected: False`` and flagged
+    once their projections are applied: a retry finding the event still
+    unprojected, and no other attempt working on it within
+    ``PROJECTION_LEASE``, applies them instead of losing them.
+    """
+    check_transition(from_status, to_status)
+    now = datetime.utcnow()
+    event = {
+        "id": str(uuid.uuid4()),
+        "rideId": ride["id"],
+        "fromStatus": from_status,
+        "status": to_status,
+        "riderId": ride.get("riderId"),
+        "driverId": ride.get("driverId"),
+        "fare": ride.get("fare", 0.0),
+        "distance": ride.get("distance", 0.0),
+        "rideCreatedAt": ride.get("createdAt"),
+        "createdAt": at or now,
+        "projected": False,
+        "projectingSince": now,
+    }
+    try:
+        await db.ride_events.insert_one(event)
+    except DuplicateKeyError:
+        # Claim the existing event if an earlier attempt never finished projecting it
+        event = await db.ride_events.find_one_and_update(
+            {
+                "rideId": ride["id"],
+                "status": to_status,
+                "projected": False,
+                "$or": [{"projectingSince": None}, {"projectingSince": {"$lt": now - PROJECTION_LEASE}}],
+            },
+            {"$set": {"projectingSince": now}},
+        )
+        if event is None:
+            logger.info("Ride %s already recorded as %s", ride["id"], to_status)
+            return None
+        logger.warning("Projecting ride %s %s left unprojected by an earlier attempt", ride["id"], to_status)
+    event.pop("_id", None)
+    try:
+        await apply_projections(db, event)
+    except BaseException:
+        # Let the next retry take it over straight away
+        await db.ride_events.update_one({"id": event["id"]}, {"$set": {"projectingSince": None}})
+        raise
+    await db.ride_events.update_one({"id": event["id"]}, {"$set": {"projected": True}, "$unset": {"projectingSince": ""}})
+    event["projected"] = True
+    event.pop("projectingSince", None)
+    return event
+
+
+async def apply_projections(db, event: dict) -> None:
+    """Fold one event into the precomputed read models"""
+    status = event["status"]
+    daily = {status: 1}
+
+    if status == "accepted" and event.get("rideCreatedAt"):
+        wait = (event["createdAt"] - event["rideCreatedAt"]).total_seconds()
+        daily["timeToAcceptTotal"] = max(wait, 0.0)
+    elif status == "completed":
+        daily["revenue"] = event["fare"]
+        daily["distance"] = event["distance"]
+        if event.get("driverId"):
+            await db.drivers.update_one(
+                {"id": event["driverId"]},
+                {"$inc": {"earnings": event["fare"], "totalRides": 1}},
+            )
+            await db.driver_earnings.bulk_write([
+                UpdateOne(
+                    {"driverId": event["driverId"], "period": period, "bucket": earnings_bucket(period, event["createdAt"])},
+                    {"$inc": {"earnings": event["fare"], "rides": 1, "distance": event["distance"]}},
+                    upsert=True,
+                )
+                for period in EARNINGS_PERIODS
+            ], ordered=False)
+
+    await db.ride_stats_daily.update_one(
+        {"date": day_key(event["createdAt"])},
+        {"$inc": daily},
+        upsert=True,
+    )
+
+
+async def rebuild_projections(db, batch_size: int = 1000) -> int:
+    """Recompute every read model from ride_events, returns the events replayed"""
+    await db.drivers.update_many({}, {"$set": {"earnings": 0.0, "totalRides": 0}})
+    await db.ride_stats_daily.delete_many({})
+    await db.driver_earnings.delete_many({})
+    replayed = 0
+    cursor = db.ride_events.find({}, {"_id": False}).sort([("createdAt", 1), ("id", 1)]).batch_size(batch_size)
+    async for event in cursor:
+        await apply_projections(db, event)
+        replayed += 1
+    await db.ride_events.update_many({"projected": False}, {"$set": {"projected": True}, "$unset": {"projectingSince": ""}})
+    return replayed
@@ -1,37 +1,88 @@
-from fastapi import FastAPI, APIRouter, HTTPException, status
+from fastapi import FastAPI, APIRouter, Header, HTTPException, Query, WebSocket, WebSocketDisconnect, status
+from fastapi.encoders import jsonable_encoder
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
 import os
+import hmac
+import json
+import base64
+import asyncio
 import logging
+import math
 from pathlib import Path
-from pydantic import BaseModel, Field
-from typing import List, Optional
+from pydantic import BaseModel, Field, TypeAdapter, field_validator, model_validator
+from typing import List, Literal, Optional, Union
 import uuid
 from datetime import datetime
 import random
 import string
+import heapq
+from collections import OrderedDict
+
+import numpy as np
+
+from geo_index import GeoGridIndex, haversine_km
+from indexes import apply_indexes
+from driver_state import APPLIED, SHED, SUPERSEDED, DriverStateStore, as_naive_utc
+import pricing
+from pubsub import PubSub, Subscriber
+from dispatch import Dispatcher
+from surge import SurgePricer
+from cache import AsyncTTLCache
+from broker import build_broker
+from lease import MongoLease
+from export import encode_csv, encode_ndjson, gzip_chunks
+from change_stream import ChangeStreamConsumer, DriverChange, RatingChange, RideChange
+from metrics import MetricsRegistry, MongoCommandMetrics, RequestMetricsMiddleware
+from ride_events import InvalidTransition, earnings_bucket, previous_statuses, record_transition
+from verification_store import MemoryVerificationStore, MongoVerificationStore, RateLimitExceeded
 
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
+# Metrics served from /api/metrics
+metrics_registry = MetricsRegistry()
+
 # MongoDB connection
 mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
+client = AsyncIOMotorClient(mongo_url, event_listeners=[MongoCommandMetrics(metrics_registry)])
 db = client[os.environ['DB_NAME']]
 
+# 'memory' answers proximity queries from the process-local index, 'mongo' pushes them down as $geoNear
+GEO_BACKEND = os.environ.get('GEO_BACKEND', 'memory')
+
 # Create the main app without a prefix
 app = FastAPI()
 
+def finite_json(value):
+    """value with NaN and infinite floats as strings, JSON has no literal for them"""
+    if isinstance(value, float) and not math.isfinite(value):
+        return str(value)
+    if isinstance(value, dict):
+        return {key: finite_json(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [finite_json(item) for item in value]
+    return value
+
+@app.exception_handler(RequestValidationError)
+async def request_validation_error(request, exc: RequestValidationError):
+    # The default handler echoes the rejected input and fails to encode a NaN coordinate
+    return JSONResponse(status_code=422, content={"detail": finite_json(jsonable_encoder(exc.errors()))})
+
 # Create a router with the /api prefix
 api_router = APIRouter(prefix="/api")
 
 
 # Location Model
 class Location(BaseModel):
-    latitude: float
-    longitude: float
+    latitude: float = Field(ge=-90, le=90, allow_inf_nan=False)
+    longitude: float = Field(ge=-180, le=180, allow_inf_nan=False)
     address: Optional[str] = None
 
 # Vehicle Model
@@ -74,13 +125,44 @@ class Driver(BaseModel):
     location: Optional[Location] = None
     vehicle: Optional[Vehicle] = None
     rating: float = 5.0
+    ratingSum: float = 0.0
+    ratingCount: int = 0
     isOnline: bool = False
     totalRides: int = 0
     earnings: float = 0.0
 
+    @model_validator(mode='after')
+    def derive_rating(self):
+        # rating is the running average kept by create_rating, 5.0 until the first one
+        if self.ratingCount:
+            self.rating = round(self.ratingSum / self.ratingCount, 1)
+        return self
+
+class DriverPin(BaseModel):
+    """Just enough of a driver to draw it on the map"""
+    id: str
+    name: Optional[str] = None
+    location: Optional[Location] = None
+    rating: float = 5.0
+
 class DriverLocationUpdate(BaseModel):
-    latitude: float
-    longitude: float
+    latitude: float = Field(ge=-90, le=90, allow_inf_nan=False)
+    longitude: float = Field(ge=-180, le=180, allow_inf_nan=False)
+
+class DriverLocationReport(BaseModel):
+    driverId: str
+    latitude: float = Field(ge=-90, le=90, allow_inf_nan=False)
+    longitude: float = Field(ge=-180, le=180, allow_inf_nan=False)
+    timestamp: Optional[datetime] = None
+
+    @field_validator('timestamp')
+    @classmethod
+    def timestamp_as_naive_utc(cls, value: Optional[datetime]) -> Optional[datetime]:
+        # Reports may carry an offset, stored state is naive UTC
+        return as_naive_utc(value) if value is not None else None
+
+class DriverLocationBatch(BaseModel):
+    updates: List[DriverLocationReport] = Field(max_length=10000)
 
 class DriverStatusUpdate(BaseModel):
     isOnline: bool
@@ -94,19 +176,94 @@ class Ride(BaseModel):
     destination: Location
     status: str = 'requested'  # 'requested' | 'accepted' | 'driverArriving' | 'inProgress' | 'completed' | 'cancelled'
     fare: float = 0.0
+    surgeMultiplier: float = 1.0
     distance: float = 0.0
     duration: str = "0 min"
     createdAt: datetime = Field(default_factory=datetime.utcnow)
     completedAt: Optional[datetime] = None
 
+class RideSummary(BaseModel):
+    """Fields shown in ride lists"""
+    id: str
+    status: str
+    pickup: Location
+    destination: Location
+    fare: float = 0.0
+    distance: float = 0.0
+    createdAt: datetime
+
+class RidePage(BaseModel):
+    items: List[Union[Ride, RideSummary]]
+    nextCursor: Optional[str] = None
+
 class RideCreate(BaseModel):
     pickup: Location
     destination: Location
 
+class FareQuoteTrip(BaseModel):
+    pickupLatitude: float = Field(ge=-90, le=90, allow_inf_nan=False)
+    pickupLongitude: float = Field(ge=-180, le=180, allow_inf_nan=False)
+    destinationLatitude: float = Field(ge=-90, le=90, allow_inf_nan=False)
+    destinationLongitude: float = Field(ge=-180, le=180, allow_inf_nan=False)
+
+class FareQuoteBatch(BaseModel):
+    trips: List[FareQuoteTrip] = Field(max_length=100000)
+    # Optional tariff overrides for previewing pricing changes
+    pricePerMile: float = pricing.PRICE_PER_MILE
+    minimumFare: float = pricing.MINIMUM_FARE
+
+class FareQuoteResult(BaseModel):
+    distances: List[float]
+    fares: List[float]
+    durations: List[int]
+
+class HeatmapCell(BaseModel):
+    latitude: float  # south-west corner of the cell
+    longitude: float
+    demand: int
+    supply: int
+    multiplier: float
+
+class Heatmap(BaseModel):
+    cellSizeDeg: float
+    updatedAt: Optional[datetime] = None
+    cells: List[HeatmapCell]
+
 class RideUpdate(BaseModel):
     status: str
     driverId: Optional[str] = None
 
+class RideEvent(BaseModel):
+    id: str
+    rideId: str
+    fromStatus: Optional[str] = None
+    status: str
+    riderId: Optional[str] = None
+    driverId: Optional[str] = None
+    fare: float = 0.0
+    distance: float = 0.0
+    createdAt: datetime
+
+class DriverEarnings(BaseModel):
+    driverId: str
+    period: str
+    bucket: str
+    earnings: float = 0.0
+    rides: int = 0
+    distance: float = 0.0
+
+class DailyRideStats(BaseModel):
+    date: str
+    requested: int = 0
+    accepted: int = 0
+    driverArriving: int = 0
+    inProgress: int = 0
+    completed: int = 0
+    cancelled: int = 0
+    revenue: float = 0.0
+    distance: float = 0.0
+    timeToAcceptTotal: float = 0.0
+
 # Rating Model
 class Rating(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
@@ -117,6 +274,10 @@ class Rating(BaseModel):
     comment: Optional[str] = None
     createdAt: datetime = Field(default_factory=datetime.utcnow)
 
+class RatingPage(BaseModel):
+    items: List[Rating]
+    nextCursor: Optional[str] = None
+
 class RatingCreate(BaseModel):
     rideId: str
     ratedId: str
@@ -127,50 +288,443 @@ class RatingCreate(BaseModel):
 def generate_verification_code():
     return ''.join(random.choices(string.digits, k=6))
 
-# Store verification codes in memory (in production, use Redis)
-verification_codes = {}
+# Verification codes: 'memory' is per-process, 'mongo' is shared by all workers
+def build_verification_store():
+    options = dict(
+        ttl_seconds=int(os.environ.get('VERIFICATION_CODE_TTL', '300')),
+        max_sends=int(os.environ.get('VERIFICATION_MAX_SENDS', '5')),
+        window_seconds=int(os.environ.get('VERIFICATION_SEND_WINDOW', '600')),
+    )
+    if os.environ.get('VERIFICATION_STORE', 'memory') == 'mongo':
+        return MongoVerificationStore(db, **options)
+    return MemoryVerificationStore(**options)
+
+verification_store = build_verification_store()
+
+# Live driver position and online status, checkpointed to db.drivers in the background
+driver_states = DriverStateStore(
+    checkpoint_interval_ms=int(os.environ.get('DRIVER_CHECKPOINT_INTERVAL_MS', '1000')),
+    max_dirty=int(os.environ.get('DRIVER_MAX_DIRTY', '100000')),
+)
+DRIVER_STATE_PROJECTION = {
+    "_id": False, "id": True, "isOnline": True, "location": True, "reportedAt": True, "statusAt": True,
+}
+
+async def ensure_driver_states(driver_ids: List[str]):
+    """Load drivers registered by another process into the state store"""
+    missing = [driver_id for driver_id in set(driver_ids) if driver_id not in driver_states]
+    if missing:
+        async for driver in db.drivers.find({"id": {"$in": missing}}, DRIVER_STATE_PROJECTION):
+            driver_states.load(driver)
+
+def with_live_state(driver: dict) -> dict:
+    """Overlay the in-memory position and status on a stored driver document"""
+    state = driver_states.get(driver["id"])
+    if state is None:
+        return driver
+    return {**driver, "isOnline": state.is_online, "location": state.location()}
+
+# Push channel fan-out: ride:<id>, driver:<id> and area:<row>:<col> topics
+events = PubSub()
+AREA_CELL_DEG = 0.05
+
+def area_topic(latitude: float, longitude: float) -> str:
+    return f"area:{math.floor(latitude / AREA_CELL_DEG)}:{math.floor(longitude / AREA_CELL_DEG)}"
+
+def area_topics_around(latitude: float, longitude: float) -> List[str]:
+    row = math.floor(latitude / AREA_CELL_DEG)
+    col = math.floor(longitude / AREA_CELL_DEG)
+    return [f"area:{row + dr}:{col + dc}" for dr in (-1, 0, 1) for dc in (-1, 0, 1)]
+
+def publish_driver_location(driver_id: str, latitude: float, longitude: float):
+    events.publish(f"driver:{driver_id}", {
+        "type": "driver.location",
+        "driverId": driver_id,
+        "latitude": latitude,
+        "longitude": longitude,
+    })
+
+# Batches requested rides and offers them to the closest free drivers
+def send_ride_offer(driver_id: str, ride_id: str, distance: float):
+    events.publish(f"offers:{driver_id}", {
+        "type": "ride.offer",
+        "rideId": ride_id,
+        "pickupDistance": round(distance, 3),
+        "expiresIn": dispatcher.offer_timeout,
+    })
+
+dispatcher = Dispatcher(
+    driver_states.index,
+    send_ride_offer,
+    batch_interval_ms=int(os.environ.get('DISPATCH_INTERVAL_MS', '300')),
+    offer_timeout_s=float(os.environ.get('DISPATCH_OFFER_TIMEOUT', '15')),
+    search_radius_km=float(os.environ.get('DISPATCH_RADIUS_KM', '5')),
+)
+ACTIVE_RIDE_STATUSES = ('accepted', 'driverArriving', 'inProgress')
+
+# Rides in 'requested' status, served to the driver feed without touching Mongo
+open_rides = {}
+open_ride_index = GeoGridIndex()
+
+# Fare multipliers per area from open rides vs online drivers, refreshed in the background
+surge_pricer = SurgePricer(
+    open_ride_index,
+    driver_states.index,
+    refresh_interval_s=float(os.environ.get('SURGE_REFRESH_S', '5')),
+    max_multiplier=float(os.environ.get('SURGE_MAX', '3.0')),
+    sensitivity=float(os.environ.get('SURGE_SENSITIVITY', '0.5')),
+)
+
+# Rides that recently left 'requested', so a late change event cannot reopen them
+closed_rides = OrderedDict()
+CLOSED_RIDES_KEPT = 10000
+
+def sync_open_ride(ride: Optional[dict]):
+    """Track a ride in the open feed while it is requested, drop it otherwise"""
+    if not ride:
+        return
+    if ride.get("status") == "requested":
+        open_rides[ride["id"]] = ride
+        open_ride_index.upsert(ride["id"], ride["pickup"]["latitude"], ride["pickup"]["longitude"])
+    else:
+        open_rides.pop(ride["id"], None)
+        open_ride_index.remove(ride["id"])
+        closed_rides[ride["id"]] = True
+        closed_rides.move_to_end(ride["id"])
+        if len(closed_rides) > CLOSED_RIDES_KEPT:
+            closed_rides.popitem(last=False)
+
+def track_ride(ride: dict):
+    """Bring the open-ride feed and the dispatcher in line with a ride's status"""
+    sync_open_ride(ride)
+    if ride["status"] == "requested":
+        dispatcher.submit(ride["id"], ride["pickup"]["latitude"], ride["pickup"]["longitude"])
+    elif ride["status"] == "accepted":
+        dispatcher.resolve(ride["id"], ride.get("driverId"))
+    elif ride["status"] in ('completed', 'cancelled'):
+        dispatcher.resolve(ride["id"])
+        if ride.get("driverId"):
+            dispatcher.release(ride["driverId"])
+
+def ride_changed(ride: dict):
+    track_ride(ride)
+    broker.publish("ride", ride)
+
+# Read-through caches for profile lookups, writers invalidate explicitly
+user_cache = AsyncTTLCache(
+    maxsize=int(os.environ.get('USER_CACHE_SIZE', '10000')),
+    ttl_seconds=float(os.environ.get('USER_CACHE_TTL', '30')),
+)
+driver_cache = AsyncTTLCache(
+    maxsize=int(os.environ.get('DRIVER_CACHE_SIZE', '10000')),
+    ttl_seconds=float(os.environ.get('DRIVER_CACHE_TTL', '30')),
+)
+
+# Workers mirror each other's in-memory state through a broker: 'local' for a
+# single worker, 'mongo' (capped collection) or 'redis' when running several
+STATE_BACKEND = os.environ.get('STATE_BACKEND', 'local')
+broker = build_broker(
+    STATE_BACKEND,
+    db=db,
+    redis_url=os.environ.get('REDIS_URL'),
+    flush_interval_ms=int(os.environ.get('BROKER_FLUSH_MS', '50')),
+)
+
+def cache_key(key):
+    # Tuple keys come back from the broker as lists
+    return tuple(key) if isinstance(key, list) else key
+
+def mirror_decline(fields):
+    if dispatcher.active:
+        dispatcher.decline(*fields)
+
+events.forward = lambda topic, message: broker.publish("event", [topic, message])
+user_cache.forward = lambda keys: broker.publish("user_cache", list(keys))
+driver_cache.forward = lambda keys: broker.publish("driver_cache", list(keys))
+driver_states.forward = lambda fields: broker.publish("driver", fields)
+broker.on("event", lambda message: events.deliver(*message))
+broker.on("user_cache", lambda keys: user_cache.discard(*map(cache_key, keys)))
+broker.on("driver_cache", lambda keys: driver_cache.discard(*map(cache_key, keys)))
+broker.on("driver", lambda fields: driver_states.apply_remote(*fields))
+broker.on("ride", track_ride)
+broker.on("decline", mirror_decline)
+
+# Every worker tracks the ride pool, only the holder of this lease sends offers
+dispatch_lease = None
+if broker.name != 'local':
+    dispatcher.active = False
+    dispatch_lease = MongoLease(
+        db.leases,
+        "dispatcher",
+        broker.worker_id,
+        ttl_s=float(os.environ.get('DISPATCH_LEASE_TTL', '10')),
+        on_change=lambda held: setattr(dispatcher, "active", held),
+    )
+
+# Optional change-stream feed (needs a replica set) so writes made outside this
+# API, e.g. by admin scripts, also reach the caches and the open-ride feed
+CHANGE_STREAMS = os.environ.get('CHANGE_STREAMS', 'off') == 'on'
+CHANGE_STREAM_CONSUMER = os.environ.get('CHANGE_STREAM_CONSUMER', 'api')
+# 'whenAvailable' gives deletes the deleted document on MongoDB 6.0+ with pre-images enabled
+CHANGE_STREAM_PRE_IMAGES = os.environ.get('CHANGE_STREAM_PRE_IMAGES', 'whenAvailable')
+change_consumer = ChangeStreamConsumer(
+    db,
+    # Workers each keep a resume token, a single worker keeps one name across restarts
+    name=CHANGE_STREAM_CONSUMER if broker.name == 'local' else f"{CHANGE_STREAM_CONSUMER}-{broker.worker_id}",
+    full_document_before_change=None if CHANGE_STREAM_PRE_IMAGES == 'off' else CHANGE_STREAM_PRE_IMAGES,
+)
+
+def forget_ride(ride_id: str, driver_id: Optional[str] = None):
+    """Drop a ride deleted from the database from the feed and the dispatcher"""
+    open_rides.pop(ride_id, None)
+    open_ride_index.remove(ride_id)
+    dispatcher.resolve(ride_id)
+    if driver_id:
+        dispatcher.release(driver_id)
+
+async def resync_open_rides():
+    """Drop open rides that are gone, for a delete that came without the document"""
+    ride_ids = list(open_rides)
+    still_open = set(await db.rides.distinct("id", {"id": {"$in": ride_ids}, "status": "requested"}))
+    for ride_id in ride_ids:
+        if ride_id not in still_open:
+            forget_ride(ride_id)
+
+async def resync_driver_states():
+    """Drop drivers that are gone, for a delete that came without the document"""
+    existing = set(await db.drivers.distinct("id"))
+    for driver_id in driver_states.ids():
+        if driver_id not in existing:
+            driver_states.remove(driver_id)
+            driver_cache.discard(driver_id)
+
+async def on_ride_change(event: RideChange):
+    ride = event.document
+    if event.operation == 'delete':
+        if ride is None:
+            await resync_open_rides()
+        else:
+            forget_ride(ride["id"], ride.get("driverId"))
+        return
+    if ride is None:
+        return
+    # An insert event still shows the ride as requested after it was accepted here
+    if ride["status"] == "requested" and ride["id"] in closed_rides:
+        return
+    track_ride(ride)
+
+async def on_driver_change(event: DriverChange):
+    driver = event.document
+    if event.operation == 'delete':
+        if driver is None:
+            await resync_driver_states()
+        else:
+            driver_states.remove(driver["id"])
+            driver_cache.discard(driver["id"])
+        return
+    if driver is None:
+        return
+
+    fields = event.updated_fields
+    # Checkpoints always write reportedAt or statusAt, anything else was written outside the API
+    checkpoint = "reportedAt" in fields or "statusAt" in fields
+    state = driver_states.get(driver["id"])
+    if state is None:
+        # New to this worker, the looked-up document is the stored state
+        driver_states.load(driver)
+        driver_cache.discard(driver["id"])
+        return
+    if event.operation == 'insert':
+        # Registered through this API, the live state may already be ahead of the document
+        return
+    if (
+        checkpoint
+        and state is not None
+        and state.reported_at == driver.get("reportedAt")
+        and state.status_at == driver.get("statusAt")
+    ):
+        # Our own checkpoint, or one whose change the broker already brought here
+        return
+
+    full = event.operation != 'update'
+    moved = full or any(field.split(".")[0] == "location" for field in fields)
+    location = (driver.get("location") or {}) if moved else {}
+    # Unversioned changes are applied as they are, checkpoints only when newer
+    driver_states.apply_remote(
+        driver["id"],
+        location.get("latitude"),
+        location.get("longitude"),
+        driver.get("isOnline") if full or "isOnline" in fields else None,
+        driver.get("reportedAt") if checkpoint else None,
+        driver.get("statusAt") if checkpoint else None,
+    )
+    driver_cache.discard(driver["id"])
+
+def on_rating_change(event: RatingChange):
+    if event.document is not None:
+        driver_cache.discard(event.document["ratedId"])
+
+change_consumer.on(RideChange, on_ride_change)
+change_consumer.on(DriverChange, on_driver_change)
+change_consumer.on(RatingChange, on_rating_change)
+
+async def find_user_by_phone(phone: str) -> Optional[dict]:
+    return await user_cache.get_or_load(
+        ("phone", phone), lambda: db.users.find_one({"phone": phone}, FULL_PROJECTION)
+    )
+
+async def find_driver(driver_id: str) -> Optional[dict]:
+    return await driver_cache.get_or_load(
+        driver_id, lambda: db.drivers.find_one({"id": driver_id}, FULL_PROJECTION)
+    )
+
+async def find_drivers(driver_ids: List[str]) -> dict:
+    """Driver documents by id, cache misses are read with a single query"""
+    found = {}
+    missing = []
+    for driver_id in driver_ids:
+        hit, driver = driver_cache.peek(driver_id)
+        if not hit:
+            missing.append(driver_id)
+        elif driver:
+            found[driver_id] = driver
+    if missing:
+        async for driver in db.drivers.find({"id": {"$in": missing}}, FULL_PROJECTION):
+            driver_cache.set(driver["id"], driver)
+            found[driver["id"]] = driver
+    return found
+
+# Per-view projections so list endpoints only read what they return
+ListView = Literal['full', 'summary']
+FULL_PROJECTION = {"_id": False, "locationPoint": False, "pickupPoint": False}
+RIDE_SUMMARY_PROJECTION = {
+    "_id": False, "id": True, "status": True, "pickup": True, "destination": True,
+    "fare": True, "distance": True, "createdAt": True,
+}
+DRIVER_PIN_PROJECTION = {
+    "_id": False, "id": True, "name": True, "location": True,
+    "rating": True, "ratingSum": True, "ratingCount": True,
+}
+
+def ride_view(view: ListView):
+    """Projection and response model for a ride list view"""
+    if view == 'summary':
+        return RIDE_SUMMARY_PROJECTION, RideSummary
+    return FULL_PROJECTION, Ride
+
+def driver_pin(driver: dict) -> dict:
+    """Driver document with the rating derived the way the Driver model does it"""
+    rating = driver.get("rating", 5.0)
+    if driver.get("ratingCount"):
+        rating = round(driver["ratingSum"] / driver["ratingCount"], 1)
+    return {**driver, "rating": rating}
+
+# List endpoints validate Mongo documents once and serialize them to JSON bytes
+# in pydantic-core, instead of building models that FastAPI validates again
+# against response_model and runs through jsonable_encoder
+_list_adapters = {}
+
+def list_adapter(model) -> TypeAdapter:
+    adapter = _list_adapters.get(model)
+    if adapter is None:
+        adapter = _list_adapters[model] = TypeAdapter(List[model])
+    return adapter
+
+def list_response(model, docs: List[dict]) -> Response:
+    adapter = list_adapter(model)
+    return Response(adapter.dump_json(adapter.validate_python(docs)), media_type="application/json")
+
+def page_response(page_model, model, docs: List[dict], next_cursor: Optional[str]) -> Response:
+    items = list_adapter(model).validate_python(docs)
+    page = page_model.model_construct(items=items, nextCursor=next_cursor)
+    return Response(page.model_dump_json(), media_type="application/json")
+
+# GeoJSON point stored next to plain lat/lon sub-documents for 2dsphere queries
+def geo_point(latitude: float, longitude: float) -> dict:
+    return {"type": "Point", "coordinates": [longitude, latitude]}
+
+async def geo_near(
+    collection,
+    latitude: float,
+    longitude: float,
+    radius: float,
+    query: dict,
+    limit: int,
+    projection: Optional[dict] = None,
+):
+    """Run a $geoNear aggregation, nearest first, radius in km"""
+    pipeline = [
+        {
+            "$geoNear": {
+                "near": geo_point(latitude, longitude),
+                "distanceField": "distanceMeters",
+                "maxDistance": radius * 1000,
+                "spherical": True,
+                "query": query,
+            }
+        },
+        {"$limit": limit},
+    ]
+    if projection:
+        pipeline.append({"$project": projection})
+    return await collection.aggregate(pipeline).to_list(limit)
+
+# Keyset pagination over (createdAt, id), newest first
+def encode_cursor(doc: dict) -> str:
+    raw = json.dumps([doc["createdAt"].isoformat(), doc["id"]])
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+def decode_cursor(cursor: str):
+    try:
+        created_at, doc_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return datetime.fromisoformat(created_at), doc_id
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+async def fetch_page(collection, query: dict, cursor: Optional[str], limit: int, projection: Optional[dict] = None):
+    """Return up to ``limit`` documents after ``cursor`` and the cursor for the next page"""
+    if cursor:
+        created_at, doc_id = decode_cursor(cursor)
+        query = {
+            **query,
+            "$or": [
+                {"createdAt": {"$lt": created_at}},
+                {"createdAt": created_at, "id": {"$lt": doc_id}},
+            ],
+        }
+    docs = await collection.find(query, projection).sort([("createdAt", -1), ("id", -1)]).limit(limit + 1).to_list(limit + 1)
+    next_cursor = encode_cursor(docs[limit - 1]) if len(docs) > limit else None
+    return docs[:limit], next_cursor
 
 # Helper function to calculate fare
 def calculate_fare(distance: float) -> float:
-    # Convert distance from km to miles (1 km = 0.621371 miles)
-    distance_in_miles = distance * 0.621371
-    
-    # Calculate fare: $1.00 per mile
-    calculated_fare = distance_in_miles * 1.00
-    
-    # Apply minimum fare of $7.00
-    final_fare = max(7.00, calculated_fare)
-    
-    return round(final_fare, 2)
+    return float(pricing.fare_for_distance(distance))
 
-# Helper function to calculate distance (simplified)
+# Helper function to calculate distance along the earth's surface, in km
 def calculate_distance(pickup: Location, destination: Location) -> float:
-    # Simple distance calculation (in production, use proper geolocation)
-    lat_diff = pickup.latitude - destination.latitude
-    lon_diff = pickup.longitude - destination.longitude
-    return ((lat_diff ** 2 + lon_diff ** 2) ** 0.5) * 111  # Rough conversion to km
+    return haversine_km(pickup.latitude, pickup.longitude, destination.latitude, destination.longitude)
 
 # Authentication Routes
 @api_router.post("/auth/send-code")
 async def send_verification_code(user_data: UserLogin):
     """Send verification code (mocked)"""
     code = "123456"  # Mock code for testing
-    verification_codes[user_data.phone] = code
+    try:
+        await verification_store.issue(user_data.phone, code)
+    except RateLimitExceeded:
+        raise HTTPException(status_code=429, detail="Too many verification codes requested")
     print(f"Verification code for {user_data.phone}: {code}")  # In production, send SMS
     return {"message": "Verification code sent", "success": True}
 
 @api_router.post("/auth/verify-code")
 async def verify_code(verify_data: VerifyCode):
     """Verify code and return user if exists"""
-    stored_code = verification_codes.get(verify_data.phone)
-    if not stored_code or stored_code != verify_data.code:
+    # Codes are single use, a match also removes it
+    if not await verification_store.consume(verify_data.phone, verify_data.code):
         raise HTTPException(status_code=400, detail="Invalid verification code")
     
-    # Remove used code
-    del verification_codes[verify_data.phone]
-    
     # Check if user exists
-    existing_user = await db.users.find_one({"phone": verify_data.phone})
+    existing_user = await find_user_by_phone(verify_data.phone)
     if existing_user:
         return {"user": User(**existing_user), "isNewUser": False}
     
@@ -180,24 +734,32 @@ async def verify_code(verify_data: VerifyCode):
 async def register_user(user_data: UserCreate):
     """Register new user"""
     # Check if user already exists
-    existing_user = await db.users.find_one({"phone": user_data.phone})
+    existing_user = await find_user_by_phone(user_data.phone)
     if existing_user:
         raise HTTPException(status_code=400, detail="User already exists")
     
     user = User(**user_data.dict())
-    await db.users.insert_one(user.dict())
+    try:
+        await db.users.insert_one(user.dict())
+    except DuplicateKeyError:
+        # Lost a race with another registration for the same phone
+        raise HTTPException(status_code=400, detail="User already exists")
+    finally:
+        user_cache.invalidate(("phone", user.phone))
     
     # If driver, create driver profile
     if user_data.userType == 'driver':
         driver = Driver(id=user.id, phone=user.phone)
         await db.drivers.insert_one(driver.dict())
+        driver_cache.invalidate(driver.id)
+        driver_states.load(driver.dict())
     
     return user
 
 @api_router.get("/auth/user/{phone}")
 async def get_user_by_phone(phone: str):
     """Get user by phone number"""
-    user = await db.users.find_one({"phone": phone})
+    user = await find_user_by_phone(phone)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     return User(**user)
@@ -208,7 +770,8 @@ async def create_ride(ride_data: RideCreate, rider_id: str):
     """Create a new ride request"""
     # Calculate distance and fare
     distance = calculate_distance(ride_data.pickup, ride_data.destination)
-    fare = calculate_fare(distance)
+    surge = surge_pricer.multiplier(ride_data.pickup.latitude, ride_data.pickup.longitude)
+    fare = round(calculate_fare(distance) * surge, 2)
     
     ride = Ride(
         riderId=rider_id,
@@ -216,29 +779,70 @@ async def create_ride(ride_data: RideCreate, rider_id: str):
         destination=ride_data.destination,
         distance=distance,
         fare=fare,
-        duration=f"{int(distance * 2)} min"  # Rough estimate
+        surgeMultiplier=surge,
+        duration=f"{int(pricing.duration_minutes(distance))} min"  # Rough estimate
     )
     
-    await db.rides.insert_one(ride.dict())
+    ride_doc = ride.dict()
+    ride_doc["pickupPoint"] = geo_point(ride.pickup.latitude, ride.pickup.longitude)
+    await db.rides.insert_one(ride_doc)
+    await record_transition(db, ride_doc, None, "requested", at=ride.createdAt)
+    ride_changed(ride.dict())
+    events.publish(
+        area_topic(ride.pickup.latitude, ride.pickup.longitude),
+        {"type": "ride.requested", "ride": ride.dict()},
+    )
     return ride
 
-@api_router.get("/rides/available")
-async def get_available_rides():
-    """Get rides waiting for drivers"""
-    rides = await db.rides.find({"status": "requested"}).to_list(50)
-    return [Ride(**ride) for ride in rides]
+@api_router.get("/rides/available", response_model=List[Union[Ride, RideSummary]])
+async def get_available_rides(
+    latitude: Optional[float] = Query(None, ge=-90, le=90, allow_inf_nan=False),
+    longitude: Optional[float] = Query(None, ge=-180, le=180, allow_inf_nan=False),
+    radius: float = 5.0,
+    limit: int = Query(50, ge=1, le=200),
+    view: ListView = 'full',
+):
+    """Get rides waiting for drivers, nearest pickups first when a position is given"""
+    projection, model = ride_view(view)
+    near = latitude is not None and longitude is not None
+    
+    if GEO_BACKEND == 'mongo':
+        if near:
+            rides = await geo_near(db.rides, latitude, longitude, radius, {"status": "requested"}, limit, projection)
+        else:
+            rides = await db.rides.find({"status": "requested"}, projection).sort("createdAt", 1).to_list(limit)
+        return list_response(model, rides)
+    
+    if near:
+        hits = open_ride_index.nearby(latitude, longitude, radius, limit=limit)
+        rides = [open_rides[ride_id] for _, ride_id in hits]
+    else:
+        rides = heapq.nsmallest(limit, open_rides.values(), key=lambda ride: ride["createdAt"])
+    return list_response(model, rides)
 
-@api_router.get("/rides/rider/{rider_id}")
-async def get_rider_rides(rider_id: str):
-    """Get all rides for a rider"""
-    rides = await db.rides.find({"riderId": rider_id}).sort("createdAt", -1).to_list(50)
-    return [Ride(**ride) for ride in rides]
+@api_router.get("/rides/rider/{rider_id}", response_model=RidePage)
+async def get_rider_rides(
+    rider_id: str,
+    cursor: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=200),
+    view: ListView = 'full',
+):
+    """Get a page of rides for a rider, newest first"""
+    projection, model = ride_view(view)
+    rides, next_cursor = await fetch_page(db.rides, {"riderId": rider_id}, cursor, limit, projection)
+    return page_response(RidePage, model, rides, next_cursor)
 
-@api_router.get("/rides/driver/{driver_id}")
-async def get_driver_rides(driver_id: str):
-    """Get all rides for a driver"""
-    rides = await db.rides.find({"driverId": driver_id}).sort("createdAt", -1).to_list(50)
-    return [Ride(**ride) for ride in rides]
+@api_router.get("/rides/driver/{driver_id}", response_model=RidePage)
+async def get_driver_rides(
+    driver_id: str,
+    cursor: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=200),
+    view: ListView = 'full',
+):
+    """Get a page of rides for a driver, newest first"""
+    projection, model = ride_view(view)
+    rides, next_cursor = await fetch_page(db.rides, {"driverId": driver_id}, cursor, limit, projection)
+    return page_response(RidePage, model, rides, next_cursor)
 
 @api_router.get("/rides/{ride_id}", response_model=Ride)
 async def get_ride(ride_id: str):
@@ -248,80 +852,241 @@ async def get_ride(ride_id: str):
         raise HTTPException(status_code=404, detail="Ride not found")
     return Ride(**ride)
 
+@api_router.get("/rides/{ride_id}/events", response_model=List[RideEvent])
+async def get_ride_events(ride_id: str):
+    """Status history of a ride, oldest first"""
+    cursor = db.ride_events.find({"rideId": ride_id}, {"_id": False}).sort("createdAt", 1)
+    return [RideEvent(**event) async for event in cursor]
+
 @api_router.put("/rides/{ride_id}")
 async def update_ride(ride_id: str, update_data: RideUpdate):
     """Update ride status"""
-    await db.rides.update_one(
-        {"id": ride_id},
-        {"$set": update_data.dict(exclude_unset=True)}
+    changes = update_data.dict(exclude_unset=True)
+    now = datetime.utcnow()
+    if update_data.status == 'completed':
+        changes["completedAt"] = now
+    try:
+        allowed_from = previous_statuses(update_data.status)
+    except InvalidTransition as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    # The status guard makes concurrent updates race safely, only one of them applies
+    previous = await db.rides.find_one_and_update(
+        {"id": ride_id, "status": {"$in": allowed_from}},
+        {"$set": changes},
+        projection=FULL_PROJECTION,
+        return_document=ReturnDocument.BEFORE,
     )
+    if not previous:
+        current = await db.rides.find_one({"id": ride_id}, {"status": True})
+        if not current:
+            raise HTTPException(status_code=404, detail="Ride not found")
+        raise HTTPException(status_code=400, detail=str(InvalidTransition(current["status"], update_data.status)))
+
+    ride = {**previous, **changes}
+    await record_transition(db, ride, previous["status"], update_data.status, at=now)
+    if update_data.status == 'completed' and ride.get("driverId"):
+        driver_cache.invalidate(ride["driverId"])
+    ride_changed(ride)
+    events.publish(f"ride:{ride_id}", {"type": "ride.updated", "rideId": ride_id, **update_data.dict(exclude_unset=True)})
+    if previous["status"] == 'requested':
+        # Drivers following the pickup area drop the ride from their feed
+        pickup = ride["pickup"]
+        events.publish(
+            area_topic(pickup["latitude"], pickup["longitude"]),
+            {"type": "ride.cancelled" if update_data.status == 'cancelled' else "ride.taken", "rideId": ride_id},
+        )
     return {"message": "Ride updated successfully"}
 
+# Fare Routes
+@api_router.post("/fares/quote:batch", response_model=FareQuoteResult)
+async def quote_fares_batch(batch: FareQuoteBatch):
+    """Price many pickup/destination pairs in one call, results in request order"""
+    coordinates = np.array(
+        [
+            (trip.pickupLatitude, trip.pickupLongitude, trip.destinationLatitude, trip.destinationLongitude)
+            for trip in batch.trips
+        ],
+        dtype=np.float64,
+    ).reshape(-1, 4)
+    quoted = pricing.quote(
+        coordinates[:, 0],
+        coordinates[:, 1],
+        coordinates[:, 2],
+        coordinates[:, 3],
+        price_per_mile=batch.pricePerMile,
+        minimum_fare=batch.minimumFare,
+    )
+    return FareQuoteResult(
+        distances=quoted["distance"].tolist(),
+        fares=quoted["fare"].tolist(),
+        durations=quoted["duration"].tolist(),
+    )
+
+@api_router.get("/pricing/heatmap", response_model=Heatmap)
+async def get_pricing_heatmap():
+    """Open rides, online drivers and the surge multiplier of every occupied cell"""
+    return Heatmap(
+        cellSizeDeg=surge_pricer.cell_size_deg,
+        updatedAt=surge_pricer.updated_at,
+        cells=surge_pricer.heatmap(),
+    )
+
 # Driver Routes
 @api_router.put("/drivers/{driver_id}/location")
 async def update_driver_location(driver_id: str, location_data: DriverLocationUpdate):
     """Update driver location"""
-    location = Location(
-        latitude=location_data.latitude,
-        longitude=location_data.longitude
-    )
+    await ensure_driver_states([driver_id])
+    if driver_id not in driver_states:
+        raise HTTPException(status_code=404, detail="Driver not found")
     
-    await db.drivers.update_one(
-        {"id": driver_id},
-        {"$set": {"location": location.dict()}}
-    )
+    result = driver_states.update_location(driver_id, location_data.latitude, location_data.longitude)
+    if result == SHED:
+        raise HTTPException(
+            status_code=503,
+            detail="Too many pending location updates, retry shortly",
+            headers={"Retry-After": "1"},
+        )
+    if result == APPLIED:
+        publish_driver_location(driver_id, location_data.latitude, location_data.longitude)
     return {"message": "Location updated successfully"}
 
+@api_router.post("/drivers/locations:batch")
+async def update_driver_locations_batch(batch: DriverLocationBatch):
+    """Apply location reports from many drivers, written to Mongo in bulk"""
+    await ensure_driver_states([report.driverId for report in batch.updates])
+    accepted = superseded = 0
+    for report in batch.updates:
+        result = driver_states.update_location(report.driverId, report.latitude, report.longitude, report.timestamp)
+        if result == SUPERSEDED:
+            superseded += 1
+        if result != APPLIED:
+            continue
+        accepted += 1
+        publish_driver_location(report.driverId, report.latitude, report.longitude)
+    
+    return {"accepted": accepted, "superseded": superseded, "dropped": len(batch.updates) - accepted - superseded}
+
+@api_router.get("/drivers/locations/stats")
+async def get_location_update_stats():
+    """Counters for location updates and their checkpoints to Mongo"""
+    return {"drivers": len(driver_states), "dirty": driver_states.dirty, **driver_states.stats}
+
 @api_router.put("/drivers/{driver_id}/status")
 async def update_driver_status(driver_id: str, status_data: DriverStatusUpdate):
     """Update driver online/offline status"""
-    await db.drivers.update_one(
-        {"id": driver_id},
-        {"$set": {"isOnline": status_data.isOnline}}
-    )
+    await ensure_driver_states([driver_id])
+    if not driver_states.set_online(driver_id, status_data.isOnline):
+        raise HTTPException(status_code=404, detail="Driver not found")
     return {"message": "Status updated successfully"}
 
-@api_router.get("/drivers/nearby")
-async def get_nearby_drivers(latitude: float, longitude: float, radius: float = 5.0):
-    """Get nearby online drivers"""
-    # Simple proximity search (in production, use geospatial queries)
-    all_drivers = await db.drivers.find({"isOnline": True}).to_list(100)
-    nearby_drivers = []
+@api_router.get("/drivers/nearby", response_model=List[Union[Driver, DriverPin]])
+async def get_nearby_drivers(
+    latitude: float = Query(ge=-90, le=90, allow_inf_nan=False),
+    longitude: float = Query(ge=-180, le=180, allow_inf_nan=False),
+    radius: float = 5.0,
+    limit: int = Query(50, ge=1, le=200),
+    view: ListView = 'full',
+):
+    """Get the nearest online drivers, closest first"""
+    if view == 'summary':
+        model, prepare = DriverPin, driver_pin
+    else:
+        model, prepare = Driver, (lambda driver: driver)
     
-    user_location = Location(latitude=latitude, longitude=longitude)
+    if GEO_BACKEND == 'mongo':
+        projection = DRIVER_PIN_PROJECTION if view == 'summary' else FULL_PROJECTION
+        drivers = await geo_near(db.drivers, latitude, longitude, radius, {"isOnline": True}, limit, projection)
+        return list_response(model, [prepare(driver) for driver in drivers])
     
-    for driver_data in all_drivers:
-        if driver_data.get('location'):
-            driver_location = Location(**driver_data['location'])
-            distance = calculate_distance(user_location, driver_location)
-            if distance <= radius:
-                nearby_drivers.append(Driver(**driver_data))
+    hits = driver_states.nearby(latitude, longitude, radius, limit=limit)
+    if not hits:
+        return []
     
-    return nearby_drivers
+    driver_ids = [state.driver_id for _, state in hits]
+    drivers_by_id = await find_drivers(driver_ids)
+    return list_response(model, [
+        prepare(with_live_state(drivers_by_id[driver_id]))
+        for driver_id in driver_ids
+        if driver_id in drivers_by_id
+    ])
+
+@api_router.post("/drivers/{driver_id}/offers/{ride_id}/decline")
+async def decline_ride_offer(driver_id: str, ride_id: str):
+    """Decline a dispatch offer so the ride is offered to the next driver"""
+    if not dispatcher.active:
+        # Offers live on the worker holding the dispatch lease
+        broker.publish("decline", [ride_id, driver_id])
+        return {"message": "Offer declined"}
+    if not dispatcher.decline(ride_id, driver_id):
+        raise HTTPException(status_code=404, detail="No open offer for this driver")
+    return {"message": "Offer declined"}
+
+@api_router.get("/dispatch/stats")
+async def get_dispatch_stats():
+    """Dispatcher queue sizes and counters"""
+    return {
+        "active": dispatcher.active,
+        "waiting": dispatcher.waiting,
+        "outstandingOffers": dispatcher.outstanding,
+        **dispatcher.stats,
+    }
 
 @api_router.get("/drivers/{driver_id}", response_model=Driver)
 async def get_driver(driver_id: str):
     """Get driver by ID"""
-    driver = await db.drivers.find_one({"id": driver_id})
+    driver = await find_driver(driver_id)
     if not driver:
         raise HTTPException(status_code=404, detail="Driver not found")
-    return Driver(**driver)
+    return Driver(**with_live_state(driver))
+
+@api_router.get("/drivers/{driver_id}/earnings", response_model=DriverEarnings)
+async def get_driver_earnings(
+    driver_id: str,
+    period: Literal['day', 'week', 'all'] = 'day',
+    date: Optional[datetime] = None,
+):
+    """Completed-ride earnings for the UTC day or ISO week containing ``date`` (default now), or all time.
+
+    Buckets are cut in UTC, a ``date`` with an offset is converted first.
+    """
+    bucket = earnings_bucket(period, as_naive_utc(date) if date else datetime.utcnow())
+    totals = await db.driver_earnings.find_one(
+        {"driverId": driver_id, "period": period, "bucket": bucket}, {"_id": False}
+    )
+    if totals:
+        return DriverEarnings(**totals)
+    if not await find_driver(driver_id):
+        raise HTTPException(status_code=404, detail="Driver not found")
+    return DriverEarnings(driverId=driver_id, period=period, bucket=bucket)
 
 @api_router.put("/drivers/{driver_id}/accept-ride")
 async def accept_ride(driver_id: str, ride_id: str):
     """Driver accepts a ride"""
-    # Update ride status
-    await db.rides.update_one(
+    # Only the first driver matches the status guard, everyone else gets None back
+    updated_ride = await db.rides.find_one_and_update(
         {"id": ride_id, "status": "requested"},
-        {"$set": {"driverId": driver_id, "status": "accepted"}}
+        {"$set": {"driverId": driver_id, "status": "accepted"}},
+        return_document=ReturnDocument.AFTER,
     )
-    
-    # Check if update was successful
-    updated_ride = await db.rides.find_one({"id": ride_id})
-    if not updated_ride or updated_ride.get("driverId") != driver_id:
+    if not updated_ride:
         raise HTTPException(status_code=400, detail="Could not accept ride")
+    updated_ride.pop("_id", None)
     
-    return {"message": "Ride accepted successfully"}
+    await record_transition(db, updated_ride, "requested", "accepted")
+    ride_changed(updated_ride)
+    events.publish(f"ride:{ride_id}", {
+        "type": "ride.updated",
+        "rideId": ride_id,
+        "status": "accepted",
+        "driverId": driver_id,
+    })
+    pickup = updated_ride["pickup"]
+    events.publish(
+        area_topic(pickup["latitude"], pickup["longitude"]),
+        {"type": "ride.taken", "rideId": ride_id},
+    )
+    return {"message": "Ride accepted successfully", "ride": Ride(**updated_ride)}
 
 # Rating Routes
 @api_router.post("/ratings", response_model=Rating)
@@ -334,24 +1099,174 @@ async def create_rating(rating_data: RatingCreate, rater_id: str):
     
     await db.ratings.insert_one(rating.dict())
     
-    # Update average rating for the rated user
-    user_ratings = await db.ratings.find({"ratedId": rating_data.ratedId}).to_list(1000)
-    if user_ratings:
-        avg_rating = sum(r["rating"] for r in user_ratings) / len(user_ratings)
-        
-        # Update driver rating if it's a driver
-        await db.drivers.update_one(
-            {"id": rating_data.ratedId},
-            {"$set": {"rating": round(avg_rating, 1)}}
-        )
+    # Fold the new rating into the running totals for the rated driver
+    await db.drivers.update_one(
+        {"id": rating_data.ratedId},
+        {"$inc": {"ratingSum": rating_data.rating, "ratingCount": 1}}
+    )
+    driver_cache.invalidate(rating_data.ratedId)
     
     return rating
 
-@api_router.get("/ratings/{user_id}")
-async def get_user_ratings(user_id: str):
-    """Get ratings for a user"""
-    ratings = await db.ratings.find({"ratedId": user_id}).sort("createdAt", -1).to_list(100)
-    return [Rating(**rating) for rating in ratings]
+@api_router.get("/ratings/{user_id}", response_model=RatingPage)
+async def get_user_ratings(user_id: str, cursor: Optional[str] = None, limit: int = Query(100, ge=1, le=200)):
+    """Get a page of ratings for a user, newest first"""
+    ratings, next_cursor = await fetch_page(db.ratings, {"ratedId": user_id}, cursor, limit, FULL_PROJECTION)
+    return page_response(RatingPage, Rating, ratings, next_cursor)
+
+# Stats Routes
+@api_router.get("/stats/daily", response_model=List[DailyRideStats])
+async def get_daily_ride_stats(start: Optional[str] = None, end: Optional[str] = None):
+    """Per-day ride counts, revenue and time-to-accept, projected from ride_events"""
+    query = {}
+    if start or end:
+        query["date"] = {}
+        if start:
+            query["date"]["$gte"] = start
+        if end:
+            query["date"]["$lte"] = end
+    cursor = db.ride_stats_daily.find(query, {"_id": False}).sort("date", 1)
+    return [DailyRideStats(**stats) async for stats in cursor]
+
+# Cache Routes
+@api_router.get("/cache/stats")
+async def get_cache_stats():
+    """Hit/miss/eviction counters for the profile caches"""
+    return {
+        "users": {"size": len(user_cache), **user_cache.stats},
+        "drivers": {"size": len(driver_cache), **driver_cache.stats},
+    }
+
+# Realtime Routes
+async def forward_events(websocket: WebSocket, subscriber: Subscriber):
+    while True:
+        payload = await subscriber.queue.get()
+        await websocket.send_text(payload)
+
+def handle_realtime_message(subscriber: Subscriber, message: dict):
+    """Apply a subscribe/unsubscribe request from a client"""
+    if not isinstance(message, dict):
+        raise ValueError("expected a JSON object")
+    action = message.get("action")
+    if action not in ("subscribe", "unsubscribe"):
+        raise ValueError("action must be 'subscribe' or 'unsubscribe'")
+    
+    topics = []
+    if message.get("ride"):
+        topics.append(f"ride:{message['ride']}")
+    if message.get("driver"):
+        topics.append(f"driver:{message['driver']}")
+    if message.get("offers"):
+        topics.append(f"offers:{message['offers']}")
+    if action == "unsubscribe" and message.get("area"):
+        topics.extend(topic for topic in subscriber.topics if topic.startswith("area:"))
+    elif message.get("area"):
+        area = Location(**message["area"])
+        # A driver only follows the area around their latest position
+        for topic in [topic for topic in subscriber.topics if topic.startswith("area:")]:
+            events.unsubscribe(subscriber, topic)
+        topics.extend(area_topics_around(area.latitude, area.longitude))
+    if not topics:
+        raise ValueError("nothing to subscribe to")
+    
+    for topic in topics:
+        if action == "subscribe":
+            events.subscribe(subscriber, topic)
+        else:
+            events.unsubscribe(subscriber, topic)
+
+@api_router.websocket("/ws")
+async def realtime_channel(websocket: WebSocket):
+    """Push channel for ride status, driver positions and new ride requests"""
+    await websocket.accept()
+    subscriber = Subscriber()
+    sender = asyncio.create_task(forward_events(websocket, subscriber))
+    events.stats["connections"] += 1
+    try:
+        while True:
+            try:
+                handle_realtime_message(subscriber, await websocket.receive_json())
+            except (ValueError, TypeError) as e:
+                subscriber.push(json.dumps({"type": "error", "detail": str(e)}))
+            else:
+                subscriber.push(json.dumps({"type": "subscriptions", "topics": sorted(subscriber.topics)}))
+    except WebSocketDisconnect:
+        pass
+    finally:
+        events.stats["connections"] -= 1
+        events.remove(subscriber)
+        sender.cancel()
+
+# Admin Routes
+ADMIN_TOKEN = os.environ.get('ADMIN_TOKEN')
+EXPORT_MEDIA_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+
+async def export_cursor(query: dict, batch_size: int):
+    cursor = db.rides.find(query, FULL_PROJECTION).sort([("createdAt", 1), ("id", 1)]).batch_size(batch_size)
+    try:
+        async for ride in cursor:
+            yield ride
+    finally:
+        # Also runs when the client disconnects halfway through
+        await cursor.close()
+
+@api_router.get("/admin/rides/export")
+async def export_rides(
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    status_: Optional[List[str]] = Query(None, alias="status"),
+    format: Literal['ndjson', 'csv'] = 'ndjson',
+    gzip: bool = False,
+    batch_size: int = Query(1000, ge=1, le=10000),
+    x_admin_token: Optional[str] = Header(None),
+):
+    """Stream every ride created in [start, end) straight from a cursor, oldest first"""
+    # Closed unless a token is configured
+    if not ADMIN_TOKEN or not hmac.compare_digest((x_admin_token or "").encode(), ADMIN_TOKEN.encode()):
+        raise HTTPException(status_code=403, detail="Admin token required")
+
+    query = {}
+    if start or end:
+        query["createdAt"] = {}
+        if start:
+            query["createdAt"]["$gte"] = start
+        if end:
+            query["createdAt"]["$lt"] = end
+    if status_:
+        query["status"] = {"$in": status_}
+
+    rides = export_cursor(query, batch_size)
+    body = encode_ndjson(rides, batch_size) if format == 'ndjson' else encode_csv(rides, batch_size=batch_size)
+    filename = f"rides.{format}"
+    media_type = EXPORT_MEDIA_TYPES[format]
+    if gzip:
+        body = gzip_chunks(body)
+        filename += ".gz"
+        media_type = "application/gzip"
+    return StreamingResponse(
+        body,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+# Cluster Routes
+@api_router.get("/cluster/stats")
+async def get_cluster_stats():
+    """This worker's broker traffic and whether it runs the dispatcher"""
+    return {
+        "workerId": broker.worker_id,
+        "pid": os.getpid(),
+        "stateBackend": broker.name,
+        "dispatcher": dispatcher.active,
+        **broker.stats,
+        "changeStream": change_consumer.stats if CHANGE_STREAMS else None,
+    }
+
+# Metrics Routes
+@api_router.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """Request, latency, payload size and Mongo command metrics in Prometheus format"""
+    return PlainTextResponse(metrics_registry.render(), media_type="text/plain; version=0.0.4")
 
 # Test Routes
 @api_router.get("/")
@@ -365,6 +1280,8 @@ async def health_check():
 # Include the router in the main app
 app.include_router(api_router)
 
+app.add_middleware(RequestMetricsMiddleware, registry=metrics_registry)
+
 app.add_middleware(
     CORSMiddleware,
     allow_credentials=True,
@@ -380,6 +1297,73 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+@app.on_event("startup")
+async def create_indexes():
+    await apply_indexes(db)
+
+@app.on_event("startup")
+async def start_broker():
+    # Subscribe before loading state so no change made meanwhile is missed
+    await broker.start()
+    if dispatch_lease is not None:
+        dispatch_lease.start()
+    if broker.name != 'local' and isinstance(verification_store, MemoryVerificationStore):
+        logger.warning("VERIFICATION_STORE=memory with STATE_BACKEND=%s, codes are not shared between workers", broker.name)
+
+@app.on_event("startup")
+async def load_driver_states():
+    driver_states.clear()
+    async for driver in db.drivers.find({}, DRIVER_STATE_PROJECTION):
+        driver_states.load(driver)
+    logger.info(
+        "Loaded %d drivers, %d online with a position", len(driver_states), len(driver_states.index)
+    )
+    driver_states.start(db.drivers)
+
+@app.on_event("startup")
+async def load_ride_state():
+    open_rides.clear()
+    open_ride_index.clear()
+    cursor = db.rides.find(
+        {"status": {"$in": ["requested", *ACTIVE_RIDE_STATUSES]}},
+        FULL_PROJECTION,
+    )
+    async for ride in cursor:
+        if ride["status"] == "requested":
+            sync_open_ride(ride)
+            dispatcher.submit(ride["id"], ride["pickup"]["latitude"], ride["pickup"]["longitude"])
+        elif ride.get("driverId"):
+            dispatcher.mark_busy(ride["driverId"])
+    dispatcher.start()
+    surge_pricer.start()
+
+@app.on_event("shutdown")
+async def stop_dispatcher():
+    await dispatcher.stop()
+
+@app.on_event("shutdown")
+async def stop_surge_pricer():
+    await surge_pricer.stop()
+
+@app.on_event("shutdown")
+async def checkpoint_driver_states():
+    await driver_states.stop()
+
+@app.on_event("startup")
+async def start_change_stream():
+    if CHANGE_STREAMS:
+        change_consumer.start()
+
+@app.on_event("shutdown")
+async def stop_change_stream():
+    await change_consumer.stop()
+
+@app.on_event("shutdown")
+async def stop_broker():
+    if dispatch_lease is not None:
+        await dispatch_lease.stop()
+    await broker.stop()
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
     client.close()
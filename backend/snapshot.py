@@ -0,0 +1,234 @@
+"""Incremental columnar snapshots of rides and ratings for offline reporting.
+
+Rows are written to one file per ``createdAt`` date:
+
+    <root>/rides/date=2026-10-16/part.arrow
+    <root>/ratings/date=2026-10-16/part.arrow
+
+Arrow IPC files are uncompressed and can be memory-mapped by the readers in
+analytics.py; Parquet is smaller on disk and readable by most tools. A
+watermark in ``<root>/_state.json`` makes each run pick up only what changed
+since the previous one: ratings are immutable, and changed rides are found
+through the ride_events log. createdAt comes from the clock of whichever
+worker wrote the document, so each run re-reads an ``overlap`` window
+before the watermark; rows are upserted by id, so re-reading is harmless.
+"""
+import json
+import re
+from collections import defaultdict
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.ipc as ipc
+import pyarrow.parquet as pq
+
+RIDE_SCHEMA = pa.schema([
+    ("id", pa.string()),
+    ("riderId", pa.string()),
+    ("driverId", pa.string()),
+    ("status", pa.string()),
+    ("pickupLatitude", pa.float64()),
+    ("pickupLongitude", pa.float64()),
+    ("destinationLatitude", pa.float64()),
+    ("destinationLongitude", pa.float64()),
+    ("fare", pa.float64()),
+    ("surgeMultiplier", pa.float64()),
+    ("distance", pa.float64()),
+    ("durationMinutes", pa.int32()),
+    ("createdAt", pa.timestamp("ms")),
+    ("completedAt", pa.timestamp("ms")),
+])
+
+RATING_SCHEMA = pa.schema([
+    ("id", pa.string()),
+    ("rideId", pa.string()),
+    ("raterId", pa.string()),
+    ("ratedId", pa.string()),
+    # Driver of the rated ride, ratedId == driverId when a rider rated the driver
+    ("driverId", pa.string()),
+    ("rating", pa.int8()),
+    ("createdAt", pa.timestamp("ms")),
+])
+
+FORMATS = {"arrow": "part.arrow", "parquet": "part.parquet"}
+SNAPSHOT_PROJECTION = {"_id": False, "pickupPoint": False, "locationPoint": False}
+DURATION_PATTERN = re.compile(r"(\d+)")
+
+
+def ride_row(ride: dict) -> dict:
+    pickup = ride.get("pickup") or {}
+    destination = ride.get("destination") or {}
+    duration = DURATION_PATTERN.match(ride.get("duration") or "")
+    return {
+        "id": ride["id"],
+        "riderId": ride.get("riderId"),
+        "driverId": ride.get("driverId"),
+        "status": ride.get("status"),
+        "pickupLatitude": pickup.get("latitude"),
+        "pickupLongitude": pickup.get("longitude"),
+        "destinationLatitude": destination.get("latitude"),
+        "destinationLongitude": destination.get("longitude"),
+        "fare": ride.get("fare", 0.0),
+        "surgeMultiplier": ride.get("surgeMultiplier", 1.0),
+        "distance": ride.get("distance", 0.0),
+        "durationMinutes": int(duration.group(1)) if duration else None,
+        "createdAt": ride["createdAt"],
+        "completedAt": ride.get("completedAt"),
+    }
+
+
+def rating_row(rating: dict) -> dict:
+    return {field: rating.get(field) for field in RATING_SCHEMA.names}
+
+
+def read_table(path: Path) -> pa.Table:
+    if path.suffix == ".parquet":
+        return pq.read_table(path)
+    with pa.memory_map(str(path)) as source:
+        return ipc.open_file(source).read_all()
+
+
+def conform(table: pa.Table, schema: pa.Schema) -> pa.Table:
+    """Table with schema's columns, null-filling any added since it was written"""
+    columns = [
+        table[field.name] if field.name in table.column_names else pa.nulls(len(table), field.type)
+        for field in schema
+    ]
+    return pa.Table.from_arrays(columns, schema=schema)
+
+
+async def with_driver_ids(db, ratings, batch_size: int):
+    """Yield ratings tagged with the driverId of their ride, one rides query per batch"""
+    batch = []
+
+    async def tagged():
+        ride_ids = list({rating["rideId"] for rating in batch})
+        rides = await db.rides.find({"id": {"$in": ride_ids}}, {"_id": False, "id": True, "driverId": True}).to_list(None)
+        drivers = {ride["id"]: ride.get("driverId") for ride in rides}
+        return [{**rating, "driverId": drivers.get(rating["rideId"])} for rating in batch]
+
+    async for rating in ratings:
+        batch.append(rating)
+        if len(batch) >= batch_size:
+            for row in await tagged():
+                yield row
+            batch = []
+    if batch:
+        for row in await tagged():
+            yield row
+
+
+def write_table(table: pa.Table, path: Path) -> None:
+    tmp = path.with_name(path.name + ".tmp")
+    if path.suffix == ".parquet":
+        pq.write_table(table, tmp)
+    else:
+        with ipc.new_file(str(tmp), table.schema) as writer:
+            writer.write_table(table)
+    # Readers never see a half-written partition
+    tmp.replace(path)
+
+
+class SnapshotWriter:
+    def __init__(self, root, file_format: str = "arrow", overlap: timedelta = timedelta(minutes=5)):
+        self.root = Path(root)
+        # Writes that commit late with an earlier createdAt (clock skew, slow workers)
+        self.overlap = overlap
+        self.file_name = FORMATS[file_format]
+        self.state_path = self.root / "_state.json"
+
+    def load_state(self) -> Dict[str, Optional[datetime]]:
+        if not self.state_path.exists():
+            return {"rides": None, "ratings": None}
+        state = json.loads(self.state_path.read_text())
+        return {key: datetime.fromisoformat(value) if value else None for key, value in state.items()}
+
+    def save_state(self, state: Dict[str, Optional[datetime]]) -> None:
+        self.root.mkdir(parents=True, exist_ok=True)
+        payload = {key: value.isoformat() if value else None for key, value in state.items()}
+        self.state_path.write_text(json.dumps(payload, indent=2))
+
+    def partition_path(self, dataset: str, date: str) -> Path:
+        return self.root / dataset / f"date={date}" / self.file_name
+
+    def merge(self, dataset: str, schema: pa.Schema, rows: List[dict]) -> int:
+        """Upsert rows by id into their createdAt partitions, returns partitions written"""
+        by_date = defaultdict(list)
+        for row in rows:
+            by_date[row["createdAt"].strftime("%Y-%m-%d")].append(row)
+
+        for date, date_rows in by_date.items():
+            path = self.partition_path(dataset, date)
+            path.parent.mkdir(parents=True, exist_ok=True)
+            table = pa.Table.from_pylist(date_rows, schema=schema)
+            if path.exists():
+                existing = conform(read_table(path), schema)
+                changed = pa.array([row["id"] for row in date_rows])
+                keep = pc.invert(pc.is_in(existing["id"], value_set=changed))
+                table = pa.concat_tables([existing.filter(keep), table])
+            write_table(table.sort_by([("createdAt", "ascending"), ("id", "ascending")]), path)
+        return len(by_date)
+
+    async def merge_sorted(self, cursor, dataset: str, schema: pa.Schema, to_row) -> Tuple[int, Optional[datetime]]:
+        """Merge a cursor sorted by createdAt, writing each date partition once.
+
+        Returns the number of rows and the last createdAt seen.
+        """
+        rows, date, count, last = [], None, 0, None
+        async for doc in cursor:
+            row = to_row(doc)
+            row_date = row["createdAt"].strftime("%Y-%m-%d")
+            if rows and row_date != date:
+                self.merge(dataset, schema, rows)
+                rows = []
+            rows.append(row)
+            date, last = row_date, row["createdAt"]
+            count += 1
+        if rows:
+            self.merge(dataset, schema, rows)
+        return count, last
+
+    async def export(self, db, batch_size: int = 5000, rebuild: bool = False) -> Dict[str, int]:
+        """Bring the snapshot up to date with db, returns rows written per dataset.
+
+        ``rebuild`` ignores the watermarks and re-exports every ride and
+        rating, which also fills columns added since older partitions were
+        written, such as the driverId of ratings.
+        """
+        state = {"rides": None, "ratings": None} if rebuild else self.load_state()
+        since = state["rides"] - self.overlap if state["rides"] else None
+        latest = await db.ride_events.find_one({}, {"createdAt": True}, sort=[("createdAt", -1)])
+        ride_watermark = latest["createdAt"] if latest else since
+
+        if since is None:
+            # First run: every ride, one date partition at a time
+            cursor = db.rides.find({}, SNAPSHOT_PROJECTION).sort([("createdAt", 1), ("id", 1)]).batch_size(batch_size)
+            ride_count, _ = await self.merge_sorted(cursor, "rides", RIDE_SCHEMA, ride_row)
+        else:
+            # Rides with lifecycle events since the last run, less the overlap; >= so events
+            # sharing the watermark's millisecond are not lost either
+            window = {"$gte": since}
+            if latest:
+                window["$lte"] = ride_watermark
+            changed_ids = await db.ride_events.distinct("rideId", {"createdAt": window})
+            ride_count = 0
+            for offset in range(0, len(changed_ids), batch_size):
+                chunk = changed_ids[offset:offset + batch_size]
+                rides = await db.rides.find({"id": {"$in": chunk}}, SNAPSHOT_PROJECTION).to_list(None)
+                self.merge("rides", RIDE_SCHEMA, [ride_row(ride) for ride in rides])
+                ride_count += len(rides)
+
+        # Ratings are never updated, only new ones matter
+        rating_query = {"createdAt": {"$gte": state["ratings"] - self.overlap}} if state["ratings"] else {}
+        cursor = db.ratings.find(rating_query, SNAPSHOT_PROJECTION).sort([("createdAt", 1), ("id", 1)]).batch_size(batch_size)
+        ratings = with_driver_ids(db, cursor, batch_size)
+        rating_count, last_rating = await self.merge_sorted(ratings, "ratings", RATING_SCHEMA, rating_row)
+
+        self.save_state({
+            "rides": max(filter(None, [ride_watermark, state["rides"]]), default=None),
+            "ratings": max(filter(None, [last_rating, state["ratings"]]), default=None),
+        })
+        return {"rides": ride_count, "ratings": rating_count}
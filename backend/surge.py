@@ -0,0 +1,131 @@
+"""Surge multipliers from the live supply/demand of each pickup area."""
+import asyncio
+import logging
+import math
+import time
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+
+from geo_index import GeoGridIndex
+
+logger = logging.getLogger(__name__)
+
+
+class SurgePricer:
+    """Keeps a cached fare multiplier per grid cell.
+
+    Demand and supply are the open-ride and online-driver indexes, which the
+    ride and driver endpoints already update incrementally, so counts are
+    read per cell instead of querying Mongo. Every ``refresh_interval_s`` the
+    multiplier of each cell within ``neighborhood`` of a waiting ride is
+    recomputed from the counts in its own ring of cells, so a rider standing
+    next to a busy cell is priced like the area; pricing a ride is a dict
+    lookup.
+    """
+
+    def __init__(
+        self,
+        ride_index: GeoGridIndex,
+        driver_index: GeoGridIndex,
+        refresh_interval_s: float = 5.0,
+        max_multiplier: float = 3.0,
+        sensitivity: float = 0.5,
+        step: float = 0.1,
+        neighborhood: int = 1,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        if ride_index.cell_size_deg != driver_index.cell_size_deg:
+            raise ValueError("Ride and driver indexes must use the same cell size")
+        self.ride_index = ride_index
+        self.driver_index = driver_index
+        self.refresh_interval = refresh_interval_s
+        self.max_multiplier = max_multiplier
+        self.sensitivity = sensitivity
+        self.step = step
+        self.neighborhood = neighborhood
+        self.clock = clock
+        self._multipliers: Dict[Tuple[int, int], float] = {}
+        self.updated_at: Optional[datetime] = None
+        self._task: Optional[asyncio.Task] = None
+        self.stats = {"refreshes": 0, "surgingCells": 0, "lastRefreshSeconds": 0.0}
+
+    @property
+    def cell_size_deg(self) -> float:
+        return self.ride_index.cell_size_deg
+
+    def _area(self, cell: Tuple[int, int]) -> List[Tuple[int, int]]:
+        row, col = cell
+        reach = range(-self.neighborhood, self.neighborhood + 1)
+        return [(row + dr, col + dc) for dr in reach for dc in reach]
+
+    def _area_count(self, index: GeoGridIndex, cell: Tuple[int, int]) -> int:
+        return sum(index.cell_count(neighbor) for neighbor in self._area(cell))
+
+    def multiplier_for(self, demand: int, supply: int) -> float:
+        """More waiting rides than free drivers nearby raises the price in ``step`` increments"""
+        ratio = demand / max(supply, 1)
+        if ratio <= 1:
+            return 1.0
+        surge = min(self.max_multiplier, 1 + self.sensitivity * (ratio - 1))
+        # Rounded first so an exact multiple such as 1.2 / 0.1 = 11.999... is not floored a step down
+        return round(math.floor(round(surge / self.step, 9)) * self.step, 2)
+
+    def refresh(self) -> int:
+        """Recompute multipliers for every cell with demand in its area, returns how many surge"""
+        start = self.clock()
+        multipliers = {}
+        # Only cells whose ring holds a waiting ride can have demand at all
+        cells = {neighbor for occupied in self.ride_index.occupied_cells() for neighbor in self._area(occupied)}
+        for cell in cells:
+            multiplier = self.multiplier_for(
+                self._area_count(self.ride_index, cell),
+                self._area_count(self.driver_index, cell),
+            )
+            if multiplier > 1.0:
+                multipliers[cell] = multiplier
+        self._multipliers = multipliers
+        self.updated_at = datetime.utcnow()
+        self.stats["refreshes"] += 1
+        self.stats["surgingCells"] = len(multipliers)
+        self.stats["lastRefreshSeconds"] = self.clock() - start
+        return len(multipliers)
+
+    def multiplier(self, latitude: float, longitude: float) -> float:
+        return self._multipliers.get(self.ride_index.cell_of(latitude, longitude), 1.0)
+
+    def heatmap(self) -> List[dict]:
+        """Raw per-cell counts and the cached multiplier of every occupied cell"""
+        cells = set(self.ride_index.occupied_cells()) | set(self.driver_index.occupied_cells())
+        size = self.cell_size_deg
+        return [
+            {
+                "latitude": round(row * size, 6),
+                "longitude": round(col * size, 6),
+                "demand": self.ride_index.cell_count((row, col)),
+                "supply": self.driver_index.cell_count((row, col)),
+                "multiplier": self._multipliers.get((row, col), 1.0),
+            }
+            for row, col in sorted(cells)
+        ]
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.refresh_interval)
+            try:
+                self.refresh()
+            except Exception:
+                logger.exception("Surge refresh failed")
+
+    def start(self) -> None:
+        self.refresh()
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
@@ -0,0 +1,119 @@
+"""Storage backends for phone verification codes."""
+import heapq
+import time
+from abc import ABC, abstractmethod
+from datetime import datetime, timedelta
+from typing import Dict, List, Tuple
+
+from pymongo import ReturnDocument
+
+
+class RateLimitExceeded(Exception):
+    """Raised when a phone asks for more codes than the send window allows"""
+
+
+class VerificationStore(ABC):
+    """Issued codes expire after ``ttl_seconds`` and can be used once.
+
+    Each phone may be sent at most ``max_sends`` codes per fixed window of
+    ``window_seconds``.
+    """
+
+    def __init__(self, ttl_seconds: int = 300, max_sends: int = 5, window_seconds: int = 600):
+        self.ttl_seconds = ttl_seconds
+        self.max_sends = max_sends
+        self.window_seconds = window_seconds
+
+    @abstractmethod
+    async def issue(self, phone: str, code: str) -> None:
+        """Store a code for a phone, replacing any previous one"""
+
+    @abstractmethod
+    async def consume(self, phone: str, code: str) -> bool:
+        """Atomically check a code and remove it if it matches"""
+
+
+class MemoryVerificationStore(VerificationStore):
+    """Process-local store, only valid with a single worker"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._codes: Dict[str, Tuple[str, float]] = {}
+        self._sends: Dict[str, Tuple[float, int]] = {}
+        # (expires_at, kind, phone) entries, stale ones are skipped on pop
+        self._expiry: List[Tuple[float, str, str]] = []
+
+    def __len__(self) -> int:
+        return len(self._codes)
+
+    def _evict(self, now: float) -> None:
+        while self._expiry and self._expiry[0][0] <= now:
+            expires_at, kind, phone = heapq.heappop(self._expiry)
+            table = self._codes if kind == "code" else self._sends
+            entry = table.get(phone)
+            if entry is not None and entry[1 if kind == "code" else 0] == expires_at:
+                del table[phone]
+
+    async def issue(self, phone: str, code: str) -> None:
+        now = time.monotonic()
+        self._evict(now)
+
+        window_end, sent = self._sends.get(phone, (now + self.window_seconds, 0))
+        if sent >= self.max_sends:
+            raise RateLimitExceeded(phone)
+        if sent == 0:
+            heapq.heappush(self._expiry, (window_end, "sends", phone))
+        self._sends[phone] = (window_end, sent + 1)
+
+        expires_at = now + self.ttl_seconds
+        self._codes[phone] = (code, expires_at)
+        heapq.heappush(self._expiry, (expires_at, "code", phone))
+
+    async def consume(self, phone: str, code: str) -> bool:
+        self._evict(time.monotonic())
+        entry = self._codes.get(phone)
+        if entry is None or entry[0] != code:
+            return False
+        del self._codes[phone]
+        return True
+
+
+class MongoVerificationStore(VerificationStore):
+    """Shared store on Mongo, works across workers and restarts.
+
+    Expired codes and send windows are removed by the TTL indexes on
+    ``expiresAt`` declared in indexes.py; reads also check the expiry since
+    the TTL monitor only runs about once a minute.
+    """
+
+    def __init__(self, db, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.codes = db.verification_codes
+        self.sends = db.verification_sends
+
+    async def issue(self, phone: str, code: str) -> None:
+        now = datetime.utcnow()
+        window = int(now.timestamp()) // self.window_seconds
+        counter = await self.sends.find_one_and_update(
+            {"_id": f"{phone}:{window}"},
+            {
+                "$inc": {"count": 1},
+                "$setOnInsert": {"expiresAt": now + timedelta(seconds=self.window_seconds)},
+            },
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+        if counter["count"] > self.max_sends:
+            raise RateLimitExceeded(phone)
+
+        await self.codes.replace_one(
+            {"_id": phone},
+            {"code": code, "expiresAt": now + timedelta(seconds=self.ttl_seconds)},
+            upsert=True,
+        )
+
+    async def consume(self, phone: str, code: str) -> bool:
+        deleted = await self.codes.find_one_and_delete(
+            {"_id": phone, "code": code, "expiresAt": {"$gt": datetime.utcnow()}}
+        )
+        return deleted is not None
@@ -297,8 +297,9 @@ def test_get_available_rides():
         response = make_request('GET', '/rides/available')
         
         if response.status_code == 200:
-            rides = response.json()
-            if isinstance(rides, list):
+            page = response.json()
+            rides = page.get("items")
+            if isinstance(rides, list) and "nextCursor" in page:
                 results.add_pass(f"Get available rides (found {len(rides)})")
                 return rides
             else:
@@ -381,8 +382,9 @@ def test_get_user_ratings(user_id):
         response = make_request('GET', f'/ratings/{user_id}')
         
         if response.status_code == 200:
-            ratings = response.json()
-            if isinstance(ratings, list):
+            page = response.json()
+            ratings = page.get("items")
+            if isinstance(ratings, list) and "nextCursor" in page:
                 results.add_pass(f"Get user ratings (found {len(ratings)})")
                 return ratings
             else:
@@ -399,8 +401,9 @@ def test_get_rider_rides(rider_id):
         response = make_request('GET', f'/rides/rider/{rider_id}')
         
         if response.status_code == 200:
-            rides = response.json()
-            if isinstance(rides, list):
+            page = response.json()
+            rides = page.get("items")
+            if isinstance(rides, list) and "nextCursor" in page:
                 results.add_pass(f"Get rider rides (found {len(rides)})")
                 return rides
             else:
@@ -417,8 +420,9 @@ def test_get_driver_rides(driver_id):
         response = make_request('GET', f'/rides/driver/{driver_id}')
         
         if response.status_code == 200:
-            rides = response.json()
-            if isinstance(rides, list):
+            page = response.json()
+            rides = page.get("items")
+            if isinstance(rides, list) and "nextCursor" in page:
                 results.add_pass(f"Get driver rides (found {len(rides)})")
                 return rides
             else:
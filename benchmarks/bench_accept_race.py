@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""
+Contention benchmark for ride acceptance.
+
+N simulated drivers race to accept the same ride, repeated for several rides.
+Every round must produce exactly one winner; per-call latency is reported as
+p50/p99 for winners and losers.
+
+    python benchmarks/bench_accept_race.py --drivers 50 --rounds 200
+"""
+import argparse
+import asyncio
+import time
+
+from common import latency_summary, load_server, reset_database
+
+server = load_server()
+from fastapi import HTTPException  # noqa: E402
+
+
+async def race(ride_id: str, driver_ids):
+    async def attempt(driver_id):
+        start = time.perf_counter()
+        try:
+            await server.accept_ride(driver_id, ride_id)
+            won = True
+        except HTTPException:
+            won = False
+        return won, time.perf_counter() - start
+
+    return await asyncio.gather(*(attempt(driver_id) for driver_id in driver_ids))
+
+
+async def main(drivers: int, rounds: int):
+    await reset_database(server)
+    driver_ids = [f"bench-driver-{i}" for i in range(drivers)]
+    pickup = server.Location(latitude=9.0192, longitude=38.7525)
+    destination = server.Location(latitude=9.0300, longitude=38.7600)
+
+    winners_per_round = []
+    win_latency, lose_latency = [], []
+    for _ in range(rounds):
+        ride = await server.create_ride(
+            server.RideCreate(pickup=pickup, destination=destination), rider_id="bench-rider"
+        )
+        results = await race(ride.id, driver_ids)
+        winners_per_round.append(sum(1 for won, _ in results if won))
+        win_latency.extend(elapsed for won, elapsed in results if won)
+        lose_latency.extend(elapsed for won, elapsed in results if not won)
+
+    bad_rounds = sum(1 for winners in winners_per_round if winners != 1)
+    print(f"drivers={drivers} rounds={rounds} rounds_without_exactly_one_winner={bad_rounds}")
+    print("winners:", latency_summary(win_latency))
+    print("losers: ", latency_summary(lose_latency))
+    return 1 if bad_rounds else 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--drivers', type=int, default=50)
+    parser.add_argument('--rounds', type=int, default=200)
+    args = parser.parse_args()
+    raise SystemExit(asyncio.run(main(args.drivers, args.rounds)))
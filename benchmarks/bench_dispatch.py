@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+Dispatch simulator.
+
+Drivers are scattered around Addis Ababa and rides arrive every round. Each
+offered driver accepts with --accept-rate probability on the next round and
+declines otherwise, and a driver who accepted is busy for a while before
+becoming free again somewhere nearby. The batched greedy matcher is compared
+with handing each ride, in arrival order, to its nearest free driver.
+
+    python benchmarks/bench_dispatch.py --drivers 1000 10000
+"""
+import argparse
+import random
+import time
+
+from common import latency_summary  # also puts backend/ on sys.path
+from dispatch import Dispatcher  # noqa: E402
+from geo_index import GeoGridIndex  # noqa: E402
+
+CENTER_LAT, CENTER_LON = 9.0192, 38.7525
+SPREAD_DEG = 0.09  # roughly a 20 x 20 km city
+
+
+class FirstComeDispatcher(Dispatcher):
+    """Baseline: rides take their nearest free driver one at a time"""
+
+    def match(self):
+        taken = set()
+        matches = []
+        for ride in sorted(self._waiting.values(), key=lambda ride: ride.submitted_at):
+            for distance, driver_id in self.candidates(ride):
+                if driver_id not in taken:
+                    taken.add(driver_id)
+                    matches.append((ride, driver_id, distance))
+                    break
+        return matches
+
+
+def random_point(rng):
+    return (
+        CENTER_LAT + rng.uniform(-SPREAD_DEG, SPREAD_DEG),
+        CENTER_LON + rng.uniform(-SPREAD_DEG, SPREAD_DEG),
+    )
+
+
+def simulate(dispatcher_class, drivers: int, rounds: int, rides_per_round: int, accept_rate: float, seed: int):
+    rng = random.Random(seed)
+    now = [0.0]
+    index = GeoGridIndex()
+    for i in range(drivers):
+        index.upsert(f"driver-{i}", *random_point(rng))
+
+    offers = []
+    dispatcher = dispatcher_class(
+        index,
+        lambda driver_id, ride_id, distance: offers.append((driver_id, ride_id)),
+        offer_timeout_s=3.0,
+        clock=lambda: now[0],
+    )
+    busy_until = {}
+    tick_seconds = []
+    ride_seq = 0
+
+    for round_no in range(rounds):
+        now[0] = round_no * dispatcher.batch_interval
+
+        # Answer last round's offers
+        answered, offers[:] = list(offers), []
+        for driver_id, ride_id in answered:
+            if rng.random() < accept_rate:
+                dispatcher.resolve(ride_id, driver_id)
+                busy_until[driver_id] = round_no + rng.randint(20, 60)
+            else:
+                dispatcher.decline(ride_id, driver_id)
+
+        for driver_id, until in list(busy_until.items()):
+            if until <= round_no:
+                del busy_until[driver_id]
+                dispatcher.release(driver_id)
+                index.upsert(driver_id, *random_point(rng))
+
+        for _ in range(rides_per_round):
+            dispatcher.submit(f"ride-{ride_seq}", *random_point(rng))
+            ride_seq += 1
+
+        start = time.perf_counter()
+        dispatcher.tick()
+        tick_seconds.append(time.perf_counter() - start)
+
+    stats = dispatcher.stats
+    accepted = max(stats["accepted"], 1)
+    return {
+        "accepted": stats["accepted"],
+        "still_waiting": dispatcher.waiting,
+        "avg_pickup_km": round(stats["pickupDistanceTotal"] / accepted, 3),
+        "avg_match_latency_s": round(stats["matchLatencyTotal"] / accepted, 3),
+        "offers_declined": stats["offersDeclined"],
+        "offers_expired": stats["offersExpired"],
+        "tick": latency_summary(tick_seconds),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--drivers', type=int, nargs='+', default=[1000, 10000])
+    parser.add_argument('--rounds', type=int, default=200)
+    parser.add_argument('--accept-rate', type=float, default=0.8)
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args()
+
+    for drivers in args.drivers:
+        # Keep demand proportional to supply so both sizes are equally busy
+        rides_per_round = max(1, drivers // 100)
+        for name, dispatcher_class in (("greedy", Dispatcher), ("first-come", FirstComeDispatcher)):
+            result = simulate(dispatcher_class, drivers, args.rounds, rides_per_round, args.accept_rate, args.seed)
+            print(f"drivers={drivers} rides/round={rides_per_round} {name}: {result}")
+
+
+if __name__ == '__main__':
+    main()
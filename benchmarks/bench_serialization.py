@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+Serialization cost of list responses, before and after the single-pass path.
+
+"before" is what the list endpoints used to do: build one pydantic model per
+Mongo document, then let FastAPI validate the result against response_model,
+run it through jsonable_encoder and json.dumps it. "after" is
+server.list_response / server.page_response, which validate the documents
+once and dump them to bytes in pydantic-core. Both produce identical JSON.
+
+    python benchmarks/bench_serialization.py --sizes 50 500 --repeat 200
+"""
+import argparse
+import asyncio
+import json
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import List, Union
+
+from common import latency_summary, load_server
+
+server = load_server()
+from fastapi.encoders import jsonable_encoder  # noqa: E402
+from fastapi.responses import JSONResponse  # noqa: E402
+from fastapi.routing import serialize_response  # noqa: E402
+from fastapi.utils import create_response_field  # noqa: E402
+
+
+def ride_docs(count: int) -> List[dict]:
+    start = datetime(2026, 1, 1)
+    return [
+        {
+            "id": str(uuid.uuid4()),
+            "riderId": str(uuid.uuid4()),
+            "driverId": str(uuid.uuid4()) if i % 2 else None,
+            "pickup": {"latitude": 9.0 + i * 1e-4, "longitude": 38.75, "address": "Bole Road"},
+            "destination": {"latitude": 9.03, "longitude": 38.76 + i * 1e-4, "address": None},
+            "status": "completed" if i % 2 else "requested",
+            "fare": 12.5 + i % 7,
+            "distance": 4.2 + i % 5,
+            "duration": "9 min",
+            "createdAt": start + timedelta(seconds=i),
+            "completedAt": start + timedelta(seconds=i + 600) if i % 2 else None,
+        }
+        for i in range(count)
+    ]
+
+
+async def fastapi_list(docs):
+    # Endpoints without response_model: models go straight to jsonable_encoder
+    return JSONResponse(jsonable_encoder([server.Ride(**doc) for doc in docs])).body
+
+
+async def fastapi_list_model(field, docs):
+    # Same, with response_model declared: FastAPI validates the models again first
+    items = [server.Ride(**doc) for doc in docs]
+    content = await serialize_response(field=field, response_content=items, is_coroutine=True)
+    return JSONResponse(content).body
+
+
+async def fastapi_page(field, docs):
+    page = server.RidePage(items=[server.Ride(**doc) for doc in docs], nextCursor="abc")
+    content = await serialize_response(field=field, response_content=page, is_coroutine=True)
+    return JSONResponse(content).body
+
+
+async def single_pass_list(docs):
+    return server.list_response(server.Ride, docs).body
+
+
+async def single_pass_page(docs):
+    return server.page_response(server.RidePage, server.Ride, docs, "abc").body
+
+
+async def measure(fn, repeat: int):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        await fn()
+        samples.append(time.perf_counter() - start)
+    return latency_summary(samples)
+
+
+async def main(sizes, repeat: int):
+    page_field = create_response_field(name="response", type_=server.RidePage)
+    list_field = create_response_field(name="response", type_=List[Union[server.Ride, server.RideSummary]])
+    for size in sizes:
+        docs = ride_docs(size)
+
+        # Same JSON document either way
+        assert json.loads(await fastapi_page(page_field, docs)) == json.loads(await single_pass_page(docs))
+        assert json.loads(await fastapi_list(docs)) == json.loads(await single_pass_list(docs))
+
+        cases = {
+            "list before": lambda: fastapi_list(docs),
+            "list before (response_model)": lambda: fastapi_list_model(list_field, docs),
+            "list after": lambda: single_pass_list(docs),
+            "page before": lambda: fastapi_page(page_field, docs),
+            "page after": lambda: single_pass_page(docs),
+        }
+        print(f"items={size}")
+        for name, fn in cases.items():
+            summary = await measure(fn, repeat)
+            print(f"  {name:30s} p50={summary['p50_ms']:8.3f}ms p99={summary['p99_ms']:8.3f}ms")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[50, 500])
+    parser.add_argument('--repeat', type=int, default=200)
+    args = parser.parse_args()
+    asyncio.run(main(args.sizes, args.repeat))
@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""
+Send/verify throughput for the verification code stores.
+
+Each simulated user requests a code and then verifies it, concurrently, for
+both the in-process and the Mongo backed store.
+
+    python benchmarks/bench_verification.py --users 5000 --concurrency 200
+"""
+import argparse
+import asyncio
+import time
+
+from common import latency_summary, load_server, reset_database
+
+server = load_server()
+from verification_store import MemoryVerificationStore, MongoVerificationStore  # noqa: E402
+
+
+async def run_store(store, users: int, concurrency: int) -> dict:
+    semaphore = asyncio.Semaphore(concurrency)
+    send_latency, verify_latency = [], []
+    failures = 0
+
+    async def flow(i):
+        nonlocal failures
+        phone = f"+2519{i:08d}"
+        async with semaphore:
+            start = time.perf_counter()
+            await store.issue(phone, "123456")
+            sent = time.perf_counter()
+            ok = await store.consume(phone, "123456")
+            send_latency.append(sent - start)
+            verify_latency.append(time.perf_counter() - sent)
+            failures += not ok
+
+    start = time.perf_counter()
+    await asyncio.gather(*(flow(i) for i in range(users)))
+    elapsed = time.perf_counter() - start
+    return {
+        "flows_per_s": round(users / elapsed, 1),
+        "failures": failures,
+        "send": latency_summary(send_latency),
+        "verify": latency_summary(verify_latency),
+    }
+
+
+async def main(users: int, concurrency: int):
+    await reset_database(server)
+    stores = {
+        "memory": MemoryVerificationStore(max_sends=users),
+        "mongo": MongoVerificationStore(server.db, max_sends=users),
+    }
+    for name, store in stores.items():
+        print(name, await run_store(store, users, concurrency))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--users', type=int, default=5000)
+    parser.add_argument('--concurrency', type=int, default=200)
+    args = parser.parse_args()
+    asyncio.run(main(args.users, args.concurrency))
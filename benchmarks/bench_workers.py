@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+"""
+Throughput scaling from 1 to N gunicorn workers on one machine.
+
+For every worker count the app is started with backend/gunicorn.conf.py
+against the mongod at MONGO_URL (several processes cannot share
+mongomock), seeded with online drivers, and loaded over HTTP by separate
+load-generator processes so the client does not become the bottleneck.
+Requests per second, p50/p99 latency and scaling efficiency are reported.
+
+    MONGO_URL=mongodb://localhost:27017 python benchmarks/bench_workers.py --workers 1 2 4
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import random
+import signal
+import subprocess
+import sys
+import time
+
+import httpx
+from pymongo import MongoClient
+
+from common import BACKEND_DIR, latency_summary
+
+DB_NAME = 'airide_bench_workers'
+CENTER = (9.0192, 38.7525)
+
+
+def random_point(rng):
+    return CENTER[0] + rng.uniform(-0.04, 0.04), CENTER[1] + rng.uniform(-0.04, 0.04)
+
+
+def start_app(workers: int, port: int, state_backend: str) -> subprocess.Popen:
+    env = {
+        **os.environ,
+        'DB_NAME': DB_NAME,
+        'WEB_CONCURRENCY': str(workers),
+        'BIND': f'127.0.0.1:{port}',
+        'STATE_BACKEND': state_backend,
+    }
+    return subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', 'server:app', '-c', 'gunicorn.conf.py', '--log-level', 'warning'],
+        cwd=BACKEND_DIR,
+        env=env,
+    )
+
+
+def wait_until_ready(base_url: str, timeout: float = 60.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(f'{base_url}/api/health', timeout=1).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f'App at {base_url} did not become ready')
+
+
+def seed(base_url: str, drivers: int) -> list:
+    rng = random.Random(1)
+    driver_ids = []
+    with httpx.Client(base_url=base_url, timeout=10) as http:
+        for i in range(drivers):
+            response = http.post('/api/auth/register', json={'phone': f'+2519300{i:05d}', 'userType': 'driver'})
+            driver_id = response.json()['id']
+            latitude, longitude = random_point(rng)
+            http.put(f'/api/drivers/{driver_id}/location', json={'latitude': latitude, 'longitude': longitude})
+            http.put(f'/api/drivers/{driver_id}/status', json={'isOnline': True})
+            driver_ids.append(driver_id)
+    return driver_ids
+
+
+async def generate_load(base_url: str, driver_ids: list, concurrency: int, duration: float, seed_value: int):
+    samples = []
+    errors = 0
+    deadline = time.perf_counter() + duration
+    limits = httpx.Limits(max_connections=concurrency)
+
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=30) as http:
+        async def client(worker: int):
+            nonlocal errors
+            rng = random.Random(seed_value * 1000 + worker)
+            while time.perf_counter() < deadline:
+                latitude, longitude = random_point(rng)
+                start = time.perf_counter()
+                try:
+                    if rng.random() < 0.5:
+                        response = await http.put(
+                            f'/api/drivers/{rng.choice(driver_ids)}/location',
+                            json={'latitude': latitude, 'longitude': longitude},
+                        )
+                    else:
+                        response = await http.get('/api/drivers/nearby', params={
+                            'latitude': latitude, 'longitude': longitude, 'radius': 3, 'view': 'summary',
+                        })
+                    if response.status_code >= 400:
+                        errors += 1
+                except httpx.HTTPError:
+                    errors += 1
+                samples.append(time.perf_counter() - start)
+
+        await asyncio.gather(*(client(worker) for worker in range(concurrency)))
+    return samples, errors
+
+
+def load_process(args):
+    return asyncio.run(generate_load(*args))
+
+
+def run_once(workers: int, args) -> dict:
+    MongoClient(os.environ['MONGO_URL']).drop_database(DB_NAME)
+    base_url = f'http://127.0.0.1:{args.port}'
+    app = start_app(workers, args.port, args.state_backend)
+    try:
+        wait_until_ready(base_url)
+        driver_ids = seed(base_url, args.drivers)
+        jobs = [
+            (base_url, driver_ids, args.concurrency, args.duration, index)
+            for index in range(args.load_processes)
+        ]
+        start = time.perf_counter()
+        with multiprocessing.Pool(args.load_processes) as pool:
+            results = pool.map(load_process, jobs)
+        elapsed = time.perf_counter() - start
+    finally:
+        app.send_signal(signal.SIGTERM)
+        app.wait(timeout=30)
+
+    samples = [sample for result, _ in results for sample in result]
+    return {
+        'workers': workers,
+        'requests': len(samples),
+        'errors': sum(errors for _, errors in results),
+        'rps': round(len(samples) / elapsed, 1),
+        **latency_summary(samples),
+    }
+
+
+def main(args) -> int:
+    if 'MONGO_URL' not in os.environ:
+        print('bench_workers.py needs a real mongod, set MONGO_URL', file=sys.stderr)
+        return 2
+
+    runs = [run_once(workers, args) for workers in args.workers]
+    baseline = runs[0]['rps'] / runs[0]['workers']
+    for run in runs:
+        run['efficiency'] = round(run['rps'] / (baseline * run['workers']), 2) if baseline else 0.0
+    print(json.dumps({'stateBackend': args.state_backend, 'runs': runs}, indent=2))
+    return 1 if any(run['errors'] for run in runs) else 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--state-backend', choices=['mongo', 'redis'], default='mongo')
+    parser.add_argument('--duration', type=float, default=15.0)
+    parser.add_argument('--concurrency', type=int, default=64, help='connections per load process')
+    parser.add_argument('--load-processes', type=int, default=2)
+    parser.add_argument('--drivers', type=int, default=1000)
+    parser.add_argument('--port', type=int, default=8765)
+    raise SystemExit(main(parser.parse_args()))
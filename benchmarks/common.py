@@ -0,0 +1,53 @@
+"""Shared setup for the backend benchmarks.
+
+Benchmarks import backend/server.py in-process. They run against the mongod
+at MONGO_URL when it is set and fall back to mongomock-motor otherwise.
+"""
+import os
+import sys
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent / 'backend'
+sys.path.insert(0, str(BACKEND_DIR))
+
+
+def load_server(db_name: str = 'airide_bench'):
+    """Import the app and point it at a fresh benchmark database"""
+    use_mongomock = 'MONGO_URL' not in os.environ
+    os.environ.setdefault('MONGO_URL', 'mongodb://localhost:27017')
+    os.environ['DB_NAME'] = db_name
+
+    import server
+
+    if use_mongomock:
+        from mongomock_motor import AsyncMongoMockClient
+
+        server.client = AsyncMongoMockClient()
+    server.db = server.client[db_name]
+    server.verification_store = server.build_verification_store()
+    return server
+
+
+async def reset_database(server):
+    for name in await server.db.list_collection_names():
+        await server.db.drop_collection(name)
+
+
+def percentile(samples, pct: float) -> float:
+    """Nearest-rank percentile of a list of numbers"""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    rank = max(0, min(len(ordered) - 1, round(pct / 100 * len(ordered) + 0.5) - 1))
+    return ordered[rank]
+
+
+def latency_summary(samples_s) -> dict:
+    """p50/p95/p99 in milliseconds for a list of durations in seconds"""
+    samples_ms = [sample * 1000 for sample in samples_s]
+    return {
+        "count": len(samples_ms),
+        "p50_ms": round(percentile(samples_ms, 50), 3),
+        "p95_ms": round(percentile(samples_ms, 95), 3),
+        "p99_ms": round(percentile(samples_ms, 99), 3),
+    }
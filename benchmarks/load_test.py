@@ -0,0 +1,292 @@
+#!/usr/bin/env python3
+"""
+Mixed-traffic load test for the API.
+
+Starts the FastAPI app in-process (against MONGO_URL or mongomock-motor, see
+common.py) and drives it with concurrent asyncio clients for a fixed
+duration. Each client repeatedly picks a scenario from the traffic mix:
+driver location updates, nearby-driver and open-ride queries, ride
+creation, accept races between several drivers and ratings. Latency
+percentiles and requests per second are reported per endpoint and written
+as JSON so runs can be compared between commits.
+
+    python benchmarks/load_test.py --duration 30 --concurrency 64 --output before.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import time
+from collections import defaultdict
+from datetime import datetime
+
+import httpx
+
+from common import latency_summary, load_server, reset_database
+
+# Checked before load_server, which fills in a default MONGO_URL for mongomock
+DATABASE = os.environ.get('MONGO_URL', 'mongomock')
+server = load_server('airide_load')
+
+# Addis Ababa city centre, every seeded position is within ~5km of it
+CENTER = (9.0192, 38.7525)
+SPREAD_DEG = 0.045
+
+MIXES = {
+    "default": {
+        "location_update": 50,
+        "nearby_drivers": 15,
+        "available_rides": 10,
+        "create_ride": 8,
+        "accept_race": 5,
+        "rating": 5,
+        "ride_history": 7,
+    },
+    "drivers": {
+        "location_update": 80,
+        "nearby_drivers": 10,
+        "available_rides": 10,
+    },
+    "riders": {
+        "nearby_drivers": 40,
+        "create_ride": 25,
+        "ride_history": 25,
+        "rating": 10,
+    },
+}
+
+
+def random_point(rng: random.Random):
+    return (
+        CENTER[0] + rng.uniform(-SPREAD_DEG, SPREAD_DEG),
+        CENTER[1] + rng.uniform(-SPREAD_DEG, SPREAD_DEG),
+    )
+
+
+class Recorder:
+    def __init__(self):
+        self.latency = defaultdict(list)
+        self.errors = defaultdict(int)
+
+    async def call(self, http: httpx.AsyncClient, name: str, method: str, url: str, **kwargs):
+        start = time.perf_counter()
+        try:
+            response = await http.request(method, url, **kwargs)
+        except Exception:
+            self.errors[name] += 1
+            raise
+        self.latency[name].append(time.perf_counter() - start)
+        if response.status_code >= 500:
+            self.errors[name] += 1
+        return response
+
+    def report(self, elapsed: float) -> dict:
+        endpoints = {}
+        for name in sorted(self.latency):
+            summary = latency_summary(self.latency[name])
+            summary["errors"] = self.errors[name]
+            summary["rps"] = round(len(self.latency[name]) / elapsed, 1)
+            endpoints[name] = summary
+        total = sum(len(samples) for samples in self.latency.values())
+        return {
+            "elapsed_s": round(elapsed, 3),
+            "requests": total,
+            "rps": round(total / elapsed, 1),
+            "errors": sum(self.errors.values()),
+            "endpoints": endpoints,
+        }
+
+
+class Scenarios:
+    """One coroutine per traffic type, each issuing one or more requests"""
+
+    def __init__(self, http: httpx.AsyncClient, recorder: Recorder, driver_ids, rider_ids, race_size: int):
+        self.http = http
+        self.recorder = recorder
+        self.driver_ids = driver_ids
+        self.rider_ids = rider_ids
+        self.race_size = race_size
+        self.completed_rides = []
+
+    def call(self, name, method, url, **kwargs):
+        return self.recorder.call(self.http, name, method, url, **kwargs)
+
+    async def location_update(self, rng):
+        latitude, longitude = random_point(rng)
+        await self.call(
+            "PUT /drivers/{driver_id}/location", "PUT",
+            f"/api/drivers/{rng.choice(self.driver_ids)}/location",
+            json={"latitude": latitude, "longitude": longitude},
+        )
+
+    async def nearby_drivers(self, rng):
+        latitude, longitude = random_point(rng)
+        await self.call(
+            "GET /drivers/nearby", "GET", "/api/drivers/nearby",
+            params={"latitude": latitude, "longitude": longitude, "radius": 3, "view": "summary"},
+        )
+
+    async def available_rides(self, rng):
+        latitude, longitude = random_point(rng)
+        await self.call(
+            "GET /rides/available", "GET", "/api/rides/available",
+            params={"latitude": latitude, "longitude": longitude, "radius": 5, "limit": 50, "view": "summary"},
+        )
+
+    async def _create_ride(self, rng) -> dict:
+        pickup = random_point(rng)
+        destination = random_point(rng)
+        response = await self.call(
+            "POST /rides", "POST", "/api/rides",
+            params={"rider_id": rng.choice(self.rider_ids)},
+            json={
+                "pickup": {"latitude": pickup[0], "longitude": pickup[1]},
+                "destination": {"latitude": destination[0], "longitude": destination[1]},
+            },
+        )
+        return response.json()
+
+    async def create_ride(self, rng):
+        await self._create_ride(rng)
+
+    async def accept_race(self, rng):
+        ride = await self._create_ride(rng)
+        racers = rng.sample(self.driver_ids, min(self.race_size, len(self.driver_ids)))
+        responses = await asyncio.gather(*(
+            self.call(
+                "PUT /drivers/{driver_id}/accept-ride", "PUT",
+                f"/api/drivers/{driver_id}/accept-ride", params={"ride_id": ride["id"]},
+            )
+            for driver_id in racers
+        ))
+        winners = [driver_id for driver_id, response in zip(racers, responses) if response.status_code == 200]
+        if len(winners) != 1:
+            self.recorder.errors["accept race without exactly one winner"] += 1
+            return
+        for status in ("driverArriving", "inProgress", "completed"):
+            await self.call(
+                "PUT /rides/{ride_id}", "PUT", f"/api/rides/{ride['id']}", json={"status": status},
+            )
+        self.completed_rides.append((ride, winners[0]))
+
+    async def rating(self, rng):
+        if self.completed_rides:
+            ride, driver_id = rng.choice(self.completed_rides)
+            rider_id = ride["riderId"]
+        else:
+            ride, driver_id, rider_id = None, rng.choice(self.driver_ids), rng.choice(self.rider_ids)
+        await self.call(
+            "POST /ratings", "POST", "/api/ratings",
+            params={"rater_id": rider_id},
+            json={
+                "rideId": ride["id"] if ride else "load-test",
+                "ratedId": driver_id,
+                "rating": rng.randint(3, 5),
+            },
+        )
+
+    async def ride_history(self, rng):
+        if rng.random() < 0.5:
+            await self.call(
+                "GET /rides/rider/{rider_id}", "GET",
+                f"/api/rides/rider/{rng.choice(self.rider_ids)}", params={"limit": 20},
+            )
+        else:
+            await self.call(
+                "GET /rides/driver/{driver_id}", "GET",
+                f"/api/rides/driver/{rng.choice(self.driver_ids)}", params={"limit": 20},
+            )
+
+
+async def seed(http: httpx.AsyncClient, drivers: int, riders: int, rng: random.Random):
+    driver_ids, rider_ids = [], []
+    for i in range(riders):
+        response = await http.post(
+            "/api/auth/register", json={"phone": f"+2519100{i:05d}", "userType": "rider"}
+        )
+        rider_ids.append(response.json()["id"])
+    for i in range(drivers):
+        response = await http.post(
+            "/api/auth/register", json={"phone": f"+2519200{i:05d}", "userType": "driver"}
+        )
+        driver_id = response.json()["id"]
+        latitude, longitude = random_point(rng)
+        await http.put(f"/api/drivers/{driver_id}/location", json={"latitude": latitude, "longitude": longitude})
+        await http.put(f"/api/drivers/{driver_id}/status", json={"isOnline": True})
+        driver_ids.append(driver_id)
+    return driver_ids, rider_ids
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+async def main(args) -> int:
+    mix = MIXES[args.mix]
+    names, weights = list(mix), list(mix.values())
+
+    await reset_database(server)
+    await server.app.router.startup()
+    transport = httpx.ASGITransport(app=server.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://loadtest") as http:
+        driver_ids, rider_ids = await seed(http, args.drivers, args.riders, random.Random(args.seed))
+
+        recorder = Recorder()
+        scenarios = Scenarios(http, recorder, driver_ids, rider_ids, args.race_size)
+        deadline = time.perf_counter() + args.duration
+
+        async def client(worker: int):
+            rng = random.Random(args.seed * 1000 + worker)
+            while time.perf_counter() < deadline:
+                scenario = rng.choices(names, weights)[0]
+                try:
+                    await getattr(scenarios, scenario)(rng)
+                except Exception:
+                    recorder.errors[f"{scenario} raised"] += 1
+
+        start = time.perf_counter()
+        await asyncio.gather(*(client(worker) for worker in range(args.concurrency)))
+        elapsed = time.perf_counter() - start
+    await server.app.router.shutdown()
+
+    result = {
+        "meta": {
+            "revision": git_revision(),
+            "startedAt": datetime.utcnow().isoformat(),
+            "database": DATABASE,
+            "mix": args.mix,
+            "concurrency": args.concurrency,
+            "duration_s": args.duration,
+            "drivers": args.drivers,
+            "riders": args.riders,
+            "seed": args.seed,
+        },
+        **recorder.report(elapsed),
+    }
+    output = json.dumps(result, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    print(output)
+    return 1 if result["errors"] else 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--duration', type=float, default=10.0, help='seconds of traffic after seeding')
+    parser.add_argument('--concurrency', type=int, default=32, help='number of concurrent clients')
+    parser.add_argument('--mix', choices=sorted(MIXES), default='default')
+    parser.add_argument('--drivers', type=int, default=500)
+    parser.add_argument('--riders', type=int, default=200)
+    parser.add_argument('--race-size', type=int, default=5, help='drivers competing in each accept race')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help='also write the JSON result to this file')
+    args = parser.parse_args()
+    raise SystemExit(asyncio.run(main(args)))
@@ -51,20 +51,27 @@ export const rideAPI = {
     api.post(`/rides?rider_id=${riderId}`, rideData),
   getRide: (rideId: string) => api.get(`/rides/${rideId}`),
   updateRide: (rideId: string, updateData: any) => api.put(`/rides/${rideId}`, updateData),
-  getRiderRides: (riderId: string) => api.get(`/rides/rider/${riderId}`),
-  getDriverRides: (driverId: string) => api.get(`/rides/driver/${driverId}`),
-  getAvailableRides: () => api.get('/rides/available'),
+  getRiderRides: (riderId: string, cursor?: string, limit?: number) =>
+    api.get(`/rides/rider/${riderId}`, { params: { cursor, limit } }),
+  getDriverRides: (driverId: string, cursor?: string, limit?: number) =>
+    api.get(`/rides/driver/${driverId}`, { params: { cursor, limit } }),
+  getAvailableRides: (latitude?: number, longitude?: number, radius?: number) =>
+    api.get('/rides/available', { params: { latitude, longitude, radius } }),
 };
 
 // Driver API
 export const driverAPI = {
   updateLocation: (driverId: string, location: { latitude: number; longitude: number }) =>
     api.put(`/drivers/${driverId}/location`, location),
+  updateLocationsBatch: (updates: { driverId: string; latitude: number; longitude: number; timestamp?: string }[]) =>
+    api.post('/drivers/locations:batch', { updates }),
   updateStatus: (driverId: string, isOnline: boolean) =>
     api.put(`/drivers/${driverId}/status`, { isOnline }),
   getNearbyDrivers: (latitude: number, longitude: number, radius?: number) =>
     api.get('/drivers/nearby', { params: { latitude, longitude, radius } }),
   getDriver: (driverId: string) => api.get(`/drivers/${driverId}`),
+  getEarnings: (driverId: string, period: 'day' | 'week' | 'all' = 'day', date?: string) =>
+    api.get(`/drivers/${driverId}/earnings`, { params: { period, date } }),
   acceptRide: (driverId: string, rideId: string) =>
     api.put(`/drivers/${driverId}/accept-ride?ride_id=${rideId}`),
 };
@@ -73,7 +80,30 @@ export const driverAPI = {
 export const ratingAPI = {
   createRating: (ratingData: any, raterId: string) =>
     api.post(`/ratings?rater_id=${raterId}`, ratingData),
-  getUserRatings: (userId: string) => api.get(`/ratings/${userId}`),
+  getUserRatings: (userId: string, cursor?: string, limit?: number) =>
+    api.get(`/ratings/${userId}`, { params: { cursor, limit } }),
+};
+
+// Realtime API: push channel replacing polling of rides and driver positions
+type RealtimeSubscription = {
+  ride?: string;
+  driver?: string;
+  area?: { latitude: number; longitude: number };
+};
+
+export const realtimeAPI = {
+  connect: (onMessage: (message: any) => void) => {
+    const socket = new WebSocket(`${API_BASE_URL?.replace(/^http/, 'ws')}/api/ws`);
+    socket.onmessage = (event) => onMessage(JSON.parse(event.data));
+    return {
+      socket,
+      subscribe: (subscription: RealtimeSubscription) =>
+        socket.send(JSON.stringify({ action: 'subscribe', ...subscription })),
+      unsubscribe: (subscription: RealtimeSubscription) =>
+        socket.send(JSON.stringify({ action: 'unsubscribe', ...subscription })),
+      close: () => socket.close(),
+    };
+  },
 };
 
 export default api;
\ No newline at end of file
@@ -0,0 +1,63 @@
+import os
+import sys
+
+import pytest
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "backend")
+sys.path.insert(0, BACKEND_DIR)
+
+# server.py reads these at import time, the fixtures below swap in mongomock
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "airide_test")
+
+
+class FakeClock:
+    """Monotonic clock that only moves when a test sets ``now``"""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture
+def mongo():
+    """An empty in-memory Motor database"""
+    mongomock_motor = pytest.importorskip("mongomock_motor")
+    return mongomock_motor.AsyncMongoMockClient()[os.environ["DB_NAME"]]
+
+
+@pytest.fixture
+def api():
+    """TestClient over the app with a fresh in-memory database"""
+    mongomock_motor = pytest.importorskip("mongomock_motor")
+    from fastapi.testclient import TestClient
+
+    import server
+
+    mock = mongomock_motor.AsyncMongoMockClient()
+    server.client = mock
+    server.db = mock[os.environ["DB_NAME"]]
+    server.verification_store = server.build_verification_store()
+    with TestClient(server.app) as client:
+        yield client
+
+
+@pytest.fixture
+def register(api):
+    def register(phone: str, user_type: str = "driver") -> str:
+        response = api.post("/api/auth/register", json={"phone": phone, "userType": user_type})
+        assert response.status_code == 200, response.text
+        return response.json()["id"]
+    return register
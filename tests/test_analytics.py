@@ -0,0 +1,94 @@
+from datetime import datetime, timedelta
+
+import pyarrow as pa
+import pytest
+
+import analytics
+from snapshot import RATING_SCHEMA, SnapshotWriter, read_table, write_table
+
+DAY = datetime(2026, 10, 1, 12, 0)
+
+
+def ride(ride_id, rider_id, driver_id, fare=100.0):
+    return {
+        "id": ride_id,
+        "riderId": rider_id,
+        "driverId": driver_id,
+        "status": "completed",
+        "pickup": {"latitude": 9.0, "longitude": 38.7},
+        "destination": {"latitude": 9.1, "longitude": 38.8},
+        "fare": fare,
+        "surgeMultiplier": 1.0,
+        "distance": 5.0,
+        "createdAt": DAY,
+    }
+
+
+def rating(rating_id, ride_id, rater_id, rated_id, stars, minute=0):
+    return {
+        "id": rating_id,
+        "rideId": ride_id,
+        "raterId": rater_id,
+        "ratedId": rated_id,
+        "rating": stars,
+        "createdAt": DAY.replace(minute=minute),
+    }
+
+
+@pytest.fixture
+async def seeded(mongo):
+    await mongo.rides.insert_many([ride("r1", "u1", "d1"), ride("r2", "u2", "d2")])
+    await mongo.ratings.insert_many([
+        rating("a", "r1", "u1", "d1", 5, 1),
+        rating("b", "r1", "d1", "u1", 1, 2),  # the driver rating the rider
+        rating("c", "r2", "u2", "d2", 4, 3),
+    ])
+    return mongo
+
+
+@pytest.mark.anyio
+async def test_driver_distribution_skips_ratings_of_riders(seeded, tmp_path):
+    written = await SnapshotWriter(tmp_path).export(seeded, batch_size=2)
+    assert written == {"rides": 2, "ratings": 3}
+
+    result = analytics.report(tmp_path)["driverRatings"]
+    assert result["ratings"] == 2
+    assert result["histogram"] == {"1": 0, "2": 0, "3": 0, "4": 1, "5": 1}
+    assert result["drivers"] == 2
+    assert [driver["driverId"] for driver in result["lowestRated"]] == ["d2", "d1"]
+
+
+@pytest.mark.anyio
+async def test_partitions_written_before_driver_ids_still_load(seeded, tmp_path):
+    old_schema = pa.schema([field for field in RATING_SCHEMA if field.name != "driverId"])
+    old = pa.Table.from_pylist([rating("z", "r0", "u9", "d9", 2)], schema=old_schema)
+    path = SnapshotWriter(tmp_path).partition_path("ratings", "2026-10-01")
+    path.parent.mkdir(parents=True)
+    write_table(old, path)
+
+    await SnapshotWriter(tmp_path).export(seeded)
+    merged = read_table(path)
+    assert merged.schema == RATING_SCHEMA
+    assert merged["id"].to_pylist() == ["z", "a", "b", "c"]
+    assert merged["driverId"].to_pylist() == [None, "d1", "d1", "d2"]
+    # Untagged ratings are left out until the snapshot is rebuilt
+    assert analytics.report(tmp_path)["driverRatings"]["ratings"] == 2
+
+    await seeded.rides.insert_one(ride("r0", "u9", "d9"))
+    await seeded.ratings.insert_one(rating("z", "r0", "u9", "d9", 2))
+    await SnapshotWriter(tmp_path).export(seeded, rebuild=True)
+    assert read_table(path)["driverId"].to_pylist() == ["d9", "d1", "d1", "d2"]
+    assert analytics.report(tmp_path)["driverRatings"]["ratings"] == 3
+
+
+@pytest.mark.anyio
+async def test_late_rating_with_an_earlier_created_at_is_exported(seeded, tmp_path):
+    writer = SnapshotWriter(tmp_path, overlap=timedelta(minutes=5))
+    await writer.export(seeded)
+    # Committed after the run by a worker whose clock is two minutes behind
+    await seeded.ratings.insert_one(rating("late", "r2", "u2", "d2", 3, minute=1))
+
+    assert (await writer.export(seeded))["ratings"] >= 1
+    ids = read_table(writer.partition_path("ratings", "2026-10-01"))["id"].to_pylist()
+    assert sorted(ids) == ["a", "b", "c", "late"]
+    assert writer.load_state()["ratings"] == DAY.replace(minute=3)
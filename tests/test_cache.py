@@ -0,0 +1,115 @@
+import asyncio
+
+import pytest
+
+from cache import AsyncTTLCache
+
+pytestmark = pytest.mark.anyio
+
+
+def counting_loader(value, calls, gate=None):
+    async def load():
+        calls.append(value)
+        if gate is not None:
+            await gate.wait()
+        return value
+    return load
+
+
+async def test_concurrent_misses_share_one_load():
+    cache = AsyncTTLCache()
+    calls = []
+    gate = asyncio.Event()
+    tasks = [asyncio.create_task(cache.get_or_load("k", counting_loader("v", calls, gate))) for _ in range(5)]
+    await asyncio.sleep(0)
+    gate.set()
+    assert await asyncio.gather(*tasks) == ["v"] * 5
+    assert calls == ["v"]
+    assert cache.stats["coalesced"] == 4
+
+
+async def test_failed_load_is_not_cached():
+    cache = AsyncTTLCache()
+
+    async def fail():
+        raise RuntimeError("down")
+
+    with pytest.raises(RuntimeError):
+        await cache.get_or_load("k", fail)
+    calls = []
+    assert await cache.get_or_load("k", counting_loader("v", calls)) == "v"
+    assert calls == ["v"]
+
+
+async def test_entries_expire_after_the_ttl(clock):
+    cache = AsyncTTLCache(ttl_seconds=30, clock=clock)
+    calls = []
+    await cache.get_or_load("k", counting_loader("v1", calls))
+    clock.now = 29.9
+    assert await cache.get_or_load("k", counting_loader("v2", calls)) == "v1"
+    clock.now = 30.0
+    assert await cache.get_or_load("k", counting_loader("v2", calls)) == "v2"
+    assert cache.stats["expirations"] == 1
+
+
+async def test_least_recently_used_entry_is_evicted():
+    cache = AsyncTTLCache(maxsize=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.peek("a") == (True, 1)
+    cache.set("c", 3)
+    assert cache.peek("b") == (False, None)
+    assert cache.peek("a") == (True, 1)
+    assert cache.stats["evictions"] == 1
+
+
+async def test_none_results_are_cached():
+    cache = AsyncTTLCache()
+    calls = []
+    await cache.get_or_load("missing", counting_loader(None, calls))
+    await cache.get_or_load("missing", counting_loader(None, calls))
+    assert calls == [None]
+
+
+async def test_invalidation_during_a_load_drops_its_result():
+    cache = AsyncTTLCache()
+    calls = []
+    gate = asyncio.Event()
+    task = asyncio.create_task(cache.get_or_load("k", counting_loader("stale", calls, gate)))
+    await asyncio.sleep(0)
+    cache.invalidate("k")
+    gate.set()
+    assert await task == "stale"
+    # The stale value was not stored, the next read loads again
+    assert await cache.get_or_load("k", counting_loader("fresh", calls)) == "fresh"
+
+
+async def test_invalidate_forwards_and_discard_does_not():
+    cache = AsyncTTLCache()
+    forwarded = []
+    cache.forward = forwarded.append
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.invalidate("a")
+    cache.discard("b")
+    assert forwarded == [("a",)]
+    assert len(cache) == 0
+
+
+async def test_cancelling_the_first_caller_does_not_cancel_the_others():
+    cache = AsyncTTLCache()
+    calls = []
+    gate = asyncio.Event()
+    first = asyncio.create_task(cache.get_or_load("k", counting_loader("v", calls, gate)))
+    await asyncio.sleep(0)
+    second = asyncio.create_task(cache.get_or_load("k", counting_loader("other", calls)))
+    await asyncio.sleep(0)
+
+    first.cancel()
+    await asyncio.sleep(0)
+    gate.set()
+    assert await second == "v"
+    assert first.cancelled()
+    assert calls == ["v"]
+    # The abandoned load still filled the cache
+    assert cache.peek("k") == (True, "v")
@@ -0,0 +1,369 @@
+import asyncio
+import os
+import uuid
+
+import pytest
+
+import server
+from change_stream import ChangeStreamConsumer, DriverChange, RatingChange, RideChange, to_event
+
+PICKUP = {"latitude": 9.0192, "longitude": 38.7525}
+DESTINATION = {"latitude": 9.05, "longitude": 38.78}
+
+
+def change(collection, operation, document=None, updated_fields=None, before=None, key="oid-1"):
+    raw = {"operationType": operation, "ns": {"db": "airide", "coll": collection}, "documentKey": {"_id": key}}
+    if document is not None:
+        raw["fullDocument"] = {"_id": key, **document}
+    if updated_fields is not None:
+        raw["updateDescription"] = {"updatedFields": updated_fields, "removedFields": []}
+    if before is not None:
+        raw["fullDocumentBeforeChange"] = {"_id": key, **before}
+    return raw
+
+
+def test_to_event_types_and_ids():
+    event = to_event(change("rides", "update", {"id": "r1", "status": "accepted"}, {"status": "accepted"}))
+    assert isinstance(event, RideChange)
+    assert (event.document_id, event.document_key) == ("r1", "oid-1")
+    assert "_id" not in event.document
+    assert event.updated_fields == {"status": "accepted"}
+    assert to_event(change("users", "insert", {"id": "u1"})) is None
+
+
+def test_delete_uses_the_pre_image_when_there_is_one():
+    event = to_event(change("drivers", "delete", before={"id": "d1", "isOnline": True}))
+    assert isinstance(event, DriverChange)
+    assert event.document_id == "d1"
+
+    event = to_event(change("drivers", "delete"))
+    assert (event.document_id, event.document, event.document_key) == (None, None, "oid-1")
+
+
+@pytest.mark.anyio
+async def test_dispatch_awaits_coroutine_handlers_and_counts_errors(mongo):
+    consumer = ChangeStreamConsumer(mongo, handler_attempts=1)
+    seen = []
+
+    async def handler(event):
+        seen.append(event.document_id)
+
+    def broken(event):
+        raise RuntimeError("boom")
+
+    consumer.on(RatingChange, handler)
+    consumer.on(RatingChange, broken)
+    assert await consumer.dispatch(to_event(change("ratings", "insert", {"id": "x", "ratedId": "d1"}))) is False
+    assert seen == ["x"]
+    assert (consumer.stats["handlerErrors"], consumer.stats["skipped"]) == (1, 1)
+
+
+@pytest.mark.anyio
+async def test_dispatch_retries_only_the_failed_handler(mongo):
+    consumer = ChangeStreamConsumer(mongo, handler_attempts=3, retry_delay_s=0)
+    calls = {"ok": 0, "flaky": 0}
+
+    def ok(event):
+        calls["ok"] += 1
+
+    def flaky(event):
+        calls["flaky"] += 1
+        if calls["flaky"] == 1:
+            raise RuntimeError("cache backend blinked")
+
+    consumer.on(RideChange, ok)
+    consumer.on(RideChange, flaky)
+    assert await consumer.dispatch(to_event(change("rides", "insert", {"id": "r1"}))) is True
+    assert calls == {"ok": 1, "flaky": 2}
+    assert consumer.stats["skipped"] == 0
+
+
+class ScriptedStream:
+    """Async context manager and iterator over canned change documents"""
+
+    def __init__(self, changes):
+        self.changes = changes
+        self.resume_token = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def __aiter__(self):
+        for raw in self.changes:
+            self.resume_token = raw["_id"]
+            yield raw
+
+
+class ScriptedDatabase:
+    """Hands out one scripted stream per watch() call, then empty ones"""
+
+    def __init__(self, mongo, *streams):
+        self.mongo = mongo
+        self.streams = list(streams)
+        self.watches = []
+
+    def __getitem__(self, name):
+        return self.mongo[name]
+
+    def watch(self, pipeline, **options):
+        self.watches.append(options)
+        return ScriptedStream(self.streams.pop(0) if self.streams else [])
+
+
+def tokened(raw, token):
+    return {"_id": {"_data": token}, **raw}
+
+
+@pytest.mark.anyio
+async def test_invalidate_restarts_after_the_event_with_backoff(mongo, monkeypatch):
+    sleeps = []
+    real_sleep = asyncio.sleep
+
+    async def sleep(delay):
+        sleeps.append(delay)
+        if len(sleeps) >= 4:
+            raise asyncio.CancelledError
+        await real_sleep(0)
+
+    monkeypatch.setattr(asyncio, "sleep", sleep)
+    db = ScriptedDatabase(
+        mongo,
+        [tokened(change("rides", "insert", {"id": "r1"}), "t1"), {"_id": {"_data": "t2"}, "operationType": "invalidate"}],
+        [tokened(change("rides", "insert", {"id": "r2"}), "t3")],
+    )
+    consumer = ChangeStreamConsumer(db, name="worker-1", restart_delay_s=1, max_restart_delay_s=4)
+    seen = []
+    consumer.on(RideChange, lambda event: seen.append(event.document_id))
+
+    with pytest.raises(asyncio.CancelledError):
+        await consumer._run()
+
+    assert seen == ["r1", "r2"]
+    assert db.watches[0]["resume_after"] is None
+    assert db.watches[1]["start_after"] == {"_data": "t2"}
+    assert db.watches[2]["resume_after"] == {"_data": "t3"}
+    # Streams that end straight away never restart in a hot loop
+    assert sleeps == [1, 2, 4, 4]
+    saved = await mongo.change_stream_tokens.find_one({"_id": "worker-1"})
+    assert (saved["token"], saved["startAfter"]) == ({"_data": "t2"}, True)
+
+
+# Handlers against the app, fed with synthetic change documents
+
+def online_driver(api, register, phone):
+    driver_id = register(phone)
+    api.put(f"/api/drivers/{driver_id}/location", json=PICKUP)
+    api.put(f"/api/drivers/{driver_id}/status", json={"isOnline": True})
+    return driver_id
+
+
+def nearby_ids(api):
+    response = api.get("/api/drivers/nearby", params={**PICKUP, "view": "summary"})
+    return [driver["id"] for driver in response.json()]
+
+
+def feed_ids(api):
+    return [ride["id"] for ride in api.get("/api/rides/available").json()]
+
+
+def handle(api, handler, raw):
+    api.portal.call(handler, to_event(raw))
+
+
+def test_admin_status_write_reaches_nearby(api, register):
+    driver_id = online_driver(api, register, "+251911100001")
+    assert driver_id in nearby_ids(api)
+    document = {"id": driver_id, "isOnline": False, "location": {**PICKUP, "address": None}}
+    handle(api, server.on_driver_change, change("drivers", "update", document, {"isOnline": False}))
+    assert driver_id not in nearby_ids(api)
+
+
+def test_admin_location_write_moves_the_driver(api, register):
+    driver_id = online_driver(api, register, "+251911100002")
+    moved = {"latitude": 9.5, "longitude": 38.5, "address": None}
+    handle(api, server.on_driver_change, change(
+        "drivers", "update", {"id": driver_id, "isOnline": True, "location": moved}, {"location.latitude": 9.5},
+    ))
+    assert server.driver_states.get(driver_id).latitude == 9.5
+    assert driver_id not in nearby_ids(api)
+
+
+def test_own_checkpoint_is_skipped(api, register):
+    driver_id = online_driver(api, register, "+251911100003")
+    state = server.driver_states.get(driver_id)
+    document = {
+        "id": driver_id,
+        "isOnline": False,  # stale in the looked-up document, must not be applied
+        "location": {"latitude": 1.0, "longitude": 1.0, "address": None},
+        "reportedAt": state.reported_at,
+        "statusAt": state.status_at,
+    }
+    handle(api, server.on_driver_change, change("drivers", "update", document, {"reportedAt": state.reported_at}))
+    assert driver_id in nearby_ids(api)
+
+
+def test_older_checkpoint_from_another_worker_is_ignored(api, register):
+    driver_id = online_driver(api, register, "+251911100004")
+    state = server.driver_states.get(driver_id)
+    stale = state.reported_at.replace(year=state.reported_at.year - 1)
+    document = {
+        "id": driver_id,
+        "isOnline": True,
+        "location": {"latitude": 1.0, "longitude": 1.0, "address": None},
+        "reportedAt": stale,
+        "statusAt": state.status_at,
+    }
+    handle(api, server.on_driver_change, change("drivers", "update", document, {"reportedAt": stale}))
+    assert server.driver_states.get(driver_id).latitude == PICKUP["latitude"]
+
+
+def test_registration_insert_does_not_reset_live_state(api, register):
+    driver_id = online_driver(api, register, "+251911100005")
+    document = {"id": driver_id, "isOnline": False, "location": None}
+    handle(api, server.on_driver_change, change("drivers", "insert", document))
+    assert driver_id in nearby_ids(api)
+
+
+def test_driver_unknown_to_this_worker_is_loaded_from_the_document(api, register):
+    driver_id = register("+251911100007")
+    # Registered and put online by another worker
+    server.driver_states.remove(driver_id)
+    document = {"id": driver_id, "isOnline": True, "location": {**PICKUP, "address": None}}
+    api.portal.call(server.db.drivers.update_one, {"id": driver_id}, {"$set": document})
+    handle(api, server.on_driver_change, change("drivers", "update", document, {"isOnline": True}))
+    assert driver_id in nearby_ids(api)
+
+
+def test_deleted_driver_is_forgotten_without_a_pre_image(api, register):
+    driver_id = online_driver(api, register, "+251911100006")
+    api.portal.call(server.db.drivers.delete_one, {"id": driver_id})
+    handle(api, server.on_driver_change, change("drivers", "delete"))
+    assert driver_id not in server.driver_states
+    assert driver_id not in nearby_ids(api)
+
+
+def create_ride(api):
+    response = api.post("/api/rides", params={"rider_id": "rider-1"}, json={"pickup": PICKUP, "destination": DESTINATION})
+    return response.json()["id"]
+
+
+def test_deleted_ride_leaves_the_feed_with_a_pre_image(api):
+    ride_id = create_ride(api)
+    assert ride_id in feed_ids(api)
+    handle(api, server.on_ride_change, change("rides", "delete", before={"id": ride_id, "status": "requested"}))
+    assert ride_id not in feed_ids(api)
+    assert server.dispatcher.offer_for(ride_id) is None
+
+
+def test_deleted_ride_leaves_the_feed_without_a_pre_image(api):
+    kept, deleted = create_ride(api), create_ride(api)
+    api.portal.call(server.db.rides.delete_one, {"id": deleted})
+    handle(api, server.on_ride_change, change("rides", "delete"))
+    assert feed_ids(api) == [kept]
+
+
+# Against a real replica set, a single-node one is enough:
+#   mongod --replSet rs0 && mongosh --eval 'rs.initiate()'
+
+REPLICA_SET_URL = os.environ.get("CHANGE_STREAM_TEST_URL", "mongodb://localhost:27017/?directConnection=true")
+
+
+@pytest.fixture
+async def replica_set():
+    from motor.motor_asyncio import AsyncIOMotorClient
+    from pymongo.errors import PyMongoError
+
+    client = AsyncIOMotorClient(REPLICA_SET_URL, serverSelectionTimeoutMS=1000)
+    try:
+        hello = await client.admin.command("hello")
+    except PyMongoError:
+        client.close()
+        pytest.skip(f"No MongoDB at {REPLICA_SET_URL}")
+    if "setName" not in hello:
+        client.close()
+        pytest.skip("Change streams need a replica set")
+    db = client[f"airide_change_stream_{uuid.uuid4().hex[:8]}"]
+    yield db
+    await client.drop_database(db.name)
+    client.close()
+
+
+async def wait_for(condition, timeout=10.0):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not condition():
+        assert asyncio.get_running_loop().time() < deadline, "timed out waiting for change events"
+        await asyncio.sleep(0.05)
+
+
+async def started(consumer):
+    consumer.start()
+    # Give the stream time to open before writing
+    await asyncio.sleep(0.5)
+    return consumer
+
+
+@pytest.mark.anyio
+async def test_consumer_delivers_ride_changes(replica_set):
+    events = []
+    consumer = ChangeStreamConsumer(replica_set, full_document_before_change="whenAvailable")
+    consumer.on(RideChange, events.append)
+    await started(consumer)
+    try:
+        await replica_set.rides.insert_one({"id": "r1", "status": "requested"})
+        await replica_set.rides.update_one({"id": "r1"}, {"$set": {"status": "accepted"}})
+        await replica_set.rides.delete_one({"id": "r1"})
+        await wait_for(lambda: len(events) == 3)
+    finally:
+        await consumer.stop()
+    assert [event.operation for event in events] == ["insert", "update", "delete"]
+    assert events[1].updated_fields == {"status": "accepted"}
+    assert events[2].document_key is not None
+
+
+@pytest.mark.anyio
+async def test_delete_carries_the_pre_image_when_enabled(replica_set):
+    await replica_set.create_collection("rides")
+    try:
+        await replica_set.command("collMod", "rides", changeStreamPreAndPostImages={"enabled": True})
+    except Exception:
+        pytest.skip("Pre-images need MongoDB 6.0+")
+    events = []
+    consumer = ChangeStreamConsumer(replica_set, full_document_before_change="whenAvailable")
+    consumer.on(RideChange, events.append)
+    await replica_set.rides.insert_one({"id": "r1", "status": "requested"})
+    await started(consumer)
+    try:
+        await replica_set.rides.delete_one({"id": "r1"})
+        await wait_for(lambda: events)
+    finally:
+        await consumer.stop()
+    assert events[0].document_id == "r1"
+
+
+@pytest.mark.anyio
+async def test_consumer_resumes_from_its_saved_token(replica_set):
+    first = []
+    consumer = ChangeStreamConsumer(replica_set, name="worker-1", checkpoint_every=1)
+    consumer.on(RatingChange, first.append)
+    await started(consumer)
+    await replica_set.ratings.insert_one({"id": "a", "ratedId": "d1"})
+    await wait_for(lambda: first)
+    await consumer.stop()
+
+    # Written while nobody is watching
+    await replica_set.ratings.insert_one({"id": "b", "ratedId": "d1"})
+
+    second = []
+    consumer = ChangeStreamConsumer(replica_set, name="worker-1")
+    consumer.on(RatingChange, second.append)
+    await started(consumer)
+    try:
+        await wait_for(lambda: second)
+    finally:
+        await consumer.stop()
+    assert [event.document_id for event in second] == ["b"]
+    saved = await replica_set.change_stream_tokens.find_one({"_id": "worker-1"})
+    assert saved["token"] and saved["savedAt"]
@@ -0,0 +1,88 @@
+import pytest
+
+from dispatch import Dispatcher
+from geo_index import GeoGridIndex
+
+
+@pytest.fixture
+def make_dispatcher(clock):
+    def make(drivers, **kwargs):
+        index = GeoGridIndex()
+        for driver_id, (latitude, longitude) in drivers.items():
+            index.upsert(driver_id, latitude, longitude)
+        sent = []
+        dispatcher = Dispatcher(index, lambda *offer: sent.append(offer), clock=clock, **kwargs)
+        return dispatcher, sent
+    return make
+
+
+def test_each_ride_goes_to_its_closest_free_driver(make_dispatcher):
+    dispatcher, sent = make_dispatcher({"near": (9.000, 38.000), "far": (9.010, 38.000)})
+    dispatcher.submit("r1", 9.001, 38.000)
+    dispatcher.submit("r2", 9.011, 38.000)
+    assert dispatcher.tick() == 2
+    assert {(driver, ride) for driver, ride, _ in sent} == {("near", "r1"), ("far", "r2")}
+    assert dispatcher.waiting == 0 and dispatcher.outstanding == 2
+
+
+def test_greedy_match_does_not_give_one_driver_two_rides(make_dispatcher):
+    dispatcher, sent = make_dispatcher({"d1": (9.000, 38.000)})
+    dispatcher.submit("r1", 9.001, 38.000)
+    dispatcher.submit("r2", 9.002, 38.000)
+    assert dispatcher.tick() == 1
+    assert sent[0][:2] == ("d1", "r1")
+    assert dispatcher.waiting == 1
+
+
+def test_drivers_outside_the_radius_are_not_offered(make_dispatcher):
+    dispatcher, sent = make_dispatcher({"d1": (9.2, 38.0)}, search_radius_km=5.0)
+    dispatcher.submit("r1", 9.0, 38.0)
+    assert dispatcher.tick() == 0
+    assert sent == []
+
+
+def test_declined_ride_goes_to_the_next_driver(make_dispatcher):
+    dispatcher, sent = make_dispatcher({"d1": (9.000, 38.000), "d2": (9.005, 38.000)})
+    dispatcher.submit("r1", 9.000, 38.000)
+    dispatcher.tick()
+    assert not dispatcher.decline("r1", "d2")  # only the offered driver can decline
+    assert dispatcher.decline("r1", "d1")
+    dispatcher.tick()
+    assert [driver for driver, _, _ in sent] == ["d1", "d2"]
+    assert dispatcher.stats["offersDeclined"] == 1
+
+
+def test_unanswered_offer_expires(make_dispatcher, clock):
+    dispatcher, sent = make_dispatcher({"d1": (9.000, 38.000), "d2": (9.005, 38.000)}, offer_timeout_s=15)
+    dispatcher.submit("r1", 9.000, 38.000)
+    dispatcher.tick()
+    clock.now = 14.9
+    dispatcher.tick()
+    assert len(sent) == 1
+    clock.now = 15.0
+    dispatcher.tick()
+    assert [driver for driver, _, _ in sent] == ["d1", "d2"]
+    assert dispatcher.stats["offersExpired"] == 1
+
+
+def test_resolve_counts_an_acceptance_once_and_marks_the_driver_busy(make_dispatcher, clock):
+    dispatcher, sent = make_dispatcher({"d1": (9.000, 38.000)})
+    dispatcher.submit("r1", 9.000, 38.000)
+    dispatcher.tick()
+    clock.now = 3.0
+    dispatcher.resolve("r1", "d1")
+    dispatcher.resolve("r1", "d1")
+    assert dispatcher.stats["accepted"] == 1
+    assert dispatcher.stats["matchLatencyTotal"] == 3.0
+    dispatcher.submit("r2", 9.000, 38.000)
+    assert dispatcher.tick() == 0
+    dispatcher.release("d1")
+    assert dispatcher.tick() == 1
+
+
+def test_cancelled_ride_is_forgotten(make_dispatcher):
+    dispatcher, sent = make_dispatcher({"d1": (9.000, 38.000)})
+    dispatcher.submit("r1", 9.000, 38.000)
+    dispatcher.resolve("r1")
+    assert dispatcher.tick() == 0
+    assert dispatcher.stats["accepted"] == 0
@@ -0,0 +1,83 @@
+import json
+from datetime import datetime, timedelta, timezone
+
+import server
+
+
+def location(api, driver_id):
+    return api.get(f"/api/drivers/{driver_id}").json()["location"]
+
+
+def test_timezone_aware_timestamp_is_accepted(api, register):
+    driver_id = register("+251911000001")
+    api.put(f"/api/drivers/{driver_id}/location", json={"latitude": 9.02, "longitude": 38.72})
+    now = datetime.now(timezone.utc).isoformat()
+    response = api.post("/api/drivers/locations:batch", json={"updates": [
+        {"driverId": driver_id, "latitude": 9.01, "longitude": 38.71, "timestamp": now},
+    ]})
+    assert response.status_code == 200
+    assert response.json()["accepted"] == 1
+
+
+def test_future_batch_report_does_not_pin_the_driver(api, register):
+    driver_id = register("+251911000002")
+    future = (datetime.utcnow() + timedelta(days=1)).isoformat()
+    api.post("/api/drivers/locations:batch", json={"updates": [
+        {"driverId": driver_id, "latitude": 9.01, "longitude": 38.71, "timestamp": future},
+    ]})
+    api.put(f"/api/drivers/{driver_id}/location", json={"latitude": 9.02, "longitude": 38.72})
+    assert location(api, driver_id)["latitude"] == 9.02
+
+
+def test_stale_batch_report_is_not_published(api, register):
+    driver_id = register("+251911000003")
+    api.put(f"/api/drivers/{driver_id}/location", json={"latitude": 9.02, "longitude": 38.72})
+    published = []
+    forward = server.events.forward
+    server.events.forward = lambda topic, message: published.append(topic)
+    try:
+        stale = (datetime.utcnow() - timedelta(minutes=5)).isoformat()
+        response = api.post("/api/drivers/locations:batch", json={"updates": [
+            {"driverId": driver_id, "latitude": 9.5, "longitude": 38.5, "timestamp": stale},
+        ]})
+    finally:
+        server.events.forward = forward
+    assert response.json() == {"accepted": 0, "superseded": 1, "dropped": 0}
+    assert published == []
+    assert location(api, driver_id)["latitude"] == 9.02
+
+
+def test_shed_location_update_returns_503(api, register, monkeypatch):
+    driver_id = register("+251911000004")
+    monkeypatch.setattr(server.driver_states, "max_dirty", 0)
+    response = api.put(f"/api/drivers/{driver_id}/location", json={"latitude": 9.02, "longitude": 38.72})
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "1"
+
+
+def test_report_timestamps_are_naive_utc():
+    report = server.DriverLocationReport(
+        driverId="d1", latitude=9.0, longitude=38.7, timestamp="2026-01-01T12:00:00+03:00",
+    )
+    assert report.timestamp == datetime(2026, 1, 1, 9)
+
+
+def test_oversized_batch_is_rejected(api):
+    updates = [{"driverId": "d1", "latitude": 9.0, "longitude": 38.7}] * 10001
+    response = api.post("/api/drivers/locations:batch", json={"updates": updates})
+    assert response.status_code == 422
+
+
+def test_invalid_coordinates_leave_the_driver_untouched(api, register):
+    driver_id = register("+251911000009")
+    api.put(f"/api/drivers/{driver_id}/location", json={"latitude": 9.02, "longitude": 38.75})
+
+    # Sent as raw JSON, httpx refuses to encode NaN and Infinity
+    headers = {"Content-Type": "application/json"}
+    body = json.dumps({"latitude": float("nan"), "longitude": 38.75})
+    assert api.put(f"/api/drivers/{driver_id}/location", content=body, headers=headers).status_code == 422
+    body = json.dumps({"updates": [{"driverId": driver_id, "latitude": 9.02, "longitude": float("-inf")}]})
+    assert api.post("/api/drivers/locations:batch", content=body, headers=headers).status_code == 422
+    body = json.dumps({"latitude": 9.02, "longitude": 200.0})
+    assert api.put(f"/api/drivers/{driver_id}/location", content=body, headers=headers).status_code == 422
+    assert server.driver_states.get(driver_id).latitude == 9.02
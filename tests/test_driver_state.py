@@ -0,0 +1,180 @@
+import asyncio
+import time
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from driver_state import APPLIED, SHED, SUPERSEDED, UNKNOWN, DriverStateStore, as_naive_utc
+
+
+def make_store(**kwargs) -> DriverStateStore:
+    store = DriverStateStore(**kwargs)
+    store.load({"id": "d1", "isOnline": True, "location": {"latitude": 9.0, "longitude": 38.7}})
+    return store
+
+
+def test_as_naive_utc_converts_aware_timestamps():
+    aware = datetime(2026, 1, 1, 12, tzinfo=timezone(timedelta(hours=3)))
+    assert as_naive_utc(aware) == datetime(2026, 1, 1, 9)
+    assert as_naive_utc(datetime(2026, 1, 1, 9)) == datetime(2026, 1, 1, 9)
+
+
+def test_update_location_applies_and_reindexes():
+    store = make_store()
+    assert store.update_location("d1", 9.01, 38.71) == APPLIED
+    assert store.get("d1").latitude == 9.01
+    assert [state.driver_id for _, state in store.nearby(9.01, 38.71, 1)] == ["d1"]
+    assert store.dirty == 1
+
+
+def test_unknown_driver_is_reported():
+    assert make_store().update_location("nobody", 9.0, 38.7) == UNKNOWN
+
+
+def test_older_report_is_superseded():
+    store = make_store()
+    now = datetime.utcnow()
+    assert store.update_location("d1", 9.01, 38.71, now) == APPLIED
+    assert store.update_location("d1", 9.05, 38.75, now - timedelta(seconds=5)) == SUPERSEDED
+    assert store.get("d1").latitude == 9.01
+
+
+def test_aware_timestamp_compares_with_naive_state():
+    store = make_store()
+    assert store.update_location("d1", 9.01, 38.71, datetime.utcnow() - timedelta(seconds=1)) == APPLIED
+    assert store.update_location("d1", 9.02, 38.72, datetime.now(timezone.utc)) == APPLIED
+    assert store.get("d1").reported_at.tzinfo is None
+
+
+def test_future_report_is_clamped_to_now():
+    store = make_store()
+    assert store.update_location("d1", 9.01, 38.71, datetime.utcnow() + timedelta(days=1)) == APPLIED
+    assert store.get("d1").reported_at <= datetime.utcnow()
+    # A later live report still moves the driver
+    assert store.update_location("d1", 9.02, 38.72) == APPLIED
+    assert store.get("d1").latitude == 9.02
+
+
+def test_superseded_counts_only_skipped_reports():
+    store = make_store()
+    now = datetime.utcnow()
+    store.update_location("d1", 9.01, 38.71, now - timedelta(seconds=2))
+    store.update_location("d1", 9.02, 38.72, now - timedelta(seconds=1))
+    store.update_location("d1", 9.03, 38.73, now - timedelta(seconds=3))
+    assert (store.stats["superseded"], store.stats["coalesced"]) == (1, 1)
+
+
+def test_updates_are_shed_when_checkpoints_fall_behind():
+    store = make_store(max_dirty=1)
+    store.load({"id": "d2", "isOnline": True, "location": None})
+    assert store.update_location("d1", 9.01, 38.71) == APPLIED
+    assert store.update_location("d2", 9.01, 38.71) == SHED
+    assert store.get("d2").latitude is None
+
+
+def test_apply_remote_ignores_older_changes():
+    store = make_store()
+    now = datetime.utcnow()
+    store.update_location("d1", 9.01, 38.71, now)
+    store.apply_remote("d1", 9.5, 38.5, reported_at=now - timedelta(seconds=1))
+    assert store.get("d1").latitude == 9.01
+    store.apply_remote("d1", is_online=False, status_at=datetime.now(timezone.utc))
+    assert not store.get("d1").is_online
+    # Mirrored changes belong to the worker that made them, they are not checkpointed here
+    assert store.dirty == 1
+
+
+def test_apply_remote_without_timestamp_always_applies():
+    store = make_store()
+    store.set_online("d1", True)
+    store.apply_remote("d1", is_online=False)
+    assert not store.get("d1").is_online
+    assert store.nearby(9.0, 38.7, 1) == []
+
+
+def test_apply_remote_ignores_drivers_that_are_not_loaded():
+    store = make_store()
+    store.apply_remote("deleted", 9.5, 38.5, is_online=True)
+    assert "deleted" not in store
+    assert store.nearby(9.5, 38.5, 1) == []
+    assert store.dirty == 0
+
+
+async def load_from(collection, **kwargs) -> DriverStateStore:
+    store = DriverStateStore(**kwargs)
+    async for driver in collection.find({}, {"_id": False}):
+        store.load(driver)
+    store._collection = collection
+    return store
+
+
+@pytest.mark.anyio
+async def test_checkpoint_only_writes_fields_this_worker_changed(mongo):
+    await mongo.drivers.insert_one({"id": "d1", "isOnline": True, "location": {"latitude": 9.0, "longitude": 38.7}})
+    worker_a = await load_from(mongo.drivers)
+    worker_b = await load_from(mongo.drivers)
+
+    worker_a.set_online("d1", False)
+    worker_b.update_location("d1", 9.01, 38.71)
+    await worker_a.checkpoint()
+    await worker_b.checkpoint()
+
+    driver = await mongo.drivers.find_one({"id": "d1"})
+    assert driver["isOnline"] is False
+    assert driver["location"]["latitude"] == 9.01
+
+
+@pytest.mark.anyio
+async def test_checkpoint_never_overwrites_a_newer_change(mongo):
+    await mongo.drivers.insert_one({"id": "d1", "isOnline": False, "location": None})
+    worker_a = await load_from(mongo.drivers)
+    worker_b = await load_from(mongo.drivers)
+    now = datetime.utcnow()
+
+    worker_a.update_location("d1", 9.02, 38.72, now)
+    worker_b.update_location("d1", 9.01, 38.71, now - timedelta(seconds=5))
+    worker_b.set_online("d1", True)
+    time.sleep(0.002)
+    worker_a.set_online("d1", False)
+    await worker_a.checkpoint()
+    await worker_b.checkpoint()
+
+    driver = await mongo.drivers.find_one({"id": "d1"})
+    assert driver["location"]["latitude"] == 9.02
+    assert driver["isOnline"] is False
+    # A restart picks the newest state back up
+    assert (await load_from(mongo.drivers)).get("d1").reported_at == driver["reportedAt"]
+
+
+class StallingCollection:
+    """Collection whose first bulk_write never finishes, like one cut off by shutdown"""
+
+    def __init__(self, collection):
+        self.collection = collection
+        self.writing = asyncio.Event()
+        self.calls = 0
+
+    async def bulk_write(self, operations, **kwargs):
+        self.calls += 1
+        if self.calls == 1:
+            self.writing.set()
+            await asyncio.Event().wait()
+        return await self.collection.bulk_write(operations, **kwargs)
+
+
+@pytest.mark.anyio
+async def test_stop_during_a_checkpoint_keeps_its_updates(mongo):
+    await mongo.drivers.insert_one({"id": "d1", "isOnline": False, "location": None})
+    store = await load_from(mongo.drivers, checkpoint_interval_ms=1)
+    collection = StallingCollection(mongo.drivers)
+    store.start(collection)
+    store.update_location("d1", 9.01, 38.71)
+    store.set_online("d1", True)
+
+    await asyncio.wait_for(collection.writing.wait(), 1)
+    await store.stop()
+
+    driver = await mongo.drivers.find_one({"id": "d1"})
+    assert (driver["location"]["latitude"], driver["isOnline"]) == (9.01, True)
+    assert store.dirty == 0
+    assert store.stats["checkpointErrors"] == 0
@@ -0,0 +1,19 @@
+import server
+
+
+def test_earnings_date_with_an_offset_is_bucketed_in_utc(api, register):
+    driver_id = register("+251911200001")
+    api.portal.call(server.db.driver_earnings.insert_many, [
+        {"driverId": driver_id, "period": "day", "bucket": "2026-03-01", "earnings": 80.0, "rides": 1, "distance": 4.0},
+        {"driverId": driver_id, "period": "week", "bucket": "2026-W09", "earnings": 80.0, "rides": 1, "distance": 4.0},
+    ])
+
+    # 01:00 on Monday 2 March in UTC+2 is still Sunday 1 March, ISO week 9, in UTC
+    params = {"date": "2026-03-02T01:00:00+02:00"}
+    day = api.get(f"/api/drivers/{driver_id}/earnings", params={**params, "period": "day"}).json()
+    week = api.get(f"/api/drivers/{driver_id}/earnings", params={**params, "period": "week"}).json()
+    assert (day["bucket"], day["earnings"]) == ("2026-03-01", 80.0)
+    assert (week["bucket"], week["earnings"]) == ("2026-W09", 80.0)
+
+    naive = api.get(f"/api/drivers/{driver_id}/earnings", params={"date": "2026-03-02T01:00:00"}).json()
+    assert (naive["bucket"], naive["earnings"]) == ("2026-03-02", 0.0)
@@ -0,0 +1,65 @@
+import csv
+import gzip
+import io
+import json
+
+import pytest
+
+import server
+
+TOKEN = "s3cret"
+PICKUP = {"latitude": 9.0192, "longitude": 38.7525, "address": 'Bole, "Main" gate'}
+DESTINATION = {"latitude": 9.05, "longitude": 38.78}
+
+
+@pytest.fixture
+def admin(monkeypatch):
+    monkeypatch.setattr(server, "ADMIN_TOKEN", TOKEN)
+    return {"X-Admin-Token": TOKEN}
+
+
+def create_rides(api, count):
+    return [
+        api.post("/api/rides", params={"rider_id": "rider-1"}, json={"pickup": PICKUP, "destination": DESTINATION}).json()["id"]
+        for _ in range(count)
+    ]
+
+
+def test_export_is_closed_without_a_configured_token(api, monkeypatch):
+    monkeypatch.setattr(server, "ADMIN_TOKEN", None)
+    assert api.get("/api/admin/rides/export").status_code == 403
+    assert api.get("/api/admin/rides/export", headers={"X-Admin-Token": ""}).status_code == 403
+
+
+def test_export_rejects_a_wrong_token(api, admin):
+    assert api.get("/api/admin/rides/export").status_code == 403
+    assert api.get("/api/admin/rides/export", headers={"X-Admin-Token": "wrong"}).status_code == 403
+
+
+def test_ndjson_export_is_oldest_first(api, admin):
+    ids = create_rides(api, 3)
+    response = api.get("/api/admin/rides/export", headers=admin, params={"batch_size": 2})
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    assert [json.loads(line)["id"] for line in response.text.splitlines()] == ids
+
+
+def test_status_filter_and_gzipped_csv(api, admin):
+    cancelled, _ = create_rides(api, 2)
+    api.put(f"/api/rides/{cancelled}", json={"status": "cancelled"})
+    response = api.get(
+        "/api/admin/rides/export", headers=admin,
+        params={"format": "csv", "gzip": "true", "status": ["cancelled", "completed"]},
+    )
+    assert response.headers["content-type"] == "application/gzip"
+    assert 'filename="rides.csv.gz"' in response.headers["content-disposition"]
+    header, *rows = csv.reader(io.StringIO(gzip.decompress(response.content).decode()))
+    assert [row[header.index("id")] for row in rows] == [cancelled]
+    assert 'Bole, "Main" gate' in rows[0]
+
+
+def test_empty_range_exports_nothing(api, admin):
+    create_rides(api, 1)
+    response = api.get("/api/admin/rides/export", headers=admin, params={"start": "2099-01-01"})
+    assert response.status_code == 200
+    assert response.text == ""
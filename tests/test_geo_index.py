@@ -0,0 +1,58 @@
+import random
+
+import pytest
+
+from geo_index import GeoGridIndex, haversine_km
+
+
+def brute_force(points, latitude, longitude, radius_km):
+    hits = [
+        (haversine_km(latitude, longitude, lat, lon), key)
+        for key, (lat, lon) in points.items()
+    ]
+    return sorted((hit for hit in hits if hit[0] <= radius_km), key=lambda hit: hit[0])
+
+
+def test_haversine_known_distance():
+    # One degree of latitude is about 111.2 km
+    assert haversine_km(9.0, 38.0, 10.0, 38.0) == pytest.approx(111.2, abs=0.1)
+    assert haversine_km(9.0, 38.0, 9.0, 38.0) == 0.0
+
+
+@pytest.mark.parametrize("center, radius_km", [((9.0192, 38.7525), 3.0), ((9.0192, 38.7525), 40.0), ((75.0, 20.0), 15.0)])
+def test_nearby_matches_brute_force(center, radius_km):
+    rng = random.Random(7)
+    index = GeoGridIndex()
+    points = {}
+    for i in range(2000):
+        latitude = center[0] + rng.uniform(-0.5, 0.5)
+        longitude = center[1] + rng.uniform(-0.5, 0.5)
+        points[f"d{i}"] = (latitude, longitude)
+        index.upsert(f"d{i}", latitude, longitude)
+
+    expected = brute_force(points, *center, radius_km)
+    assert [key for _, key in index.nearby(*center, radius_km)] == [key for _, key in expected]
+    assert [key for _, key in index.nearby(*center, radius_km, limit=10)] == [key for _, key in expected[:10]]
+
+
+def test_upsert_moves_point_between_cells():
+    index = GeoGridIndex(cell_size_deg=0.01)
+    index.upsert("d1", 9.001, 38.001)
+    old_cell = index.cell_of(9.001, 38.001)
+    index.upsert("d1", 9.5, 38.5)
+    assert len(index) == 1
+    assert index.cell_count(old_cell) == 0
+    assert index.occupied_cells() == [index.cell_of(9.5, 38.5)]
+    assert index.nearby(9.001, 38.001, 1.0) == []
+
+
+def test_remove_and_clear():
+    index = GeoGridIndex()
+    index.upsert("d1", 9.0, 38.0)
+    index.upsert("d2", 9.0, 38.0)
+    assert index.remove("d1")
+    assert not index.remove("d1")
+    assert "d2" in index and "d1" not in index
+    index.clear()
+    assert len(index) == 0
+    assert index.occupied_cells() == []
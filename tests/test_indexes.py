@@ -0,0 +1,50 @@
+import pytest
+
+from indexes import INDEXES, apply_indexes, index_report
+
+
+@pytest.mark.anyio
+async def test_history_indexes_keep_their_generated_names(mongo):
+    # What the startup hook created before the registry existed
+    await mongo.rides.create_index([("riderId", 1), ("createdAt", -1), ("id", -1)])
+    await mongo.ratings.create_index([("ratedId", 1), ("createdAt", -1), ("id", -1)])
+
+    assert await apply_indexes(mongo) == []
+    rides = await mongo.rides.index_information()
+    assert "riderId_1_createdAt_-1_id_-1" in rides
+    assert len(rides) == len(INDEXES["rides"]) + 1  # and _id_
+
+
+@pytest.mark.anyio
+async def test_existing_keys_under_another_name_are_not_recreated(mongo):
+    await mongo.rides.create_index([("status", 1), ("createdAt", 1)], name="legacy_status")
+
+    assert await apply_indexes(mongo) == []
+    rides = await mongo.rides.index_information()
+    assert "legacy_status" in rides and "status_createdAt" not in rides
+
+
+@pytest.fixture
+def index_stats(mongo, monkeypatch):
+    """Stand-in for $indexStats, which mongomock lacks: every index used once but fare"""
+    async def aggregate(collection, pipeline, **kwargs):
+        for name in await collection.index_information():
+            yield {"name": name, "accesses": {"ops": 0 if name == "fare" else 1}}
+
+    monkeypatch.setattr(type(mongo.rides), "aggregate", aggregate)
+
+
+@pytest.mark.anyio
+async def test_report_matches_indexes_by_key_pattern(mongo, index_stats):
+    await mongo.rides.create_index([("status", 1), ("createdAt", 1)], name="legacy_status")
+    await mongo.rides.create_index([("fare", 1)], name="fare")
+
+    report = await index_report(mongo)
+    assert "status_createdAt" not in report["rides"]["missing"]
+    assert "id_unique" in report["rides"]["missing"]
+    assert report["rides"]["unregistered"] == ["fare"]
+    assert report["rides"]["unused"] == ["fare"]
+
+    await apply_indexes(mongo)
+    report = await index_report(mongo)
+    assert not any(entry["missing"] for entry in report.values())
@@ -0,0 +1,32 @@
+import pytest
+
+import manage
+
+
+@pytest.fixture
+def db(mongo, monkeypatch):
+    monkeypatch.setattr(manage, "db", mongo)
+    return mongo
+
+
+@pytest.mark.anyio
+async def test_backfill_ratings_counts_only_ratings_of_drivers(db):
+    await db.drivers.insert_many([
+        {"id": "d1", "ratingSum": 99, "ratingCount": 1, "rating": 1.0},
+        {"id": "d2", "ratingSum": 4, "ratingCount": 1, "rating": 4.0},
+    ])
+    await db.ratings.insert_many([
+        {"id": "a", "raterId": "u1", "ratedId": "d1", "rating": 5},
+        {"id": "b", "raterId": "u2", "ratedId": "d1", "rating": 4},
+        {"id": "c", "raterId": "d1", "ratedId": "u1", "rating": 1},
+    ])
+
+    assert await manage._backfill_ratings(batch_size=1) == 1
+
+    d1 = await db.drivers.find_one({"id": "d1"}, {"_id": False})
+    assert (d1["ratingSum"], d1["ratingCount"], d1["rating"]) == (9, 2, 4.5)
+    # Rated before, no ratings left, back to the default
+    d2 = await db.drivers.find_one({"id": "d2"}, {"_id": False})
+    assert (d2["ratingSum"], d2["ratingCount"], d2["rating"]) == (0, 0, 5.0)
+    # Riders never get driver rating totals
+    assert await db.drivers.count_documents({"id": "u1"}) == 0
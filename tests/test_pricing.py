@@ -0,0 +1,37 @@
+import numpy as np
+import pytest
+
+import pricing
+from geo_index import haversine_km
+
+
+def random_trips(count, seed=7):
+    rng = np.random.default_rng(seed)
+    pickup_lat = rng.uniform(8.8, 9.2, count)
+    pickup_lon = rng.uniform(38.6, 38.9, count)
+    destination_lat = pickup_lat + rng.normal(0, 0.05, count)
+    destination_lon = pickup_lon + rng.normal(0, 0.05, count)
+    trips = np.stack([pickup_lat, pickup_lon, destination_lat, destination_lon], axis=1)
+    # Zero-length, long and antipodal trips, the last ones exercise the clamp
+    extremes = np.array([[9.0, 38.7, 9.0, 38.7], [0.0, 0.0, 0.0, 180.0], [89.9, 0.0, -89.9, 180.0], [9.0, 38.7, 51.5, -0.1]])
+    return np.vstack([trips, extremes])
+
+
+def test_vectorized_haversine_matches_the_scalar_one():
+    trips = random_trips(5000)
+    vectorized = pricing.haversine_km(*trips.T)
+    scalar = np.array([haversine_km(*trip) for trip in trips])
+    np.testing.assert_allclose(vectorized, scalar, rtol=1e-12, atol=1e-9)
+
+
+def test_batch_quote_prices_like_a_single_ride():
+    trips = random_trips(5000, seed=11)
+    quoted = pricing.quote(*trips.T)
+    single = [float(pricing.fare_for_distance(haversine_km(*trip))) for trip in trips]
+    assert quoted["fare"].tolist() == single
+
+
+def test_scalar_inputs_give_scalar_results():
+    distance = pricing.haversine_km(9.0, 38.0, 10.0, 38.0)
+    assert np.ndim(distance) == 0
+    assert float(distance) == pytest.approx(haversine_km(9.0, 38.0, 10.0, 38.0))
@@ -0,0 +1,152 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+import ride_events
+from indexes import apply_indexes
+from ride_events import (
+    RIDE_TRANSITIONS,
+    InvalidTransition,
+    check_transition,
+    earnings_bucket,
+    previous_statuses,
+    rebuild_projections,
+    record_transition,
+)
+
+CREATED = datetime(2026, 3, 2, 8, 0)
+RIDE = {"id": "ride-1", "riderId": "rider-1", "driverId": "driver-1", "fare": 120.0, "distance": 6.5, "createdAt": CREATED}
+LIFECYCLE = ["requested", "accepted", "driverArriving", "inProgress", "completed"]
+
+
+def test_every_target_status_is_a_known_status():
+    for targets in RIDE_TRANSITIONS.values():
+        assert targets <= set(RIDE_TRANSITIONS)
+
+
+def test_previous_statuses():
+    assert previous_statuses("accepted") == ["requested"]
+    assert previous_statuses("completed") == ["inProgress"]
+    assert set(previous_statuses("cancelled")) == {"requested", "accepted", "driverArriving", "inProgress"}
+    assert previous_statuses("requested") == []
+
+
+def test_previous_statuses_rejects_unknown_status():
+    with pytest.raises(InvalidTransition, match="Unknown ride status flying"):
+        previous_statuses("flying")
+
+
+@pytest.mark.parametrize("from_status, to_status", [
+    (None, "requested"),
+    ("requested", "accepted"),
+    ("inProgress", "completed"),
+    ("driverArriving", "cancelled"),
+])
+def test_allowed_transitions(from_status, to_status):
+    check_transition(from_status, to_status)
+
+
+@pytest.mark.parametrize("from_status, to_status", [
+    (None, "accepted"),
+    ("requested", "completed"),
+    ("completed", "cancelled"),
+    ("cancelled", "requested"),
+    ("accepted", "accepted"),
+])
+def test_rejected_transitions(from_status, to_status):
+    with pytest.raises(InvalidTransition, match="Cannot change ride"):
+        check_transition(from_status, to_status)
+
+
+def test_earnings_buckets():
+    assert earnings_bucket("day", CREATED) == "2026-03-02"
+    assert earnings_bucket("week", CREATED) == "2026-W10"
+    assert earnings_bucket("all", CREATED) == "all"
+
+
+async def walk_lifecycle(db):
+    previous = None
+    for minutes, status in enumerate(LIFECYCLE):
+        await record_transition(db, RIDE, previous, status, at=CREATED + timedelta(minutes=minutes))
+        previous = status
+
+
+@pytest.mark.anyio
+async def test_completion_is_projected_once(mongo):
+    await apply_indexes(mongo)
+    await mongo.drivers.insert_one({"id": "driver-1", "earnings": 0.0, "totalRides": 0})
+    await walk_lifecycle(mongo)
+
+    # A retried write of the same transition is reported as a duplicate and not projected again
+    retried = await record_transition(mongo, RIDE, "inProgress", "completed", at=CREATED + timedelta(minutes=9))
+    assert retried is None
+
+    driver = await mongo.drivers.find_one({"id": "driver-1"})
+    assert (driver["earnings"], driver["totalRides"]) == (120.0, 1)
+    daily = await mongo.ride_stats_daily.find_one({"date": "2026-03-02"})
+    assert daily["completed"] == 1
+    assert daily["revenue"] == 120.0
+    assert daily["timeToAcceptTotal"] == 60.0
+    week = await mongo.driver_earnings.find_one({"driverId": "driver-1", "period": "week"})
+    assert (week["bucket"], week["earnings"], week["rides"]) == ("2026-W10", 120.0, 1)
+    assert await mongo.ride_events.count_documents({"rideId": "ride-1"}) == len(LIFECYCLE)
+
+
+@pytest.mark.anyio
+async def test_invalid_transition_is_not_recorded(mongo):
+    with pytest.raises(InvalidTransition):
+        await record_transition(mongo, RIDE, "requested", "completed")
+    assert await mongo.ride_events.count_documents({}) == 0
+
+
+@pytest.mark.anyio
+async def test_rebuild_reproduces_projections(mongo):
+    await apply_indexes(mongo)
+    await mongo.drivers.insert_one({"id": "driver-1", "earnings": 0.0, "totalRides": 0})
+    await walk_lifecycle(mongo)
+    await mongo.drivers.update_one({"id": "driver-1"}, {"$set": {"earnings": 999.0}})
+
+    assert await rebuild_projections(mongo) == len(LIFECYCLE)
+    driver = await mongo.drivers.find_one({"id": "driver-1"})
+    assert (driver["earnings"], driver["totalRides"]) == (120.0, 1)
+    assert await mongo.driver_earnings.count_documents({"driverId": "driver-1"}) == 3
+
+
+@pytest.mark.anyio
+async def test_failed_projection_is_applied_by_the_retry(mongo, monkeypatch):
+    await apply_indexes(mongo)
+    await mongo.drivers.insert_one({"id": "driver-1", "earnings": 0.0, "totalRides": 0})
+    statuses = [None] + LIFECYCLE
+    for previous, status in zip(statuses, LIFECYCLE[:-1]):
+        await record_transition(mongo, RIDE, previous, status, at=CREATED)
+
+    project = ride_events.apply_projections
+
+    async def fail_once(db, event):
+        monkeypatch.setattr(ride_events, "apply_projections", project)
+        raise ConnectionError("primary stepped down")
+
+    monkeypatch.setattr(ride_events, "apply_projections", fail_once)
+    with pytest.raises(ConnectionError):
+        await record_transition(mongo, RIDE, "inProgress", "completed", at=CREATED)
+    assert (await mongo.ride_events.find_one({"status": "completed"}))["projected"] is False
+
+    retried = await record_transition(mongo, RIDE, "inProgress", "completed", at=CREATED)
+    assert retried["projected"] is True
+    assert await record_transition(mongo, RIDE, "inProgress", "completed", at=CREATED) is None
+
+    driver = await mongo.drivers.find_one({"id": "driver-1"})
+    assert (driver["earnings"], driver["totalRides"]) == (120.0, 1)
+    assert (await mongo.ride_stats_daily.find_one({"date": "2026-03-02"}))["completed"] == 1
+    assert await mongo.ride_events.count_documents({"projected": False}) == 0
+
+
+@pytest.mark.anyio
+async def test_retry_leaves_an_event_being_projected_alone(mongo):
+    await apply_indexes(mongo)
+    await record_transition(mongo, RIDE, None, "requested", at=CREATED)
+    # Another attempt inserted it a moment ago and is still projecting
+    await mongo.ride_events.update_one({"status": "requested"}, {"$set": {"projected": False, "projectingSince": datetime.utcnow()}})
+
+    assert await record_transition(mongo, RIDE, None, "requested", at=CREATED) is None
+    assert (await mongo.ride_stats_daily.find_one({"date": "2026-03-02"}))["requested"] == 1
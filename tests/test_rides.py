@@ -0,0 +1,65 @@
+import json
+
+import pytest
+
+import server
+
+PICKUP = {"latitude": 9.0192, "longitude": 38.7525}
+DESTINATION = {"latitude": 9.05, "longitude": 38.78}
+
+
+@pytest.fixture
+def published(monkeypatch):
+    messages = []
+    monkeypatch.setattr(server.events, "forward", lambda topic, message: messages.append((topic, message)))
+    return messages
+
+
+def create_ride(api, rider_id="rider-1") -> str:
+    response = api.post("/api/rides", params={"rider_id": rider_id}, json={"pickup": PICKUP, "destination": DESTINATION})
+    assert response.status_code == 200, response.text
+    return response.json()["id"]
+
+
+def test_cancelling_a_requested_ride_notifies_its_area(api, published):
+    ride_id = create_ride(api)
+    published.clear()
+    assert api.put(f"/api/rides/{ride_id}", json={"status": "cancelled"}).status_code == 200
+    area = server.area_topic(PICKUP["latitude"], PICKUP["longitude"])
+    assert (area, {"type": "ride.cancelled", "rideId": ride_id}) in published
+
+
+def test_accepting_a_ride_notifies_its_area(api, published):
+    ride_id = create_ride(api)
+    published.clear()
+    assert api.put("/api/drivers/driver-1/accept-ride", params={"ride_id": ride_id}).status_code == 200
+    area = server.area_topic(PICKUP["latitude"], PICKUP["longitude"])
+    assert (area, {"type": "ride.taken", "rideId": ride_id}) in published
+
+
+def test_later_transitions_stay_on_the_ride_topic(api, published):
+    ride_id = create_ride(api)
+    api.put("/api/drivers/driver-1/accept-ride", params={"ride_id": ride_id})
+    published.clear()
+    assert api.put(f"/api/rides/{ride_id}", json={"status": "cancelled"}).status_code == 200
+    assert [topic for topic, _ in published] == [f"ride:{ride_id}"]
+
+
+@pytest.mark.parametrize("pickup", [
+    {"latitude": float("nan"), "longitude": 38.75},
+    {"latitude": 9.02, "longitude": float("inf")},
+    {"latitude": 91.0, "longitude": 38.75},
+    {"latitude": 9.02, "longitude": -180.5},
+])
+def test_ride_with_invalid_coordinates_is_rejected(api, pickup):
+    # json.dumps writes NaN and Infinity literals, which httpx refuses to send
+    body = json.dumps({"pickup": pickup, "destination": DESTINATION})
+    response = api.post("/api/rides", params={"rider_id": "rider-1"}, content=body, headers={"Content-Type": "application/json"})
+    assert response.status_code == 422
+    assert api.portal.call(server.db.rides.count_documents, {}) == 0
+    assert server.open_ride_index.cell_count(server.open_ride_index.cell_of(**PICKUP)) == 0
+
+
+def test_nearby_queries_reject_invalid_coordinates(api):
+    assert api.get("/api/drivers/nearby", params={"latitude": "nan", "longitude": 38.75}).status_code == 422
+    assert api.get("/api/rides/available", params={"latitude": 9.02, "longitude": "inf"}).status_code == 422
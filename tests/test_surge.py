@@ -0,0 +1,60 @@
+import pytest
+
+from geo_index import GeoGridIndex
+from surge import SurgePricer
+
+
+def make_pricer(**kwargs) -> SurgePricer:
+    return SurgePricer(GeoGridIndex(), GeoGridIndex(), **kwargs)
+
+
+@pytest.mark.parametrize("demand, supply, expected", [
+    (10, 10, 1.0),
+    (5, 10, 1.0),
+    (14, 10, 1.2),
+    (7, 5, 1.2),
+    (12, 10, 1.1),
+    (16, 10, 1.3),
+    (3, 0, 2.0),
+])
+def test_exact_multiples_are_not_rounded_down(demand, supply, expected):
+    assert make_pricer(sensitivity=0.5, step=0.1).multiplier_for(demand, supply) == expected
+
+
+def test_multiplier_is_floored_to_the_step():
+    # 1 + 0.5 * (13 / 10 - 1) = 1.15
+    assert make_pricer(step=0.1).multiplier_for(13, 10) == 1.1
+    assert make_pricer(step=0.25).multiplier_for(16, 10) == 1.25
+
+
+def test_multiplier_is_capped():
+    assert make_pricer(max_multiplier=3.0).multiplier_for(1000, 1) == 3.0
+
+
+def test_refresh_surges_only_cells_with_more_demand_than_supply():
+    pricer = make_pricer(neighborhood=0)
+    for i in range(4):
+        pricer.ride_index.upsert(f"r{i}", 9.0015, 38.0015)
+    pricer.driver_index.upsert("d1", 9.0015, 38.0015)
+    pricer.ride_index.upsert("lonely", 9.5015, 38.5015)
+    pricer.driver_index.upsert("d2", 9.5015, 38.5015)
+
+    assert pricer.refresh() == 1
+    assert pricer.multiplier(9.0015, 38.0015) == 2.5
+    assert pricer.multiplier(9.5015, 38.5015) == 1.0
+
+
+def test_empty_cell_next_to_a_surging_cell_is_priced_by_its_area():
+    pricer = make_pricer(neighborhood=1)
+    size = pricer.cell_size_deg
+    busy = (9.0 + size / 2, 38.0 + size / 2)
+    next_door = (busy[0], busy[1] + size)
+    for i in range(4):
+        pricer.ride_index.upsert(f"r{i}", *busy)
+    pricer.driver_index.upsert("d1", *busy)
+
+    pricer.refresh()
+    assert pricer.ride_index.cell_count(pricer.ride_index.cell_of(*next_door)) == 0
+    assert pricer.multiplier(*next_door) == pricer.multiplier(*busy) == 2.5
+    # Two cells away is outside the ring
+    assert pricer.multiplier(busy[0], busy[1] + 2 * size) == 1.0
@@ -0,0 +1,72 @@
+import pytest
+
+import verification_store
+from verification_store import MemoryVerificationStore, MongoVerificationStore, RateLimitExceeded
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+def clock(clock, monkeypatch):
+    # The stores read time.monotonic directly
+    clock.now = 1000.0
+    monkeypatch.setattr(verification_store.time, "monotonic", clock)
+    return clock
+
+
+async def test_memory_code_is_single_use(clock):
+    store = MemoryVerificationStore()
+    await store.issue("+251911", "123456")
+    assert not await store.consume("+251911", "000000")
+    assert await store.consume("+251911", "123456")
+    assert not await store.consume("+251911", "123456")
+
+
+async def test_memory_code_expires(clock):
+    store = MemoryVerificationStore(ttl_seconds=300)
+    await store.issue("+251911", "123456")
+    clock.now += 300
+    assert not await store.consume("+251911", "123456")
+    assert len(store) == 0
+
+
+async def test_memory_new_code_replaces_the_old_one(clock):
+    store = MemoryVerificationStore()
+    await store.issue("+251911", "111111")
+    await store.issue("+251911", "222222")
+    assert not await store.consume("+251911", "111111")
+    assert await store.consume("+251911", "222222")
+
+
+async def test_memory_rate_limit_resets_with_the_window(clock):
+    store = MemoryVerificationStore(max_sends=2, window_seconds=600)
+    await store.issue("+251911", "1")
+    await store.issue("+251911", "2")
+    with pytest.raises(RateLimitExceeded):
+        await store.issue("+251911", "3")
+    # Other phones have their own window
+    await store.issue("+251922", "1")
+    clock.now += 600
+    await store.issue("+251911", "4")
+
+
+async def test_mongo_code_is_single_use(mongo):
+    store = MongoVerificationStore(mongo)
+    await store.issue("+251911", "123456")
+    assert not await store.consume("+251911", "000000")
+    assert await store.consume("+251911", "123456")
+    assert not await store.consume("+251911", "123456")
+
+
+async def test_mongo_expired_code_is_rejected_before_the_ttl_monitor_runs(mongo):
+    store = MongoVerificationStore(mongo, ttl_seconds=0)
+    await store.issue("+251911", "123456")
+    assert not await store.consume("+251911", "123456")
+
+
+async def test_mongo_rate_limit(mongo):
+    store = MongoVerificationStore(mongo, max_sends=2)
+    await store.issue("+251911", "1")
+    await store.issue("+251911", "2")
+    with pytest.raises(RateLimitExceeded):
+        await store.issue("+251911", "3")